@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from CompactGraph import CompactGraph
+from Convergence import ConvergenceMonitor
+from RouteTables import write_route_matrix
+from SyntheticGraphs import GENERATORS, write_csv
+
+# benchmarks of the training and serving hot paths
+#
+#   python Benchmark.py                       every suite, default sizes
+#   python Benchmark.py load api --sizes 100 1000 --output after.json
+#   python Benchmark.py --compare before.json --output after.json
+#
+# every measure is a result dict (suite, name, graph, nodes, edges, value,
+# unit, better), --output writes them as json and --compare reports the
+# results that got worse than the baseline by more than --threshold
+
+SUITES = ("load", "training", "full_run", "api")
+# graph sizes of every suite, the api suite keeps V x V route matrices and
+# training on larger maps takes too long to reach the goal
+SIZES = {
+    "load": (100, 1000, 10000, 100000),
+    "training": (100, 1000, 10000),
+    "api": (100, 1000)
+}
+TRAINING_STEPS = 20000
+API_REQUESTS = 200
+INTERESTS = "Tech,Food"
+
+
+def result(suite: str, name: str, graph: str, csr: CompactGraph,
+           value: float, unit: str, better: str = "lower") -> dict:
+    return {
+        "suite": suite,
+        "name": name,
+        "graph": graph,
+        "nodes": csr.vertex_count if csr is not None else 0,
+        "edges": csr.edge_count // 2 if csr is not None else 0,
+        "value": value,
+        "unit": unit,
+        "better": better
+    }
+
+
+# best wall time of `repeat` calls, in milliseconds
+def best_time(function, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def percentiles(samples: list) -> dict:
+    samples = np.array(samples) * 1000
+    return {
+        "p50": float(np.percentile(samples, 50)),
+        "p90": float(np.percentile(samples, 90)),
+        "p99": float(np.percentile(samples, 99)),
+        "mean": float(samples.mean())
+    }
+
+
+# time Graph.read_csv (the training graph) and CompactGraph.read_csv
+def bench_load(graph_name: str, csr: CompactGraph, directory: str) -> list:
+    from ReinforcmentLearning import Graph
+
+    vertices = os.path.join(directory, "vertices.csv")
+    edges = os.path.join(directory, "arestas.csv")
+    repeat = 3 if csr.vertex_count <= 10000 else 1
+    return [
+        result("load", "Graph.read_csv", graph_name, csr,
+               best_time(lambda: Graph().read_csv(vertices, edges), repeat),
+               "ms"),
+        result("load", "CompactGraph.read_csv", graph_name, csr,
+               best_time(lambda: CompactGraph.read_csv(vertices, edges),
+                         repeat), "ms")
+    ]
+
+
+# training steps per second of every agent, each trains one goal until it
+# did `steps` steps and its walk reached the goal
+def bench_training(graph_name: str,
+                   csr: CompactGraph,
+                   directory: str,
+                   steps: int = TRAINING_STEPS,
+                   seed: int = 0) -> list:
+    from ReinforcmentLearning import (Graph, QLearningAgent, SarsaAgent,
+                                      VectorizedQLearningAgent)
+
+    g = Graph()
+    g.read_csv(os.path.join(directory, "vertices.csv"),
+               os.path.join(directory, "arestas.csv"))
+    goal_id = int(csr.ids[np.random.default_rng(seed).integers(
+        1, csr.vertex_count)])
+
+    results = []
+    for algorithm in (QLearningAgent, SarsaAgent, VectorizedQLearningAgent):
+        g.reset_training()
+        g.set_start(g.get_vertex_by_id(int(csr.ids[0])))
+        g.set_goal(g.get_vertex_by_id(goal_id))
+        g.define_reward(10.0, g.goal)
+
+        # tolerance 0 never converges, training stops at max_epochs
+        if algorithm is VectorizedQLearningAgent:
+            agent = algorithm(g, seed=seed)
+            agent.monitor = ConvergenceMonitor(
+                sweep_steps=agent.check_every * agent.walkers,
+                tolerance=0.0,
+                window=1,
+                max_epochs=steps * 10,
+                check_policy=False)
+        else:
+            agent = algorithm(
+                g,
+                monitor=ConvergenceMonitor(tolerance=0.0, max_epochs=steps),
+                seed=seed)
+
+        started = time.perf_counter()
+        agent.train()
+        elapsed = time.perf_counter() - started
+        results.append(
+            result("training", algorithm.__name__, graph_name, csr,
+                   agent.monitor.epochs / elapsed, "steps/s", "higher"))
+    return results
+
+
+# wall time of full_run on the map of the repository, run in a temporary
+# directory so table_q/ is not touched
+def bench_full_run(algorithms: list, workers: int = 1) -> list:
+    import ReinforcmentLearning
+
+    csr = CompactGraph.read_csv()
+    results = []
+    here = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("vertices.csv", "arestas.csv"):
+            shutil.copy(name, directory)
+        os.mkdir(os.path.join(directory, "table_q"))
+        try:
+            os.chdir(directory)
+            for name in algorithms:
+                algorithm = getattr(ReinforcmentLearning, name)
+                started = time.perf_counter()
+                ReinforcmentLearning.full_run(algorithm,
+                                              workers=workers,
+                                              progress=None)
+                results.append(
+                    result("full_run", name, "map", csr,
+                           time.perf_counter() - started, "s"))
+        finally:
+            os.chdir(here)
+    return results
+
+
+# route tables for the api benchmark in <directory>/table_q: largura and
+# dijkstra are built with SearchTables, qlearning reuses the dijkstra next
+# hops since serving only follows the hops, whoever trained them
+def build_api_tables(csr: CompactGraph, directory: str,
+                     workers: int = 1) -> str:
+    from SearchTables import build_next_hops
+
+    table_directory = os.path.join(directory, "table_q")
+    for algorithm, names in (("largura", ("largura", )),
+                             ("dijkstra", ("dijkstra", "qlearning"))):
+        next_hop = build_next_hops(csr, algorithm, workers)
+        distance = np.array([
+            csr.cost_to_go(next_hop[goal], goal)
+            for goal in range(csr.vertex_count)
+        ]).reshape(next_hop.shape)
+        for name in names:
+            write_route_matrix(os.path.join(table_directory, f"{name}.bin"),
+                               csr.ids,
+                               next_hop,
+                               distance,
+                               checksum=csr.checksum())
+    return table_directory
+
+
+# latency percentiles of GET /path through the test client, for plain and
+# interest routes of a reinforcement learning and a search table and the
+# plain routes of the landmark index
+def bench_api(graph_name: str,
+              csr: CompactGraph,
+              directory: str,
+              requests: int = API_REQUESTS,
+              seed: int = 0,
+              workers: int = 1) -> list:
+    from fastapi.testclient import TestClient
+
+    from api import create_app
+
+    graph = CompactGraph.read_csv(os.path.join(directory, "vertices.csv"),
+                                  os.path.join(directory, "arestas.csv"))
+    table_directory = build_api_tables(graph, directory, workers)
+    app = create_app(os.path.join(directory, "vertices.csv"),
+                     os.path.join(directory, "arestas.csv"),
+                     os.path.join(directory, "graph.npz"), table_directory)
+
+    rng = np.random.default_rng(seed)
+    pairs = csr.ids[rng.integers(0, csr.vertex_count, (requests, 2))].tolist()
+    cases = (("get_path_rl", "QLearning", {}), ("get_path_search", "Largura",
+                                                {}),
+             ("get_path_index", "ALT", {}),
+             ("get_path_rl_interest", "QLearning", {
+                 "max_interests": 2,
+                 "interests": INTERESTS
+             }), ("get_path_search_interest", "Largura", {
+                 "max_interests": 2,
+                 "interests": INTERESTS
+             }))
+
+    results = []
+    with TestClient(app) as client:
+        for name, algorithm, params in cases:
+            samples = []
+            for origin, target in pairs:
+                started = time.perf_counter()
+                response = client.get(f"/path/{origin}/{target}/{algorithm}",
+                                      params=params)
+                samples.append(time.perf_counter() - started)
+                response.raise_for_status()
+            for statistic, value in percentiles(samples).items():
+                results.append(
+                    result("api", f"{name} {statistic}", graph_name, csr,
+                           value, "ms"))
+    return results
+
+
+def result_key(item: dict) -> tuple:
+    return item["suite"], item["name"], item["graph"], item["nodes"]
+
+
+# results worse than the baseline by more than threshold (0.1 = 10%)
+def compare(baseline: list, results: list, threshold: float = 0.1) -> list:
+    before = {result_key(item): item for item in baseline}
+    regressions = []
+    for item in results:
+        old = before.get(result_key(item))
+        if old is None or old["value"] == 0:
+            continue
+        change = item["value"] / old["value"] - 1
+        if item["better"] == "higher":
+            change = -change
+        if change > threshold:
+            regressions.append({**item, "baseline": old["value"],
+                                "change": change})
+    return regressions
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def print_result(item: dict) -> None:
+    print(f"{item['suite']:<9} {item['name']:<34} {item['graph']:<10} "
+          f"{item['nodes']:>7} {item['value']:>14.3f} {item['unit']}")
+
+
+def run(suites=SUITES,
+        graphs=tuple(GENERATORS),
+        sizes: list = None,
+        steps: int = TRAINING_STEPS,
+        requests: int = API_REQUESTS,
+        full_run_algorithms=("VectorizedQLearningAgent",
+                             "ValueIterationAgent"),
+        workers: int = 1,
+        seed: int = 0) -> list:
+    results = []
+
+    def add(items: list) -> None:
+        for item in items:
+            print_result(item)
+        results.extend(items)
+
+    if "full_run" in suites:
+        add(bench_full_run(full_run_algorithms, workers))
+
+    graph_suites = [suite for suite in suites if suite in SIZES]
+    for graph_name in graphs:
+        all_sizes = sorted(
+            set(sizes or [n for suite in graph_suites for n in SIZES[suite]]))
+        for n in all_sizes:
+            csr = GENERATORS[graph_name](n, seed)
+            with tempfile.TemporaryDirectory() as directory:
+                write_csv(csr, directory)
+                for suite in graph_suites:
+                    if sizes is None and n not in SIZES[suite]:
+                        continue
+                    if suite == "load":
+                        add(bench_load(graph_name, csr, directory))
+                    elif suite == "training":
+                        add(
+                            bench_training(graph_name, csr, directory, steps,
+                                           seed))
+                    elif suite == "api":
+                        add(
+                            bench_api(graph_name, csr, directory, requests,
+                                      seed, workers))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the training "
+                                     "and serving hot paths")
+    parser.add_argument("suites", nargs="*", default=SUITES, choices=SUITES)
+    parser.add_argument("--graphs",
+                        nargs="+",
+                        default=list(GENERATORS),
+                        choices=list(GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=int)
+    parser.add_argument("--steps", type=int, default=TRAINING_STEPS)
+    parser.add_argument("--requests", type=int, default=API_REQUESTS)
+    parser.add_argument("--full-run-algorithms",
+                        nargs="+",
+                        default=[
+                            "VectorizedQLearningAgent", "ValueIterationAgent"
+                        ])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as json")
+    parser.add_argument("--compare", help="json results of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = run(args.suites, args.graphs, args.sizes, args.steps,
+                  args.requests, args.full_run_algorithms, args.workers,
+                  args.seed)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as _file:
+            json.dump({
+                "environment": environment(),
+                "results": results
+            },
+                      _file,
+                      indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as _file:
+            baseline = json.load(_file)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        for item in regressions:
+            print(f"REGRESSION {item['suite']} {item['name']} "
+                  f"{item['graph']} {item['nodes']}: {item['baseline']:.3f} "
+                  f"-> {item['value']:.3f} {item['unit']} "
+                  f"({item['change']:+.0%})")
+        if regressions:
+            raise SystemExit(1)
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import shutil
+import time
+
+import numpy as np
+
+# training checkpoints of full_run / single_run
+#
+# every goal has its own <directory>/goal_<goal id>.npz (uncompressed numpy
+# arrays), written by the process that trains it. while the goal trains it
+# holds the full q values, the generator state of the agent, its counters
+# and the state of its ConvergenceMonitor, saved at the end of a sweep at
+# most every `interval` seconds. once the goal finished it only keeps the
+# q values (float32, like table_q/<name>.q.npy) and the next hops. every
+# file records the key of its run (graph checksum, agent, seed and
+# hyperparameters) and files of another run are ignored
+CHECKPOINT_INTERVAL = 60.0
+
+
+# fingerprint of a training run, the same key means the same result
+def run_key(checksum: int, algorithm: str, seed, **hyperparameters) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{checksum}:{algorithm}:{seed}".encode())
+    for name in sorted(hyperparameters):
+        digest.update(f":{name}={hyperparameters[name]!r}".encode())
+    return digest.hexdigest()
+
+
+class TrainingCheckpoints:
+
+    def __init__(self,
+                 directory: str,
+                 key: str,
+                 interval: float = CHECKPOINT_INTERVAL) -> None:
+        self.directory = directory
+        self.key = key
+        self.interval = interval
+
+    def path(self, goal_id: int) -> str:
+        return os.path.join(self.directory, f"goal_{goal_id}.npz")
+
+    def write(self, goal_id: int, arrays: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(goal_id)
+        temporary = path + ".tmp.npz"
+        np.savez(temporary, key=np.array(self.key), **arrays)
+        os.replace(temporary, path)
+
+    # state of an agent in the middle of a goal (see Agent.state)
+    def save(self, goal_id: int, state: dict) -> None:
+        self.write(goal_id, dict(state, finished=np.bool_(False)))
+
+    def save_finished(self, goal_id: int, q: np.ndarray,
+                      next_hops: np.ndarray) -> None:
+        self.write(
+            goal_id, {
+                "finished": np.bool_(True),
+                "q": np.asarray(q, dtype=np.float32),
+                "next_hops": np.asarray(next_hops, dtype=np.int32)
+            })
+
+    # arrays of the checkpoint of the goal, None when it has none for this
+    # run or the file can not be read
+    def load(self, goal_id: int) -> dict:
+        path = self.path(goal_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["key"]) != self.key:
+                    return None
+                return {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # callback for Agent.on_sweep that saves the agent every interval, a
+    # converged agent is about to finish and is not saved
+    def saver(self, goal_id: int):
+        last = time.monotonic()
+
+        def save(agent) -> None:
+            nonlocal last
+            if agent.monitor.converged:
+                return
+            if time.monotonic() - last >= self.interval:
+                self.save(goal_id, agent.state())
+                last = time.monotonic()
+
+        return save
+
+    # remove the checkpoints once the run is saved
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
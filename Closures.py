@@ -0,0 +1,93 @@
+import threading
+
+
+# the origin or target of a route is closed
+class ClosedVertexError(KeyError):
+    pass
+
+
+def edge_key(a: int, b: int) -> tuple:
+    a, b = int(a), int(b)
+    return (a, b) if a <= b else (b, a)
+
+
+# closed vertices and edges of a route, as vertex ids. edges are undirected
+# and kept as (smaller id, bigger id)
+class Closures:
+
+    def __init__(self, vertices=(), edges=()) -> None:
+        self.vertices = frozenset(int(v) for v in vertices)
+        self.edges = frozenset(edge_key(a, b) for a, b in edges)
+
+    def __bool__(self) -> bool:
+        return bool(self.vertices or self.edges)
+
+    def merge(self, other: "Closures") -> "Closures":
+        if not other:
+            return self
+        return Closures(self.vertices | other.vertices,
+                        self.edges | other.edges)
+
+    # True when the path goes through a closed vertex or edge
+    def blocks(self, path) -> bool:
+        if self.vertices and not self.vertices.isdisjoint(path):
+            return True
+        if self.edges:
+            return any(
+                edge_key(a, b) in self.edges for a, b in zip(path, path[1:]))
+        return False
+
+    # closures of the query string: "1,2" for vertices, "1-2,3-4" for edges
+    @classmethod
+    def parse(cls, vertices: str | None = None,
+              edges: str | None = None) -> "Closures":
+        vertex_ids = [int(v) for v in (vertices or "").split(",") if v.strip()]
+        edge_ids = []
+        for edge in (edges or "").split(","):
+            if not edge.strip():
+                continue
+            a, b = edge.split("-")
+            edge_ids.append((int(a), int(b)))
+        return cls(vertex_ids, edge_ids)
+
+    def to_dict(self) -> dict:
+        return {
+            "vertices": sorted(self.vertices),
+            "edges": [list(edge) for edge in sorted(self.edges)]
+        }
+
+
+# live closures shared by every request. cached results are keyed by the
+# closures they were computed under, version only counts the updates
+class ClosureRegistry:
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.current = Closures()
+        self.version = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.current)
+
+    def snapshot(self) -> Closures:
+        return self.current
+
+    def close(self, vertices=(), edges=()) -> Closures:
+        added = Closures(vertices, edges)
+        with self.lock:
+            self.current = self.current.merge(added)
+            self.version += 1
+            return self.current
+
+    def reopen(self, vertices=(), edges=()) -> Closures:
+        removed = Closures(vertices, edges)
+        with self.lock:
+            self.current = Closures(self.current.vertices - removed.vertices,
+                                    self.current.edges - removed.edges)
+            self.version += 1
+            return self.current
+
+    def clear(self) -> None:
+        with self.lock:
+            self.current = Closures()
+            self.version += 1
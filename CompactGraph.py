@@ -0,0 +1,261 @@
+import hashlib
+import os
+from collections import deque
+
+import numpy as np
+
+DEFAULT_Q = 0.0
+
+
+# compressed sparse row (CSR) storage of a directed graph
+#
+# vertex ids from the csv files are mapped to dense indexes 0..V-1, the
+# outgoing edges of vertex i live in the slots offsets[i]:offsets[i + 1] of
+# the neighbors/distances/q arrays
+class CompactGraph:
+
+    def __init__(self,
+                 ids: np.ndarray,
+                 offsets: np.ndarray,
+                 neighbors: np.ndarray,
+                 distances: np.ndarray,
+                 q: np.ndarray = None,
+                 names: list = None,
+                 categories: list = None,
+                 pos_x: np.ndarray = None,
+                 pos_y: np.ndarray = None) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.neighbors = np.asarray(neighbors, dtype=np.int32)
+        self.distances = np.asarray(distances, dtype=np.float64)
+        if q is None:
+            q = np.full(len(self.neighbors), DEFAULT_Q, dtype=np.float64)
+        self.q = np.asarray(q, dtype=np.float64)
+        self.names = names if names is not None else [""] * len(self.ids)
+        self.categories = categories if categories is not None else [
+            ""
+        ] * len(self.ids)
+        self.pos_x = pos_x
+        self.pos_y = pos_y
+        self.index_of = {int(v): i for i, v in enumerate(self.ids)}
+
+        if len(self.distances) > 0:
+            self.min_distance = float(self.distances.min())
+            self.max_distance = float(self.distances.max())
+        else:
+            self.min_distance = 9999999
+            self.max_distance = 0
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.neighbors)
+
+    # bytes of the arrays, the python objects per vertex are not counted
+    @property
+    def nbytes(self) -> int:
+        total = 0
+        for array in (self.ids, self.offsets, self.neighbors, self.distances,
+                      self.q, self.pos_x, self.pos_y):
+            if array is not None:
+                total += np.asarray(array).nbytes
+        return total
+
+    # dense index of a vertex id, raises like Graph.get_vertex_by_id
+    def index(self, vertex_id) -> int:
+        try:
+            return self.index_of[int(vertex_id)]
+        except (KeyError, ValueError):
+            raise Exception(f"Vertex with id {vertex_id} not found")
+
+    def degree(self, index: int) -> int:
+        return int(self.offsets[index + 1] - self.offsets[index])
+
+    def edge_range(self, index: int) -> tuple:
+        return int(self.offsets[index]), int(self.offsets[index + 1])
+
+    # source dense index of every edge slot
+    def edge_sources(self) -> np.ndarray:
+        return np.repeat(np.arange(self.vertex_count, dtype=np.int32),
+                         np.diff(self.offsets))
+
+    # V x max_degree matrix with the edge slots of every vertex, padded
+    # with -1, lets a batch of vertices gather their edges in one indexing
+    def padded_slots(self) -> np.ndarray:
+        degrees = np.diff(self.offsets)
+        width = max(int(degrees.max()) if len(degrees) > 0 else 0, 1)
+        column = np.arange(width)
+        slots = self.offsets[:-1, None] + column[None, :]
+        return np.where(column[None, :] < degrees[:, None], slots, -1)
+
+    # dense index of the vertex reached by the edge with the biggest q of
+    # every vertex, vertices without a positive q point to themselves
+    def greedy_next_hops(self, q: np.ndarray = None) -> np.ndarray:
+        q = self.q if q is None else q
+        slots = self.padded_slots()
+        values = np.where(slots >= 0, q[np.maximum(slots, 0)], -np.inf)
+        best = values.argmax(axis=1)
+        rows = np.arange(self.vertex_count)
+        best_slot = slots[rows, best]
+        return np.where(values[rows, best] > DEFAULT_Q,
+                        self.neighbors[np.maximum(best_slot, 0)], rows)
+
+    # distance of the edge i -> next_hop[i] of every vertex i, 0 when the
+    # vertex points to itself and inf when there is no such edge
+    def hop_distances(self, next_hop: np.ndarray) -> np.ndarray:
+        slots = self.padded_slots()
+        rows = np.arange(self.vertex_count)
+        match = (slots >= 0) & (self.neighbors[np.maximum(slots, 0)]
+                                == np.asarray(next_hop)[:, None])
+        found = match.any(axis=1)
+        slot = slots[rows, match.argmax(axis=1)]
+        hop = np.where(found, self.distances[np.maximum(slot, 0)], np.inf)
+        return np.where(next_hop == rows, 0.0, hop)
+
+    # hops and distance from every vertex to the goal following next_hop,
+    # -1 and inf for vertices whose hops never reach the goal: no row, a
+    # hop that is not an edge, a self loop or a cycle (pointer doubling)
+    def path_tree(self, next_hop: np.ndarray, goal: int) -> tuple:
+        jump = np.array(next_hop, dtype=np.int64)
+        jump[goal] = goal
+        invalid = jump < 0
+        jump[invalid] = np.flatnonzero(invalid)
+        cost = self.hop_distances(jump)
+        cost[invalid] = np.inf
+        cost[goal] = 0.0
+        depth = (jump != np.arange(len(jump))).astype(np.int64)
+        for _ in range(max(int(self.vertex_count).bit_length(), 1)):
+            cost = cost + cost[jump]
+            depth = depth + depth[jump]
+            jump = jump[jump]
+        reached = (jump == goal) & np.isfinite(cost)
+        return (np.where(reached, depth, -1).astype(np.int32),
+                np.where(reached, cost, np.inf))
+
+    # distance from every vertex to the goal following next_hop, inf for
+    # vertices whose hops never reach the goal
+    def cost_to_go(self, next_hop: np.ndarray, goal: int) -> np.ndarray:
+        return self.path_tree(next_hop, goal)[1]
+
+    # connected components as a label per vertex, the label is the first
+    # vertex of the component (breadth first search)
+    def components(self) -> np.ndarray:
+        label = np.full(self.vertex_count, -1, dtype=np.int64)
+        offsets, neighbors = self.offsets.tolist(), self.neighbors.tolist()
+        for root in range(self.vertex_count):
+            if label[root] != -1:
+                continue
+            label[root] = root
+            queue = deque([root])
+            while queue:
+                current = queue.popleft()
+                for slot in range(offsets[current], offsets[current + 1]):
+                    vertex = neighbors[slot]
+                    if label[vertex] == -1:
+                        label[vertex] = root
+                        queue.append(vertex)
+        return label
+
+    # fingerprint of the structure and distances, stored with route tables
+    # to detect tables built for another version of the graph
+    def checksum(self) -> int:
+        digest = hashlib.blake2b(digest_size=8)
+        for array in (self.ids, self.offsets, self.neighbors, self.distances):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return int.from_bytes(digest.digest(), "little")
+
+    # slot of the edge start -> end, or -1 if it does not exist
+    def find_edge(self, start: int, end: int) -> int:
+        lo, hi = self.edge_range(start)
+        hits = np.flatnonzero(self.neighbors[lo:hi] == end)
+        return lo + int(hits[0]) if len(hits) > 0 else -1
+
+    # write the arrays to a .npz snapshot, source is stored to tell whether
+    # the snapshot still matches the csv files it was built from
+    def save(self, path: str, source: str = "") -> None:
+        temporary = path + ".tmp.npz"
+        np.savez(temporary,
+                 ids=self.ids,
+                 offsets=self.offsets,
+                 neighbors=self.neighbors,
+                 distances=self.distances,
+                 q=self.q,
+                 names=np.array(self.names, dtype=str),
+                 categories=np.array(self.categories, dtype=str),
+                 pos_x=np.asarray(self.pos_x, dtype=np.float64),
+                 pos_y=np.asarray(self.pos_y, dtype=np.float64),
+                 source=np.array(source))
+        os.replace(temporary, path)
+
+    # read a snapshot written by save, returns None when it is missing or
+    # was built from other csv files
+    @classmethod
+    def load(cls, path: str, source: str = None) -> "CompactGraph":
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            if source is not None and str(data["source"]) != source:
+                return None
+            return cls(data["ids"],
+                       data["offsets"],
+                       data["neighbors"],
+                       data["distances"],
+                       data["q"],
+                       names=data["names"].tolist(),
+                       categories=data["categories"].tolist(),
+                       pos_x=data["pos_x"],
+                       pos_y=data["pos_y"])
+
+    # digest of the contents of the csv files, cheaper than parsing them
+    @staticmethod
+    def source_digest(*paths: str) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for path in paths:
+            with open(path, "rb") as _file:
+                for block in iter(lambda: _file.read(1 << 20), b""):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    # build the CSR arrays from parallel edge arrays of dense indexes,
+    # repeated (start, end) pairs keep only the first occurrence and the
+    # insertion order of the edges of each vertex is preserved
+    @classmethod
+    def from_edges(cls,
+                   ids,
+                   start,
+                   end,
+                   distance,
+                   q=None,
+                   **vertex_data) -> "CompactGraph":
+        n = len(ids)
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+        distance = np.asarray(distance, dtype=np.float64)
+        if q is None:
+            q = np.full(len(start), DEFAULT_Q, dtype=np.float64)
+        q = np.asarray(q, dtype=np.float64)
+
+        _, first = np.unique(start * max(n, 1) + end, return_index=True)
+        keep = np.sort(first)
+        start, end, distance, q = start[keep], end[keep], distance[keep], q[
+            keep]
+
+        order = np.argsort(start, kind="stable")
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(start, minlength=n), out=offsets[1:])
+
+        return cls(ids, offsets, end[order], distance[order], q[order],
+                   **vertex_data)
+
+    # read vertices.csv / arestas.csv, every line of arestas.csv is an
+    # undirected edge stored in both directions (see GraphIngest)
+    @classmethod
+    def read_csv(cls,
+                 vertices_path: str = "vertices.csv",
+                 edges_path: str = "arestas.csv",
+                 chunk_size: int = None) -> "CompactGraph":
+        from GraphIngest import CHUNK_SIZE, read_graph
+        return read_graph(vertices_path, edges_path, chunk_size or CHUNK_SIZE)
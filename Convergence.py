@@ -0,0 +1,109 @@
+from collections import deque
+
+import numpy as np
+
+# reasons reported by ConvergenceMonitor.reason
+TOLERANCE = "tolerance"
+POLICY_STABLE = "policy_stable"
+MAX_EPOCHS = "max_epochs"
+
+
+# decides when training stops using constant memory
+#
+# the agent reports every |delta q| with record() and calls end_sweep()
+# every sweep_steps steps. training stops when the largest |delta q| of
+# each of the last `window` sweeps is below the tolerance, when the greedy
+# policy stayed the same (and sends every vertex somewhere) for `window`
+# sweeps, or after max_epochs steps. policy_tolerance is the fraction of
+# vertices whose greedy action may still change in a stable sweep
+class ConvergenceMonitor:
+
+    def __init__(self,
+                 sweep_steps: int = 5000,
+                 tolerance: float = 1e-6,
+                 window: int = 5,
+                 max_epochs: int = None,
+                 check_policy: bool = True,
+                 policy_tolerance: float = 0.0) -> None:
+        self.sweep_steps = sweep_steps
+        self.tolerance = tolerance
+        self.window = window
+        self.max_epochs = max_epochs
+        self.check_policy = check_policy
+        self.policy_tolerance = policy_tolerance
+        self.sweep_deltas = deque(maxlen=window)
+        self.sweep_delta = 0.0
+        self.policy = None
+        self.stable_sweeps = 0
+        self.epochs = 0
+        self.sweeps = 0
+        self.reason = None
+
+    @property
+    def converged(self) -> bool:
+        return self.reason is not None
+
+    def record(self, delta_q: float) -> None:
+        delta_q = abs(delta_q)
+        if delta_q > self.sweep_delta:
+            self.sweep_delta = delta_q
+
+    # count one step, returns True when a sweep ended
+    def step(self, steps: int = 1) -> bool:
+        self.epochs += steps
+        if self.max_epochs is not None and self.epochs >= self.max_epochs:
+            self.reason = MAX_EPOCHS
+        return self.epochs % self.sweep_steps < steps
+
+    # close the current sweep, policy is the greedy next vertex of every
+    # vertex (-1 or the vertex itself where it has no positive q action)
+    def end_sweep(self, policy: np.ndarray = None, goal: int = None) -> bool:
+        self.sweeps += 1
+        self.sweep_deltas.append(self.sweep_delta)
+        self.sweep_delta = 0.0
+
+        if len(self.sweep_deltas) == self.window and \
+                max(self.sweep_deltas) < self.tolerance:
+            self.reason = TOLERANCE
+
+        if self.check_policy and policy is not None:
+            policy = np.asarray(policy)
+            if self.policy is not None and len(policy) == len(self.policy) \
+                    and np.mean(policy != self.policy) <= self.policy_tolerance:
+                self.stable_sweeps += 1
+            else:
+                self.stable_sweeps = 0
+            self.policy = policy.copy()
+
+            stuck = policy == np.arange(len(policy))
+            if goal is not None:
+                stuck[goal] = False
+            if self.stable_sweeps >= self.window and not stuck.any():
+                self.reason = self.reason or POLICY_STABLE
+
+        return self.converged
+
+    # counters and sweep history as arrays, for a training checkpoint
+    def state(self) -> dict:
+        return {
+            "epochs": np.int64(self.epochs),
+            "sweeps": np.int64(self.sweeps),
+            "sweep_deltas": np.array(self.sweep_deltas, dtype=np.float64),
+            "sweep_delta": np.float64(self.sweep_delta),
+            "policy": np.asarray(self.policy if self.policy is not None
+                                 else [], dtype=np.int64),
+            "has_policy": np.bool_(self.policy is not None),
+            "stable_sweeps": np.int64(self.stable_sweeps),
+            "reason": np.array(self.reason or "")
+        }
+
+    def restore(self, state: dict) -> None:
+        self.epochs = int(state["epochs"])
+        self.sweeps = int(state["sweeps"])
+        self.sweep_deltas = deque(np.asarray(state["sweep_deltas"]).tolist(),
+                                  maxlen=self.window)
+        self.sweep_delta = float(state["sweep_delta"])
+        self.policy = np.array(state["policy"]) if bool(
+            state["has_policy"]) else None
+        self.stable_sweeps = int(state["stable_sweeps"])
+        self.reason = str(state["reason"]) or None
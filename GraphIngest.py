@@ -0,0 +1,243 @@
+import argparse
+import csv
+import itertools
+import time
+
+import numpy as np
+
+from CompactGraph import CompactGraph
+
+# streaming reader of vertices.csv / arestas.csv for large maps
+#
+# the files are read with the csv module (names may be quoted and contain
+# commas) in chunks of CHUNK_SIZE rows, every chunk is converted to typed
+# arrays at once so no python object is kept per edge. vertex ids must be
+# unique integers and every edge must join two known vertices with a finite,
+# non negative distance, otherwise ValueError names the file and line.
+# an undirected edge is kept once however many times it appears (in either
+# direction) and stored in both directions like Graph.add_edge
+CHUNK_SIZE = 65536
+
+
+# chunks of rows of the file, skipping blank lines, with the line number
+# of every row
+def read_chunks(path: str, chunk_size: int = CHUNK_SIZE):
+    with open(path, "r", encoding="utf-8-sig", newline="") as _file:
+        reader = csv.reader(_file, skipinitialspace=True)
+        lines, rows = [], []
+        for row in reader:
+            if not row or (len(row) == 1 and not row[0].strip()):
+                continue
+            lines.append(reader.line_num)
+            rows.append(row)
+            if len(rows) == chunk_size:
+                yield lines, rows
+                lines, rows = [], []
+        if rows:
+            yield lines, rows
+
+
+# column of a chunk as a typed array, a bad or missing value raises
+# ValueError with its line
+def column(rows: list, index: int, dtype, path: str, lines: list,
+           default=None) -> np.ndarray:
+    try:
+        values = [row[index] for row in rows]
+    except IndexError:
+        values = [row[index] if len(row) > index else default for row in rows]
+    try:
+        if None in values:
+            raise ValueError
+        return np.array(values, dtype=dtype)
+    except ValueError:
+        for line, value in zip(lines, values):
+            if value is None:
+                raise ValueError(f"{path}:{line}: missing value in column "
+                                 f"{index + 1}") from None
+            try:
+                np.array([value], dtype=dtype)
+            except (ValueError, TypeError):
+                raise ValueError(
+                    f"{path}:{line}: invalid value {value!r} in column "
+                    f"{index + 1}") from None
+        raise
+
+
+def read_vertices(path: str = "vertices.csv",
+                  chunk_size: int = CHUNK_SIZE) -> dict:
+    ids, pos_x, pos_y, names, categories = [], [], [], [], []
+    for lines, rows in read_chunks(path, chunk_size):
+        ids.append(column(rows, 0, np.int64, path, lines))
+        names += [row[1].strip() if len(row) > 1 else "" for row in rows]
+        categories += [row[2].strip() if len(row) > 2 else ""
+                       for row in rows]
+        pos_x.append(column(rows, 3, np.float64, path, lines, "0"))
+        pos_y.append(column(rows, 4, np.float64, path, lines, "0"))
+
+    ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+    unique, counts = np.unique(ids, return_counts=True)
+    if len(unique) < len(ids):
+        repeated = int(unique[counts > 1][0])
+        raise ValueError(f"{path}: vertex id {repeated} is repeated")
+    return {
+        "ids": ids,
+        "names": names,
+        "categories": categories,
+        "pos_x": np.concatenate(pos_x) if pos_x else np.zeros(0),
+        "pos_y": np.concatenate(pos_y) if pos_y else np.zeros(0)
+    }
+
+
+# edge lines are numeric, so chunks are parsed by np.loadtxt in C and only
+# a chunk that fails a check is parsed again row by row to name the line
+EDGE_DTYPE = np.dtype([("start", np.int64), ("end", np.int64),
+                       ("distance", np.float64)])
+
+
+# chunks of raw lines of the file with the number of their first line
+def read_line_chunks(path: str, chunk_size: int = CHUNK_SIZE):
+    with open(path, "r", encoding="utf-8-sig", newline="") as _file:
+        line = 1
+        while True:
+            text = list(itertools.islice(_file, chunk_size))
+            if not text:
+                return
+            yield line, text
+            line += len(text)
+
+
+# start, end (dense indexes) and distance of every undirected edge, once
+def read_edges(path: str,
+               ids: np.ndarray,
+               chunk_size: int = CHUNK_SIZE) -> tuple:
+    n = len(ids)
+    sorter = np.argsort(ids, kind="stable")
+    sorted_ids = ids[sorter]
+
+    # dense indexes of the ids, -1 for unknown ids
+    def indexes(values: np.ndarray) -> np.ndarray:
+        if n == 0:
+            return np.full(len(values), -1, dtype=np.int64)
+        position = np.minimum(np.searchsorted(sorted_ids, values), n - 1)
+        return np.where(sorted_ids[position] == values, sorter[position], -1)
+
+    # the same chunk parsed with the csv module, raising on the first bad row
+    def check(line: int, text: list) -> None:
+        lines, rows = [], []
+        reader = csv.reader(text, skipinitialspace=True)
+        for row in reader:
+            if row and (len(row) > 1 or row[0].strip()):
+                lines.append(line + reader.line_num - 1)
+                rows.append(row)
+        for index in (0, 1):
+            values = column(rows, index, np.int64, path, lines)
+            unknown = np.flatnonzero(indexes(values) < 0)
+            if len(unknown) > 0:
+                raise ValueError(f"{path}:{lines[unknown[0]]}: unknown "
+                                 f"vertex id {int(values[unknown[0]])}")
+        distance = column(rows, 2, np.float64, path, lines)
+        invalid = np.flatnonzero(~np.isfinite(distance) | (distance < 0))
+        if len(invalid) > 0:
+            raise ValueError(f"{path}:{lines[invalid[0]]}: invalid distance "
+                             f"{distance[invalid[0]]}")
+
+    starts, ends, distances = [], [], []
+    for line, text in read_line_chunks(path, chunk_size):
+        # np.loadtxt warns about chunks of blank lines only
+        if not any(row.strip() for row in text):
+            continue
+        try:
+            edges = np.loadtxt(text,
+                               dtype=EDGE_DTYPE,
+                               delimiter=",",
+                               quotechar='"',
+                               usecols=(0, 1, 2),
+                               ndmin=1)
+        except ValueError:
+            check(line, text)
+            raise
+        start = indexes(edges["start"])
+        end = indexes(edges["end"])
+        distance = edges["distance"]
+        if (start < 0).any() or (end < 0).any() or \
+                not np.isfinite(distance).all() or (distance < 0).any():
+            check(line, text)
+        starts.append(start)
+        ends.append(end)
+        distances.append(distance)
+
+    if not starts:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros(0))
+    start = np.concatenate(starts)
+    end = np.concatenate(ends)
+    distance = np.concatenate(distances)
+
+    # the first line of every pair of vertices wins, whatever its direction
+    key = np.minimum(start, end) * max(n, 1) + np.maximum(start, end)
+    _, first = np.unique(key, return_index=True)
+    keep = np.sort(first)
+    return start[keep], end[keep], distance[keep]
+
+
+# CompactGraph of the csv files, edges of each vertex in file order
+def read_graph(vertices_path: str = "vertices.csv",
+               edges_path: str = "arestas.csv",
+               chunk_size: int = CHUNK_SIZE) -> CompactGraph:
+    vertices = read_vertices(vertices_path, chunk_size)
+    ids = vertices["ids"]
+    start, end, distance = read_edges(edges_path, ids, chunk_size)
+
+    # both directions of every edge, a self loop is stored once
+    count = len(start)
+    both_start = np.column_stack([start, end]).ravel()
+    both_end = np.column_stack([end, start]).ravel()
+    both_distance = np.repeat(distance, 2)
+    loop = np.zeros(2 * count, dtype=bool)
+    loop[1::2] = start == end
+    both_start = both_start[~loop]
+    both_end = both_end[~loop]
+    both_distance = both_distance[~loop]
+
+    n = len(ids)
+    order = np.argsort(both_start, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(both_start, minlength=n), out=offsets[1:])
+    return CompactGraph(ids,
+                        offsets,
+                        both_end[order],
+                        both_distance[order],
+                        names=vertices["names"],
+                        categories=vertices["categories"],
+                        pos_x=vertices["pos_x"],
+                        pos_y=vertices["pos_y"])
+
+
+# parse the csv files and write the snapshot Router.from_files loads
+# while the csv files do not change
+def compile_snapshot(vertices_path: str = "vertices.csv",
+                     edges_path: str = "arestas.csv",
+                     snapshot_path: str = "graph.npz",
+                     chunk_size: int = CHUNK_SIZE) -> CompactGraph:
+    graph = read_graph(vertices_path, edges_path, chunk_size)
+    graph.save(snapshot_path,
+               CompactGraph.source_digest(vertices_path, edges_path))
+    return graph
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile the csv files into a graph snapshot")
+    parser.add_argument("--vertices", default="vertices.csv")
+    parser.add_argument("--edges", default="arestas.csv")
+    parser.add_argument("--output", default="graph.npz")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    graph = compile_snapshot(args.vertices, args.edges, args.output,
+                             args.chunk_size)
+    print(f"{args.output}: {graph.vertex_count} vertices, "
+          f"{graph.edge_count} edges, distances "
+          f"{graph.min_distance}-{graph.max_distance}, "
+          f"{(time.perf_counter() - started) * 1000:.1f} ms")
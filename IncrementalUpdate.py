@@ -0,0 +1,332 @@
+import argparse
+import os
+
+import numpy as np
+
+from CompactGraph import DEFAULT_Q, CompactGraph
+from RouteTables import (RouteMatrix, save_table_graph, table_graph_path,
+                         write_route_matrix)
+from SearchTables import SEARCHES, build_next_hops, search_rows
+
+# update the route tables of table_q/ after vertices.csv / arestas.csv
+# changed, redoing only the goals whose route may change
+#
+# every route matrix stores the checksum of the graph it was built from and
+# that graph is kept as table_q/graph_<checksum>.npz. the update diffs it
+# with the csv files and, per algorithm, recomputes only the goals whose
+# route tree uses a removed (or, for distance based searches, longer) edge
+# or could get shorter through an added (or shorter) edge. the rl goals are
+# retrained starting from their saved q values. when the vertices changed
+# or the old graph is unknown the tables are rebuilt from scratch
+
+TABLE_DIRECTORY = "table_q"
+# what the route of every search algorithm minimizes: "distance", "hops"
+# or "order" (the depth first tree depends on the order of every edge).
+# the greedy policy of the rl tables minimizes hops, their q values do not
+# depend on the edge distances
+SEARCH_METRICS = {
+    "astar": "distance",
+    "dijkstra": "distance",
+    "largura": "hops",
+    "profundidade": "order"
+}
+# goals processed at once when scanning the V x V matrices
+CHUNK = 1024
+
+
+# edges added, removed and with a new distance between two versions of a
+# graph with the same vertices, as arrays of dense indexes (both
+# directions of an undirected edge are listed)
+class GraphDiff:
+
+    def __init__(self, old: CompactGraph, new: CompactGraph) -> None:
+        n = max(new.vertex_count, 1)
+        old_keys = old.edge_sources().astype(np.int64) * n + old.neighbors
+        new_keys = new.edge_sources().astype(np.int64) * n + new.neighbors
+
+        added = ~np.isin(new_keys, old_keys)
+        removed = ~np.isin(old_keys, new_keys)
+        self.added_start, self.added_end = np.divmod(new_keys[added], n)
+        self.added_distance = new.distances[added]
+        self.removed_start, self.removed_end = np.divmod(old_keys[removed], n)
+
+        # distances of the edges present in both graphs
+        old_order = np.argsort(old_keys, kind="stable")
+        kept = np.flatnonzero(~added)
+        old_slots = old_order[np.searchsorted(old_keys[old_order],
+                                              new_keys[kept])]
+        changed = old.distances[old_slots] != new.distances[kept]
+        self.changed_start, self.changed_end = np.divmod(
+            new_keys[kept[changed]], n)
+        self.changed_distance = new.distances[kept[changed]]
+        self.changed_old_distance = old.distances[old_slots[changed]]
+
+    @property
+    def empty(self) -> bool:
+        return len(self.added_start) + len(self.removed_start) + len(
+            self.changed_start) == 0
+
+
+# for every edge slot of new, the slot of the same edge in old or -1
+def slot_map(old: CompactGraph, new: CompactGraph) -> np.ndarray:
+    n = max(new.vertex_count, 1)
+    old_keys = old.edge_sources().astype(np.int64) * n + old.neighbors
+    new_keys = new.edge_sources().astype(np.int64) * n + new.neighbors
+    slots = np.full(len(new_keys), -1, dtype=np.int64)
+    if len(old_keys) == 0:
+        return slots
+    order = np.argsort(old_keys, kind="stable")
+    found = order[np.minimum(np.searchsorted(old_keys[order], new_keys),
+                             len(order) - 1)]
+    match = old_keys[found] == new_keys
+    slots[match] = found[match]
+    return slots
+
+
+# hops from every vertex to the goal of every row following next_hop, inf
+# where the goal is never reached (pointer doubling over all rows)
+def tree_hops(next_hop: np.ndarray, goals: np.ndarray) -> np.ndarray:
+    columns = np.arange(next_hop.shape[1])
+    jump = np.array(next_hop, dtype=np.int64)
+    rows = np.arange(len(goals))
+    jump[rows, goals] = goals
+    invalid = jump < 0
+    jump = np.where(invalid, columns[None, :], jump)
+    cost = np.where(jump == columns[None, :], 0.0, 1.0)
+    cost[invalid] = np.inf
+    for _ in range(max(int(next_hop.shape[1]).bit_length(), 1)):
+        cost = cost + np.take_along_axis(cost, jump, axis=1)
+        jump = np.take_along_axis(jump, jump, axis=1)
+    return np.where(jump == goals[:, None], cost, np.inf)
+
+
+# rows of next_hop whose tree goes through any of the edges start -> end
+def uses_edges(rows: np.ndarray, start: np.ndarray,
+               end: np.ndarray) -> np.ndarray:
+    if len(start) == 0:
+        return np.zeros(len(rows), dtype=bool)
+    return (rows[:, start] == end[None, :]).any(axis=1)
+
+
+# goals whose route may change with the diff, for a table whose routes
+# minimize metric ("distance", "hops" or "order")
+def affected_goals(diff: GraphDiff, next_hop: np.ndarray,
+                   distance: np.ndarray, metric: str,
+                   graph: CompactGraph) -> np.ndarray:
+    goal_count = next_hop.shape[0]
+    if metric == "order" and len(diff.added_start) > 0:
+        return np.ones(goal_count, dtype=bool)
+
+    used_start, used_end = diff.removed_start, diff.removed_end
+    if metric == "distance":
+        # the only edge of a vertex (a shop door) is in every route from it
+        # whatever its length, so only its distance rows change
+        longer = (diff.changed_distance > diff.changed_old_distance) & (
+            np.diff(graph.offsets)[diff.changed_start] > 1)
+        shorter = diff.changed_distance < diff.changed_old_distance
+        used_start = np.concatenate([used_start, diff.changed_start[longer]])
+        used_end = np.concatenate([used_end, diff.changed_end[longer]])
+        shortcut_start = np.concatenate(
+            [diff.added_start, diff.changed_start[shorter]])
+        shortcut_end = np.concatenate(
+            [diff.added_end, diff.changed_end[shorter]])
+        shortcut_length = np.concatenate(
+            [diff.added_distance, diff.changed_distance[shorter]])
+    elif metric == "hops":
+        shortcut_start, shortcut_end = diff.added_start, diff.added_end
+        shortcut_length = np.ones(len(shortcut_start))
+    else:
+        shortcut_start = shortcut_end = np.zeros(0, dtype=np.int64)
+        shortcut_length = np.zeros(0)
+
+    affected = np.zeros(goal_count, dtype=bool)
+    for lo in range(0, goal_count, CHUNK):
+        hi = min(lo + CHUNK, goal_count)
+        rows = np.asarray(next_hop[lo:hi])
+        hit = uses_edges(rows, used_start, used_end)
+        if len(shortcut_start) > 0:
+            if metric == "distance":
+                cost = np.asarray(distance[lo:hi])
+            else:
+                cost = tree_hops(rows, np.arange(lo, hi))
+            hit |= (cost[:, shortcut_start] > shortcut_length[None, :] +
+                    cost[:, shortcut_end] + 1e-9).any(axis=1)
+        affected[lo:hi] = hit
+    return affected
+
+
+# goals whose route stays but goes through an edge with a new distance
+def distance_goals(diff: GraphDiff, next_hop: np.ndarray) -> np.ndarray:
+    goal_count = next_hop.shape[0]
+    affected = np.zeros(goal_count, dtype=bool)
+    for lo in range(0, goal_count, CHUNK):
+        hi = min(lo + CHUNK, goal_count)
+        affected[lo:hi] = uses_edges(np.asarray(next_hop[lo:hi]),
+                                     diff.changed_start, diff.changed_end)
+    return affected
+
+
+def write_table(graph: CompactGraph, name: str, next_hop: np.ndarray,
+                distance: np.ndarray) -> None:
+    write_route_matrix(os.path.join(TABLE_DIRECTORY, f"{name}.bin"),
+                       graph.ids,
+                       next_hop,
+                       distance,
+                       checksum=graph.checksum())
+    save_table_graph(graph, TABLE_DIRECTORY)
+
+
+# recompute the rows of the affected goals of a search table
+def update_search_table(name: str, graph: CompactGraph, diff: GraphDiff,
+                        matrix: RouteMatrix, workers: int = 1) -> dict:
+    next_hop = np.array(matrix.next_hop)
+    distance = np.array(matrix.distance)
+    goals = np.flatnonzero(
+        affected_goals(diff, next_hop, distance, SEARCH_METRICS[name],
+                       graph))
+    if len(goals) > 0:
+        next_hop[goals] = search_rows(graph, name, goals, workers)
+
+    rows = np.union1d(goals, np.flatnonzero(distance_goals(diff, next_hop)))
+    for goal in rows.tolist():
+        distance[goal] = graph.cost_to_go(next_hop[goal], goal)
+    write_table(graph, name, next_hop, distance)
+    return {"goals": len(goals), "distance_rows": len(rows), "full": False}
+
+
+# retrain the affected goals of an rl table from their saved q values
+def update_rl_table(agent, graph: CompactGraph, old: CompactGraph,
+                    diff: GraphDiff, matrix: RouteMatrix, workers: int = 1,
+                    seed: int = 0, progress=None) -> dict:
+    import ReinforcmentLearning as rl
+
+    name = agent.table_name
+    next_hop = np.array(matrix.next_hop)
+    distance = np.array(matrix.distance)
+    goals = np.flatnonzero(
+        affected_goals(diff, next_hop, distance, "hops", graph))
+
+    # q values of the edges kept, DEFAULT_Q for the new edges
+    old_q = rl.load_q_table(name)
+    slots = slot_map(old, graph)
+    q_path = rl.q_table_path(name)
+    q_values = np.lib.format.open_memmap(q_path + ".tmp",
+                                         mode="w+",
+                                         dtype=np.float32,
+                                         shape=(graph.vertex_count,
+                                                graph.edge_count))
+    for lo in range(0, graph.vertex_count, CHUNK):
+        hi = min(lo + CHUNK, graph.vertex_count)
+        if old_q is None:
+            q_values[lo:hi] = DEFAULT_Q
+        else:
+            q_values[lo:hi] = np.where(slots >= 0,
+                                       old_q[lo:hi][:, np.maximum(slots, 0)],
+                                       DEFAULT_Q)
+
+    g = rl.Graph()
+    g.read_csv()
+    goal_ids = graph.ids[goals].tolist()
+
+    def initial_q(goal_id: int) -> np.ndarray:
+        if old_q is None:
+            return None
+        return np.array(q_values[graph.index_of[goal_id]], dtype=np.float64)
+
+    def finish(done: int, goal_id: int, next_vertices: np.ndarray,
+               q: np.ndarray) -> None:
+        index = graph.index_of[goal_id]
+        next_hop[index] = next_vertices
+        q_values[index] = q
+        if progress is not None:
+            progress(done, len(goal_ids), g.get_vertex_by_id(goal_id))
+
+    rl.run_goals(g, goal_ids, agent, finish, workers, seed, initial_q=initial_q)
+
+    rows = np.union1d(goals, np.flatnonzero(distance_goals(diff, next_hop)))
+    for goal in rows.tolist():
+        distance[goal] = graph.cost_to_go(next_hop[goal], goal)
+    q_values.flush()
+    del q_values
+    os.replace(q_path + ".tmp", q_path)
+    write_table(graph, name, next_hop, distance)
+    return {
+        "goals": len(goals),
+        "distance_rows": len(rows),
+        "full": False,
+        "warm_start": old_q is not None
+    }
+
+
+# update every table of table_q/ to vertices.csv / arestas.csv, returns
+# what was done per table
+def update_tables(agents=None,
+                  searches=tuple(SEARCHES),
+                  workers: int = 1,
+                  seed: int = 0,
+                  progress=None) -> dict:
+    import ReinforcmentLearning as rl
+
+    if agents is None:
+        agents = (rl.QLearningAgent, rl.SarsaAgent)
+    graph = CompactGraph.read_csv()
+    checksum = graph.checksum()
+
+    report = {}
+    tables = [(agent.table_name, agent) for agent in agents] + [
+        (name, None) for name in searches
+    ]
+    for name, agent in tables:
+        path = os.path.join(TABLE_DIRECTORY, f"{name}.bin")
+        if not os.path.exists(path):
+            continue
+        matrix = RouteMatrix(path)
+        if matrix.checksum == checksum:
+            report[name] = {"goals": 0, "distance_rows": 0, "full": False}
+            continue
+
+        old_path = table_graph_path(TABLE_DIRECTORY, matrix.checksum)
+        old = CompactGraph.load(old_path) if os.path.exists(
+            old_path) else None
+        if old is None or not np.array_equal(old.ids, graph.ids) or \
+                matrix.distance is None:
+            # nothing to diff with, rebuild the whole table
+            if agent is not None:
+                rl.full_run(agent, workers, seed, progress)
+            else:
+                next_hop = build_next_hops(graph, name, workers)
+                write_table(graph, name, next_hop, np.array([
+                    graph.cost_to_go(next_hop[goal], goal)
+                    for goal in range(graph.vertex_count)
+                ]).reshape(next_hop.shape))
+            report[name] = {
+                "goals": graph.vertex_count,
+                "distance_rows": graph.vertex_count,
+                "full": True
+            }
+            continue
+
+        diff = GraphDiff(old, graph)
+        if agent is not None:
+            report[name] = update_rl_table(agent, graph, old, diff, matrix,
+                                           workers, seed, progress)
+        else:
+            report[name] = update_search_table(name, graph, diff, matrix,
+                                               workers)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Update table_q/ after the csv files changed")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, done in update_tables(workers=args.workers,
+                                    seed=args.seed).items():
+        if done["full"]:
+            print(f"{name}: rebuilt every goal")
+        else:
+            print(f"{name}: {done['goals']} goals recomputed, "
+                  f"{done['distance_rows']} distance rows updated")
@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+
+# inverted index category -> vertices plus a uniform grid per category
+# over pos_x/pos_y, categories are compared in lower case
+class InterestIndex:
+
+    def __init__(self, ids, categories, pos_x, pos_y) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.pos_x = np.asarray(pos_x, dtype=np.float64)
+        self.pos_y = np.asarray(pos_y, dtype=np.float64)
+
+        by_category = {}
+        for index, category in enumerate(categories):
+            by_category.setdefault(category.strip().lower(), []).append(index)
+        self.by_category = {
+            category: np.array(indexes, dtype=np.int64)
+            for category, indexes in by_category.items()
+        }
+
+        # about one vertex per cell over the bounding box
+        n = max(len(self.ids), 1)
+        if len(self.ids) > 0:
+            width = self.pos_x.max() - self.pos_x.min()
+            height = self.pos_y.max() - self.pos_y.min()
+            self.origin = (self.pos_x.min(), self.pos_y.min())
+        else:
+            width = height = 0.0
+            self.origin = (0.0, 0.0)
+        self.cell_size = max(math.sqrt(max(width * height, 1.0) / n), 1e-9)
+
+        self.grids = {}
+        for category, indexes in self.by_category.items():
+            grid = {}
+            for index in indexes.tolist():
+                grid.setdefault(self.cell(self.pos_x[index], self.pos_y[index]),
+                                []).append(index)
+            self.grids[category] = grid
+
+    @property
+    def categories(self) -> set:
+        return set(self.by_category)
+
+    def cell(self, x: float, y: float) -> tuple:
+        return (int((x - self.origin[0]) // self.cell_size),
+                int((y - self.origin[1]) // self.cell_size))
+
+    # names that no vertex of the map has as category
+    def validate(self, names: list) -> list:
+        return [name for name in names if name.lower() not in self.categories]
+
+    # ids of the vertices of any of the categories, in vertex order
+    def vertices(self, categories: list, exclude=()) -> list:
+        indexes = [
+            self.by_category[category.lower()] for category in categories
+            if category.lower() in self.by_category
+        ]
+        if not indexes:
+            return []
+        ids = self.ids[np.unique(np.concatenate(indexes))].tolist()
+        exclude = set(int(i) for i in exclude)
+        return [i for i in ids if i not in exclude]
+
+    # ids of the `count` vertices of the categories closest to (x, y),
+    # searching rings of grid cells around it
+    def nearest(self, x: float, y: float, categories: list, count: int,
+                exclude=()) -> list:
+        grids = [
+            self.grids[category.lower()] for category in set(categories)
+            if category.lower() in self.grids
+        ]
+        total = sum(len(self.by_category[c.lower()]) for c in set(categories)
+                    if c.lower() in self.by_category)
+        exclude = set(int(i) for i in exclude)
+        if not grids or count <= 0:
+            return []
+
+        cx, cy = self.cell(x, y)
+        found = []
+        seen = 0
+        ring = 0
+        while True:
+            for cell in self.ring_cells(cx, cy, ring):
+                for grid in grids:
+                    for index in grid.get(cell, ()):
+                        seen += 1
+                        if int(self.ids[index]) in exclude:
+                            continue
+                        distance = math.hypot(self.pos_x[index] - x,
+                                              self.pos_y[index] - y)
+                        found.append((distance, index))
+            found.sort()
+            # cells beyond this ring are at least ring * cell_size away
+            if seen >= total or (len(found) >= count and
+                                 found[count - 1][0] <= ring * self.cell_size):
+                break
+            ring += 1
+        return [int(self.ids[index]) for _, index in found[:count]]
+
+    @staticmethod
+    def ring_cells(cx: int, cy: int, ring: int):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
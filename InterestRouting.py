@@ -0,0 +1,163 @@
+import math
+import time
+
+import numpy as np
+
+from RouteTables import NoRouteError
+
+# choice and order of the interest stops of a route
+#
+# distance is a square matrix over the points of one query: point 0 is the
+# start, the last point is the goal and the points in between are the
+# candidate stops. a tour is the list of candidate points visited between
+# the start and the goal, and plan_tour returns the tour with `count`
+# stops and the smallest total distance it can find: exact dynamic
+# programming over subsets when the number of subsets is small, otherwise
+# cheapest insertion improved by 2-opt, or-opt and stop swaps within a
+# time budget. NoRouteError when no tour found goes through `count` stops
+# with a finite distance
+
+# transitions the exact solver may evaluate
+EXACT_LIMIT = 200000
+TIME_BUDGET = 0.05
+CANDIDATE_LIMIT = 64
+
+
+# transitions evaluated by exact_tour: subsets of up to count candidates
+# times their last stop times the next candidate
+def exact_cost(candidates: int, count: int) -> int:
+    return sum(
+        math.comb(candidates, size) * size
+        for size in range(1, count + 1)) * candidates
+
+
+def tour_length(distance: np.ndarray, tour: list) -> float:
+    points = [0] + tour + [len(distance) - 1]
+    return float(sum(distance[a, b] for a, b in zip(points, points[1:])))
+
+
+# held-karp restricted to subsets of up to `count` candidates
+def exact_tour(distance: np.ndarray, count: int) -> list:
+    n = len(distance) - 2
+    goal = n + 1
+    d = distance.tolist()
+    # best[(mask, last)] = (length, previous last)
+    best = {(1 << i, i): (d[0][i + 1], -1) for i in range(n)}
+    layer = list(best)
+    for _ in range(count - 1):
+        next_layer = {}
+        for mask, last in layer:
+            length = best[(mask, last)][0]
+            for i in range(n):
+                if mask & (1 << i):
+                    continue
+                key = (mask | (1 << i), i)
+                candidate = length + d[last + 1][i + 1]
+                if key not in next_layer or candidate < next_layer[key][0]:
+                    next_layer[key] = (candidate, last)
+        best.update(next_layer)
+        layer = list(next_layer)
+
+    if not layer:
+        return []
+    mask, last = min(layer,
+                     key=lambda key: best[key][0] + d[key[1] + 1][goal])
+    if math.isinf(best[(mask, last)][0] + d[last + 1][goal]):
+        raise NoRouteError(f"no tour through {count} stops")
+    tour = []
+    while last != -1:
+        tour.append(last + 1)
+        previous = best[(mask, last)][1]
+        mask &= ~(1 << last)
+        last = previous
+    return tour[::-1]
+
+
+# insert, one at a time, the candidate that adds the least distance. an
+# insertion that joins an unreachable leg comes first and one that leaves
+# a reachable leg unreachable last
+def cheapest_insertion(distance: np.ndarray, count: int) -> list:
+    goal = len(distance) - 1
+    tour = []
+    unused = set(range(1, goal))
+    while len(tour) < count and unused:
+        points = [0] + tour + [goal]
+        best = ((math.inf, math.inf), None, None)
+        for candidate in unused:
+            for position in range(len(points) - 1):
+                a, b = points[position], points[position + 1]
+                before = distance[a, b]
+                after = distance[a, candidate] + distance[candidate, b]
+                added = (math.isinf(after) - math.isinf(before),
+                         after - before if math.isfinite(before) else after)
+                if added < best[0]:
+                    best = (added, candidate, position)
+        if best[1] is None:
+            break
+        tour.insert(best[2], best[1])
+        unused.discard(best[1])
+    return tour
+
+
+# 2-opt, or-opt and swap moves until none improves or the budget ends
+def improve_tour(distance: np.ndarray, tour: list,
+                 deadline: float) -> list:
+    goal = len(distance) - 1
+    best_length = tour_length(distance, tour)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        moves = []
+        # 2-opt: reverse a segment
+        for i in range(len(tour)):
+            for j in range(i + 1, len(tour)):
+                moves.append(tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:])
+        # or-opt: move one stop to another position
+        for i in range(len(tour)):
+            rest = tour[:i] + tour[i + 1:]
+            for j in range(len(tour)):
+                if j != i:
+                    moves.append(rest[:j] + [tour[i]] + rest[j:])
+        # swap a stop for a candidate outside the tour
+        outside = set(range(1, goal)) - set(tour)
+        for i in range(len(tour)):
+            for candidate in outside:
+                moves.append(tour[:i] + [candidate] + tour[i + 1:])
+
+        for move in moves:
+            length = tour_length(distance, move)
+            if length < best_length - 1e-9:
+                tour, best_length = move, length
+                improved = True
+                break
+    return tour
+
+
+def plan_tour(distance: np.ndarray,
+              count: int,
+              exact_limit: int = EXACT_LIMIT,
+              time_budget: float = TIME_BUDGET,
+              candidate_limit: int = CANDIDATE_LIMIT) -> list:
+    distance = np.asarray(distance, dtype=np.float64)
+    count = min(count, len(distance) - 2)
+    if count <= 0:
+        return []
+
+    # keep only the candidates with the smallest detour from start to goal
+    points = np.arange(len(distance))
+    limit = max(candidate_limit, 4 * count)
+    if len(distance) - 2 > limit:
+        detour = distance[0, 1:-1] + distance[1:-1, -1]
+        kept = np.sort(np.argsort(detour, kind="stable")[:limit]) + 1
+        points = np.concatenate([[0], kept, [len(distance) - 1]])
+        distance = distance[np.ix_(points, points)]
+
+    if exact_cost(len(distance) - 2, count) <= exact_limit:
+        tour = exact_tour(distance, count)
+    else:
+        deadline = time.perf_counter() + time_budget
+        tour = improve_tour(distance, cheapest_insertion(distance, count),
+                            deadline)
+        if len(tour) < count or math.isinf(tour_length(distance, tour)):
+            raise NoRouteError(f"no tour through {count} stops")
+    return [int(points[i]) for i in tour]
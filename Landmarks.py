@@ -0,0 +1,179 @@
+import heapq
+import math
+import os
+
+import numpy as np
+
+from CompactGraph import CompactGraph
+
+# ALT index (A*, landmarks and triangle inequality) for routes between any
+# two vertices without the V x V route tables
+#
+# the shortest distance from a few landmark vertices to every vertex is
+# computed once (k x V floats). arestas.csv is undirected, so for every
+# landmark L and vertices v, t: d(v, t) >= |d(L, t) - d(L, v)|, and the
+# largest of these bounds is an admissible heuristic for a* that is much
+# tighter than the straight line distance. landmarks are chosen far from
+# each other (farthest point selection), which keeps the bounds tight
+INDEX_ALGORITHMS = ("alt", )
+LANDMARKS = 16
+
+
+# dijkstra from the source, distance to every vertex (inf if unreachable)
+def shortest_distances(graph: CompactGraph, source: int) -> np.ndarray:
+    offsets = graph.offsets.tolist()
+    neighbors = graph.neighbors.tolist()
+    distances = graph.distances.tolist()
+    distance = [math.inf] * graph.vertex_count
+    distance[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        current_distance, current = heapq.heappop(heap)
+        if current_distance > distance[current]:
+            continue
+        for slot in range(offsets[current], offsets[current + 1]):
+            vertex = neighbors[slot]
+            new_distance = current_distance + distances[slot]
+            if new_distance < distance[vertex]:
+                distance[vertex] = new_distance
+                heapq.heappush(heap, (new_distance, vertex))
+    return np.array(distance)
+
+
+class LandmarkIndex:
+
+    def __init__(self, graph: CompactGraph, landmarks: np.ndarray,
+                 distance: np.ndarray, component: np.ndarray) -> None:
+        self.graph = graph
+        self.landmarks = np.asarray(landmarks, dtype=np.int64)
+        self.component = np.asarray(component, dtype=np.int64)
+        # row = vertex, column = landmark. a landmark of another component
+        # counts as 0 for both ends of a route, which bounds nothing
+        distance = np.asarray(distance, dtype=np.float64).T
+        self.distance = np.ascontiguousarray(
+            np.where(np.isinf(distance), 0.0, distance))
+        self.offsets = graph.offsets
+        self.neighbors = graph.neighbors
+        self.distances = graph.distances
+
+    # farthest point selection: every landmark is the vertex farthest from
+    # the landmarks already chosen, vertices of other components first
+    @classmethod
+    def build(cls, graph: CompactGraph,
+              count: int = LANDMARKS) -> "LandmarkIndex":
+        n = graph.vertex_count
+        count = min(count, n)
+        landmarks, rows = [], []
+        nearest = np.full(n, np.inf)
+        candidate = 0
+        for _ in range(count):
+            distance = shortest_distances(graph, candidate)
+            landmarks.append(candidate)
+            rows.append(distance)
+            nearest = np.minimum(nearest, distance)
+            nearest[landmarks] = -1.0
+            candidate = int(np.argmax(nearest))
+            if nearest[candidate] <= 0:
+                break
+        distance = np.array(rows) if rows else np.zeros((0, n))
+        return cls(graph, np.array(landmarks), distance, graph.components())
+
+    def save(self, path: str, checksum: int) -> None:
+        temporary = path + ".tmp.npz"
+        np.savez(temporary,
+                 landmarks=self.landmarks,
+                 distance=self.distance.T,
+                 component=self.component,
+                 checksum=np.uint64(checksum))
+        os.replace(temporary, path)
+
+    # index saved for the graph, None when it is missing or was built for
+    # another graph
+    @classmethod
+    def load(cls, path: str, graph: CompactGraph) -> "LandmarkIndex":
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["checksum"]) != graph.checksum():
+                return None
+            return cls(graph, data["landmarks"], data["distance"],
+                       data["component"])
+
+    # load <directory>/alt.npz or build it and save it there
+    @classmethod
+    def open(cls, graph: CompactGraph,
+             directory: str = "table_q") -> "LandmarkIndex":
+        path = os.path.join(directory, "alt.npz")
+        index = cls.load(path, graph)
+        if index is None:
+            index = cls.build(graph)
+            if os.path.isdir(directory):
+                index.save(path, graph.checksum())
+        return index
+
+    # lower bound of the distance from each vertex to the target
+    def bounds(self, vertices, target: int) -> np.ndarray:
+        return np.abs(self.distance[vertices] -
+                      self.distance[target]).max(axis=1, initial=0.0)
+
+    # shortest path from start to goal (dense indexes) and its distance,
+    # KeyError when the goal can not be reached. blocked_vertices and
+    # blocked_edges ((a, b) pairs, both directions) are never used, which
+    # keeps the bounds admissible since closures only make routes longer.
+    # limit caps the vertices settled, KeyError when it is reached
+    def route(self,
+              start: int,
+              goal: int,
+              blocked_vertices=frozenset(),
+              blocked_edges=frozenset(),
+              limit: int = None) -> tuple:
+        if self.component[start] != self.component[goal] or \
+                start in blocked_vertices or goal in blocked_vertices:
+            raise KeyError(f"{start}-{goal}")
+        offsets, neighbors, distances = self.offsets, self.neighbors, \
+            self.distances
+        cost = {start: 0.0}
+        parent = {start: start}
+        heap = [(0.0, start)]
+        closed = set()
+        while heap:
+            _, current = heapq.heappop(heap)
+            if current == goal:
+                path = [goal]
+                while path[-1] != start:
+                    path.append(parent[path[-1]])
+                return path[::-1], cost[goal]
+            if current in closed:
+                continue
+            closed.add(current)
+            if limit is not None and len(closed) > limit:
+                break
+            current_cost = cost[current]
+            lo, hi = int(offsets[current]), int(offsets[current + 1])
+            vertices = neighbors[lo:hi]
+            for vertex, distance, bound in zip(
+                    vertices.tolist(), distances[lo:hi].tolist(),
+                    self.bounds(vertices, goal).tolist()):
+                if vertex in blocked_vertices or \
+                        (current, vertex) in blocked_edges:
+                    continue
+                new_cost = current_cost + distance
+                if new_cost < cost.get(vertex, math.inf):
+                    cost[vertex] = new_cost
+                    parent[vertex] = current
+                    heapq.heappush(heap, (new_cost + bound, vertex))
+        raise KeyError(f"{start}-{goal}")
+
+    # lower bound of the distance between every pair of vertices, inf
+    # between components
+    def pair_bounds(self, vertices) -> np.ndarray:
+        distance = self.distance[vertices]
+        bounds = np.abs(distance[:, None] - distance[None]).max(axis=2,
+                                                                initial=0.0)
+        component = self.component[vertices]
+        return np.where(component[:, None] == component[None], bounds,
+                        np.inf)
+
+    @property
+    def nbytes(self) -> int:
+        return self.distance.nbytes + self.component.nbytes
@@ -0,0 +1,316 @@
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+
+# counters and latency histograms rendered in the prometheus text format
+#
+# a disabled registry keeps its metrics but every inc/observe/time returns
+# right away, so instrumented code costs one attribute check
+
+# upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_disabled = nullcontext()
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{str(value)}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, registry, name: str, help: str,
+                 label_names: tuple = ()) -> None:
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}"
+                             f"{format_labels(self.label_names, labels)} "
+                             f"{format_value(value)}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self,
+                 registry,
+                 name: str,
+                 help: str,
+                 label_names: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS) -> None:
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (not cumulative), sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        if not self.registry.enabled:
+            return
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0
+                ]
+            entry[0][bucket] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    # context manager observing the seconds spent inside it
+    def time(self, *labels):
+        if not self.registry.enabled:
+            return _disabled
+        return _Timer(self, labels)
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram"
+        ]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"), ),
+                                               counts):
+                    cumulative += bucket_count
+                    le = format_labels(self.label_names, labels,
+                                       f'le="{format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                label_text = format_labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{label_text} {repr(total)}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class _Timer:
+
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: tuple) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.histogram.observe(time.perf_counter() - self.started,
+                               *self.labels)
+
+
+class MetricsRegistry:
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.metrics = []
+        # functions returning extra text lines, read on every render
+        self.collectors = []
+
+    def counter(self, name: str, help: str, label_names: tuple = ()) -> Counter:
+        counter = Counter(self, name, help, label_names)
+        self.metrics.append(counter)
+        return counter
+
+    def histogram(self,
+                  name: str,
+                  help: str,
+                  label_names: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        histogram = Histogram(self, name, help, label_names, buckets)
+        self.metrics.append(histogram)
+        return histogram
+
+    def collector(self, function) -> None:
+        self.collectors.append(function)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for function in self.collectors:
+            lines += function()
+        return "\n".join(lines) + "\n"
+
+
+# the metrics of the routing api
+class RoutingMetrics:
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.registry = MetricsRegistry(enabled)
+        registry = self.registry
+        self.requests = registry.counter(
+            "routing_requests_total", "Routes answered by algorithm",
+            ("algorithm", "kind", "status"))
+        self.request_seconds = registry.histogram(
+            "routing_request_seconds", "Time to answer a route",
+            ("algorithm", "kind"))
+        self.table_load_seconds = registry.histogram(
+            "routing_table_load_seconds",
+            "Time to load a route table missing from the cache",
+            ("algorithm", ))
+        self.table_lookups = registry.counter(
+            "routing_table_lookups_total",
+            "Route table lookups by cache result", ("algorithm", "result"))
+        self.path_seconds = registry.histogram(
+            "routing_path_seconds",
+            "Time to rebuild a path from a route table", ("algorithm", ))
+        self.interest_seconds = registry.histogram(
+            "routing_interest_selection_seconds",
+            "Time to choose and order the interest stops", ("algorithm", ))
+        self.reroutes = registry.counter(
+            "routing_reroutes_total",
+            "Routes searched again around closed vertices or edges",
+            ("algorithm", ))
+        self.serialization_seconds = registry.histogram(
+            "routing_serialization_seconds", "Time to encode responses",
+            ("endpoint", ))
+
+    @property
+    def enabled(self) -> bool:
+        return self.registry.enabled
+
+    # counters of a RouteTableCache, read when the metrics are rendered
+    def watch_cache(self, cache) -> None:
+
+        def collect() -> list:
+            lines = []
+            for name, help, value in (
+                ("routing_table_cache_hits_total",
+                 "Route table cache hits", cache.hits),
+                ("routing_table_cache_misses_total",
+                 "Route table cache misses", cache.misses),
+                ("routing_table_cache_coalesced_total",
+                 "Lookups that waited for a load already running",
+                 cache.coalesced),
+            ):
+                lines += [
+                    f"# HELP {name} {help}", f"# TYPE {name} counter",
+                    f"{name} {value}"
+                ]
+            lookups = cache.hits + cache.misses + cache.coalesced
+            lines += [
+                "# HELP routing_table_cache_hit_ratio Hits over lookups "
+                "since the last reload",
+                "# TYPE routing_table_cache_hit_ratio gauge",
+                "routing_table_cache_hit_ratio " +
+                repr(cache.hits / lookups if lookups else 0.0),
+                "# HELP routing_table_cache_tables Route tables in memory",
+                "# TYPE routing_table_cache_tables gauge",
+                f"routing_table_cache_tables {len(cache.tables)}"
+            ]
+            return lines
+
+        self.registry.collector(collect)
+
+    # counters of a ResultCache.LRUCache of routes, kind names the cache
+    def watch_results(self, kind: str, cache) -> None:
+
+        def collect() -> list:
+            lines = []
+            for name, help, value in (
+                (f"routing_{kind}_cache_hits_total",
+                 f"Route {kind} cache hits", cache.hits),
+                (f"routing_{kind}_cache_misses_total",
+                 f"Route {kind} cache misses", cache.misses),
+            ):
+                lines += [
+                    f"# HELP {name} {help}", f"# TYPE {name} counter",
+                    f"{name} {value}"
+                ]
+            lines += [
+                f"# HELP routing_{kind}_cache_entries Route {kind}s in memory",
+                f"# TYPE routing_{kind}_cache_entries gauge",
+                f"routing_{kind}_cache_entries {len(cache)}"
+            ]
+            return lines
+
+        self.registry.collector(collect)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+# per goal statistics of the training, filled by train_goal/full_run
+class TrainingMetrics:
+
+    def __init__(self) -> None:
+        # one dict per trained goal
+        self.goals = []
+
+    def record(self, goal_id: int, steps: int, episodes: int, seconds: float,
+               delta_q: float, stop_reason: str = None) -> dict:
+        record = {
+            "goal_id": goal_id,
+            "steps": steps,
+            "episodes": episodes,
+            "seconds": seconds,
+            "steps_per_second": steps / seconds if seconds > 0 else 0.0,
+            "delta_q": delta_q,
+            "stop_reason": stop_reason
+        }
+        self.goals.append(record)
+        return record
+
+    def add(self, record: dict) -> None:
+        self.goals.append(record)
+
+    def summary(self) -> dict:
+        steps = sum(goal["steps"] for goal in self.goals)
+        seconds = sum(goal["seconds"] for goal in self.goals)
+        return {
+            "goals": len(self.goals),
+            "steps": steps,
+            "episodes": sum(goal["episodes"] for goal in self.goals),
+            "seconds": seconds,
+            "steps_per_second": steps / seconds if seconds > 0 else 0.0
+        }
+
+    # prometheus text with one sample per goal, for a textfile collector
+    def render(self) -> str:
+        lines = []
+        for key, kind, help in (
+            ("steps", "counter", "Training steps of the goal"),
+            ("episodes", "counter", "Training episodes of the goal"),
+            ("seconds", "gauge", "Training time of the goal"),
+            ("steps_per_second", "gauge", "Training steps per second"),
+            ("delta_q", "gauge", "Sum of the delta q of the goal"),
+        ):
+            name = f"training_{key}" + ("_total" if kind == "counter" else "")
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for goal in self.goals:
+                lines.append(f'{name}{{goal="{goal["goal_id"]}"}} '
+                             f"{format_value(goal[key])}")
+        return "\n".join(lines) + "\n"
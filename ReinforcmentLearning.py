@@ -1,5 +1,15 @@
+import json
 import os
-import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from Checkpoint import CHECKPOINT_INTERVAL, TrainingCheckpoints, run_key
+from CompactGraph import CompactGraph
+from Convergence import ConvergenceMonitor
+from Metrics import TrainingMetrics
+from RouteTables import RouteMatrix, save_table_graph, write_route_matrix
 
 ALPHA = 0.3  # Taxa de aprendizado
 GAMMA = 0.7  # Fator de desconto
@@ -63,34 +73,80 @@ class Edge:
         self.q = q
 
 
+# view over one slot of the compact graph arrays, exposes the same
+# attributes as Edge but keeps no state of its own
+class EdgeView:
+
+    __slots__ = ("graph", "slot")
+
+    def __init__(self, graph, slot: int) -> None:
+        self.graph = graph
+        self.slot = slot
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, EdgeView) and other.graph is self.graph \
+            and other.slot == self.slot
+
+    def __hash__(self) -> int:
+        return hash((id(self.graph), self.slot))
+
+    @property
+    def start(self):
+        csr = self.graph.compiled()
+        index = int(np.searchsorted(csr.offsets, self.slot, side="right")) - 1
+        return self.graph.vertices[index]
+
+    @property
+    def end(self):
+        return self.graph.vertices[self.graph.compiled().neighbors[self.slot]]
+
+    @property
+    def distance(self) -> float:
+        return float(self.graph.compiled().distances[self.slot])
+
+    @property
+    def q(self) -> float:
+        return float(self.graph.compiled().q[self.slot])
+
+    @q.setter
+    def q(self, value: float) -> None:
+        self.graph.compiled().q[self.slot] = value
+
+
 class Vertex:
 
+    __slots__ = ("id", "name", "category", "r", "graph", "index")
+
     def __init__(self, id: int, name: str, category: str, r=0.0) -> None:
         self.id = id
         self.name = name
-        self.edges = []
         self.category = category
         self.r = r
+        self.graph = None
+        self.index = -1
+
+    @property
+    def edges(self) -> list:
+        if self.graph is None:
+            return []
+        lo, hi = self.graph.compiled().edge_range(self.index)
+        return [EdgeView(self.graph, slot) for slot in range(lo, hi)]
 
     def add_edge(self, edge: Edge) -> None:
-        for e in self.edges:
-            if e.end == edge.end:
-                return
-        self.edges.append(edge)
+        self.graph.add_directed_edge(self.index, edge.end.index,
+                                     edge.distance, edge.q)
 
     def get_bigger_q_action(self) -> float:
-        bigger_q = DEFAULT_Q
-        for edge in self.edges:
-            if edge.q > bigger_q:
-                bigger_q = edge.q
-        return bigger_q
+        csr = self.graph.compiled()
+        lo, hi = csr.edge_range(self.index)
+        if lo == hi:
+            return DEFAULT_Q
+        return max(DEFAULT_Q, float(csr.q[lo:hi].max()))
 
     def get_best_action_index(self) -> int:
-        edge_destiny = self.edges[0]
-        for edge in self.edges:
-            if edge.q > edge_destiny.q:
-                edge_destiny = edge
-        return self.edges.index(edge_destiny)
+        csr = self.graph.compiled()
+        lo, hi = csr.edge_range(self.index)
+        return int(np.argmax(csr.q[lo:hi]))
 
 
 class Graph:
@@ -101,63 +157,88 @@ class Graph:
         self.goal = None
         self.min_distance = 9999999
         self.max_distance = 0
-
-    def read_csv(self) -> None:
-        _file = open("vertices.csv", "r", encoding="utf-8-sig")
-
-        for line in _file:
-            line = line.split(",")
-
-            vertex_id = int(line[0])
-            name = str(line[1])
-            category = str(line[2])
-
-            self.add_vertex(Vertex(vertex_id, name, category))
-
-        _file.close()
-
-        _file = open("arestas.csv", "r", encoding="utf-8-sig")
-
-        for line in _file:
-            line = line.split(",")
-
-            start = int(line[0])
-            end = int(line[1])
-            distance = int(line[2])
-
-            if distance < self.min_distance:
-                self.min_distance = distance
-
-            if distance > self.max_distance:
-                self.max_distance = distance
-
-            self.add_edge(start, end, distance)
-
-        _file.close()
+        self.index_by_id = {}
+        self.index_by_name = {}
+        self.csr = None
+        # edges added since the last compilation, merged into csr lazily
+        self.pending_start = []
+        self.pending_end = []
+        self.pending_distance = []
+        self.pending_q = []
+        self.pending_pairs = set()
+
+    def read_csv(self,
+                 vertices_path: str = "vertices.csv",
+                 edges_path: str = "arestas.csv") -> None:
+        self.load_compact(CompactGraph.read_csv(vertices_path, edges_path))
+
+    # adopt an already built compact graph, vertices become views over it
+    def load_compact(self, csr: CompactGraph) -> None:
+        self.__init__()
+        for i in range(csr.vertex_count):
+            self.add_vertex(
+                Vertex(int(csr.ids[i]), csr.names[i], csr.categories[i]))
+        self.csr = csr
+        self.update_distance_bounds(csr.min_distance, csr.max_distance)
+
+    # merge pending edges into the compact arrays and return them
+    def compiled(self) -> CompactGraph:
+        if self.csr is not None and len(self.csr.ids) == len(self.vertices) \
+                and not self.pending_start:
+            return self.csr
+
+        ids = [vertex.id for vertex in self.vertices]
+        start, end, distance, q = [], [], [], []
+        if self.csr is not None:
+            start = self.csr.edge_sources()
+            end = self.csr.neighbors
+            distance = self.csr.distances
+            q = self.csr.q
+        self.csr = CompactGraph.from_edges(
+            ids,
+            np.concatenate([start, self.pending_start]),
+            np.concatenate([end, self.pending_end]),
+            np.concatenate([distance, self.pending_distance]),
+            np.concatenate([q, self.pending_q]),
+            names=[vertex.name for vertex in self.vertices],
+            categories=[vertex.category for vertex in self.vertices])
+        self.pending_start.clear()
+        self.pending_end.clear()
+        self.pending_distance.clear()
+        self.pending_q.clear()
+        self.pending_pairs.clear()
+        return self.csr
+
+    def update_distance_bounds(self, min_distance: float,
+                               max_distance: float) -> None:
+        if min_distance < self.min_distance:
+            self.min_distance = min_distance
+
+        if max_distance > self.max_distance:
+            self.max_distance = max_distance
 
     def get_all_vertices(self) -> list():
         return self.vertices
 
     def get_all_edges(self) -> list:
-        edges = []
-        for vertex in self.vertices:
-            for edge in vertex.edges:
-                edges.append(edge)
-        return edges
+        return [EdgeView(self, slot) for slot in range(self.compiled().edge_count)]
 
     def add_vertex(self, vertex: Vertex) -> None:
+        vertex.graph = self
+        vertex.index = len(self.vertices)
         self.vertices.append(vertex)
+        self.index_by_id[int(vertex.id)] = vertex.index
+        self.index_by_name.setdefault(vertex.name, vertex.index)
 
     def get_vertex_by_id(self, id: int) -> Vertex:
-        for vertex in self.vertices:
-            if str(vertex.id) == str(id):
-                return vertex
-        raise Exception(f"Vertex with id {id} not found")
+        try:
+            return self.vertices[self.index_by_id[int(id)]]
+        except (KeyError, ValueError):
+            raise Exception(f"Vertex with id {id} not found")
 
     def get_vertex_by_name(self, name: str) -> Vertex:
-        for vertex in self.vertices:
-            if vertex.name == name:
-                return vertex
+        if name in self.index_by_name:
+            return self.vertices[self.index_by_name[name]]
         raise Exception(f"Vertex with name {name} not found")
 
     def set_goal(self, goal_vertex: Vertex) -> None:
@@ -166,107 +247,268 @@ class Graph:
     def set_start(self, start_vertex: Vertex) -> None:
         self.start = start_vertex
 
+    # add start -> end unless the pair already exists
+    def add_directed_edge(self, start: int, end: int, distance: float,
+                          q: float = DEFAULT_Q) -> None:
+        if (start, end) in self.pending_pairs:
+            return
+        if self.csr is not None and start < self.csr.vertex_count \
+                and self.csr.find_edge(start, end) != -1:
+            return
+        self.pending_pairs.add((start, end))
+        self.pending_start.append(start)
+        self.pending_end.append(end)
+        self.pending_distance.append(distance)
+        self.pending_q.append(q)
+
     def add_edge(self, start: int, end: int, distance: int) -> None:
         start = self.get_vertex_by_id(start)
         end = self.get_vertex_by_id(end)
-        start.add_edge(Edge(start, end, distance))
-        end.add_edge(Edge(end, start, distance))
+        self.add_directed_edge(start.index, end.index, distance)
+        self.add_directed_edge(end.index, start.index, distance)
+        self.update_distance_bounds(distance, distance)
 
     def define_reward(self, reward: float, vertex: Vertex) -> None:
         vertex.r = reward
 
+    # clear q values, rewards, start and goal so the graph can be reused
+    def reset_training(self) -> None:
+        self.compiled().q.fill(DEFAULT_Q)
+        for vertex in self.vertices:
+            vertex.r = 0.0
+        self.start = None
+        self.goal = None
+
+
+# uniform floats in [0, 1) of a numpy generator, drawn block_size at a
+# time so every decision of an agent costs a next() instead of a call into
+# the generator. the same seed always gives the same sequence
+class BlockRandom:
+
+    def __init__(self, rng: np.random.Generator,
+                 block_size: int = 4096) -> None:
+        self.rng = rng
+        self.block_size = block_size
+        self.block = iter(())
+
+    def random(self) -> float:
+        try:
+            return next(self.block)
+        except StopIteration:
+            self.block = iter(self.rng.random(self.block_size).tolist())
+            return next(self.block)
+
+    # values drawn but not used yet, kept by a checkpoint
+    def remaining(self) -> list:
+        values = list(self.block)
+        self.block = iter(values)
+        return values
+
+    def restore(self, values) -> None:
+        self.block = iter(list(values))
+
 
 class Agent:
 
-    def __init__(self, graph: Graph) -> None:
+    # name of the route matrix written by full_run (table_q/<name>.bin)
+    table_name = "table_q"
+
+    # seed of the generator of the agent, None for fresh entropy
+    def __init__(self,
+                 graph: Graph,
+                 monitor: ConvergenceMonitor = None,
+                 seed: int = None) -> None:
+        self.rng = np.random.default_rng(seed)
+        self.randoms = BlockRandom(self.rng)
         self.graph = graph
         self.current = graph.start
         self.path = []
         self.epoch = 0
         self.path.append(self.current)
         self.delta_q_total = 0.0
-        self.list_delta_q = [0]
+        # finished walks, every walk ends at the goal or a dead end
+        self.episodes = 0
+        self.monitor = monitor if monitor is not None else \
+            self.default_monitor()
         self.converged = False
+        # called with the agent after every sweep (see Checkpoint)
+        self.on_sweep = None
+        self.sweep_pending = False
+        # python lists of the compact arrays that do not change while the
+        # agent trains, for the steps (see compiled)
+        self.lists_of = None
+        self.offsets = None
+        self.neighbors = None
+        self.distances = None
+        # q values of the edge slots as a list while train runs, written
+        # back to the compact graph before every sweep check and when
+        # training stops
+        self.q = None
+
+    def default_monitor(self) -> ConvergenceMonitor:
+        return ConvergenceMonitor()
+
+    # why training stopped (see Convergence), None while it runs
+    @property
+    def stop_reason(self) -> str:
+        return self.monitor.reason
+
+    # compact graph of the agent, with offsets, neighbors and distances
+    # also kept as lists: reading one item of a list is much cheaper than
+    # reading it from a numpy array, which adds up over millions of steps
+    def compiled(self) -> CompactGraph:
+        csr = self.graph.compiled()
+        if self.lists_of is not csr:
+            self.lists_of = csr
+            self.offsets = csr.offsets.tolist()
+            self.neighbors = csr.neighbors.tolist()
+            self.distances = csr.distances.tolist()
+        return csr
 
     def get_random_action(self) -> int:
-        return int(random.random() * len(self.current.edges))
+        self.compiled()
+        index = self.current.index
+        degree = self.offsets[index + 1] - self.offsets[index]
+        return int(self.randoms.random() * degree)
 
     def random_policy(self) -> int:
         return int(self.get_random_action())
 
     def greedy_policy(self) -> int:
+        self.compiled()
+        index = self.current.index
+        return self.greedy_action(self.offsets[index],
+                                  self.offsets[index + 1])
+
+    # epsilon-greedy action among the edge slots lo:hi of a vertex (the
+    # training hot path, reads the q list of train)
+    def greedy_action(self, lo: int, hi: int) -> int:
         # Has a chance of EPSILON to exploit
-        if random.random() > EPSILON:
-            if self.current.get_bigger_q_action() != DEFAULT_Q:
-                return self.current.get_best_action_index()
+        if self.randoms.random() > EPSILON and lo < hi:
+            q = self.q[lo:hi] if self.q is not None \
+                else self.graph.compiled().q[lo:hi].tolist()
+            best = max(q)
+            if best > DEFAULT_Q:
+                return q.index(best)
         # Otherwise, explore
-        return self.get_random_action()
+        return int(self.randoms.random() * (hi - lo))
 
     def greater_policy(self) -> int:
         return self.current.get_best_action_index()
 
     def reset_agent(self) -> None:
         random_vertex = self.graph.get_vertex_by_id(
-            str(int(random.random() * len(self.graph.vertices))))
+            str(int(self.randoms.random() * len(self.graph.vertices))))
 
         self.current = random_vertex
         self.path.clear()
         self.path.append(self.current)
 
     def verify_convergence(self) -> bool:
-        if is_converged(self.list_delta_q):
-            self.converged = True
-            return True
-        return False
+        self.converged = self.monitor.converged
+        return self.converged
+
+    def sweep_ended(self) -> None:
+        if self.on_sweep is not None:
+            self.on_sweep(self)
+
+    # everything needed to continue the training of the goal, as arrays
+    def state(self) -> dict:
+        state = {
+            f"monitor_{name}": value
+            for name, value in self.monitor.state().items()
+        }
+        state.update(q=self.graph.compiled().q.copy(),
+                     rng=np.array(json.dumps(self.rng.bit_generator.state)),
+                     randoms=np.array(self.randoms.remaining(),
+                                      dtype=np.float64),
+                     epoch=np.int64(self.epoch),
+                     episodes=np.int64(self.episodes),
+                     delta_q_total=np.float64(self.delta_q_total),
+                     current=np.int64(self.current.index))
+        return state
+
+    def restore(self, state: dict) -> None:
+        self.monitor.restore({
+            name[len("monitor_"):]: value
+            for name, value in state.items() if name.startswith("monitor_")
+        })
+        self.graph.compiled().q[:] = state["q"]
+        self.rng.bit_generator.state = json.loads(str(state["rng"]))
+        self.randoms.restore(np.asarray(state["randoms"]).tolist())
+        self.epoch = int(state["epoch"])
+        self.episodes = int(state["episodes"])
+        self.delta_q_total = float(state["delta_q_total"])
+        self.current = self.graph.vertices[int(state["current"])]
+        self.path = [self.current]
+        self.verify_convergence()
+
+    # count the step and close the sweep when it ends
+    def count_step(self) -> None:
+        self.epoch += 1
+        if self.monitor.step():
+            csr = self.graph.compiled()
+            csr.q[:] = self.q
+            self.monitor.end_sweep(csr.greedy_next_hops(),
+                                   self.graph.goal.index)
+            self.sweep_pending = True
+        self.verify_convergence()
 
     def train(self) -> None:
-        while not self.converged:
-            while self.current != self.graph.goal:
-                self.move()
-
-            self.reset_agent()
+        csr = self.compiled()
+        self.q = csr.q.tolist()
+        try:
+            while not self.converged:
+                while self.current != self.graph.goal:
+                    self.move()
+                    # the step is only complete once the agent moved
+                    if self.sweep_pending:
+                        self.sweep_pending = False
+                        self.sweep_ended()
+
+                self.episodes += 1
+                self.reset_agent()
+        finally:
+            csr.q[:] = self.q
+            self.q = None
 
 
 class QLearningAgent(Agent):
 
-    def __init__(
-        self,
-        graph: Graph,
-    ) -> None:
-        super().__init__(graph)
+    table_name = "qlearning"
 
-    def update_q_value(self, next_vertex) -> None:
-        has_change = False
+    def __init__(self,
+                 graph: Graph,
+                 monitor: ConvergenceMonitor = None,
+                 seed: int = None) -> None:
+        super().__init__(graph, monitor, seed)
 
-        for edge in self.current.edges:
-            if edge.end == next_vertex:
-                normalized_distance = get_normalized_distance(
-                    edge.distance, self.graph.min_distance,
-                    self.graph.max_distance)
+    # update the q value of the edge slot taken to the next vertex
+    def update_q_value(self, slot: int, next_vertex: Vertex) -> None:
+        normalized_distance = get_normalized_distance(
+            self.distances[slot], self.graph.min_distance,
+            self.graph.max_distance)
 
-                delta_q = get_delta_q(edge.q, next_vertex.r,
-                                      next_vertex.get_bigger_q_action(),
-                                      normalized_distance)
-                self.delta_q_total += delta_q
-                edge.q = edge.q + delta_q
-                if delta_q != 0:
-                    has_change = True
+        next_lo = self.offsets[next_vertex.index]
+        next_hi = self.offsets[next_vertex.index + 1]
+        max_q = max(self.q[next_lo:next_hi], default=DEFAULT_Q)
 
-        if has_change:
-            self.list_delta_q.append(self.delta_q_total)
+        q = self.q[slot]
+        delta_q = get_delta_q(q, next_vertex.r, max(DEFAULT_Q, max_q),
+                              normalized_distance)
+        self.delta_q_total += delta_q
+        self.q[slot] = q + delta_q
+        self.monitor.record(delta_q)
 
-        self.epoch += 1
-        if self.epoch % 5000 == 0:
-            if is_converged(self.list_delta_q):
-                self.converged = True
-                # save_delta_q_list(self.list_delta_q)
-                # generate_plot(self.list_delta_q)
+        self.count_step()
 
     def move(self) -> None:
-        action_generated = self.greedy_policy()
-        chosen_vertex = self.current.edges[action_generated].end
+        index = self.current.index
+        lo, hi = self.offsets[index], self.offsets[index + 1]
+        slot = lo + self.greedy_action(lo, hi)
+        chosen_vertex = self.graph.vertices[self.neighbors[slot]]
 
-        self.update_q_value(next_vertex=chosen_vertex)
+        self.update_q_value(slot, chosen_vertex)
 
         self.current = chosen_vertex
         self.path.append(self.current)
@@ -274,51 +516,274 @@ class QLearningAgent(Agent):
 
 class SarsaAgent(Agent):
 
-    def __init__(self, graph: Graph) -> None:
-        super().__init__(graph)
+    table_name = "sarsa"
+
+    def __init__(self,
+                 graph: Graph,
+                 monitor: ConvergenceMonitor = None,
+                 seed: int = None) -> None:
+        super().__init__(graph, monitor, seed)
+
+    # sarsa q values keep moving with the exploration and a few greedy
+    # actions keep flipping between near equal edges, so it stops once at
+    # most 10% of the policy changes per sweep, at the latest after the old
+    # 500000 steps
+    def default_monitor(self) -> ConvergenceMonitor:
+        return ConvergenceMonitor(max_epochs=500000, policy_tolerance=0.1)
+
+    # update the q value of the edge slot taken to the next vertex with
+    # the q value of the action chosen there
+    def update_q_value(self, slot: int, next_vertex: Vertex) -> None:
+        next_lo = self.offsets[next_vertex.index]
+        next_hi = self.offsets[next_vertex.index + 1]
+        next_action = self.greedy_action(next_lo, next_hi)
+        next_q = self.q[next_lo + next_action] \
+            if next_lo < next_hi else DEFAULT_Q
+
+        normalized_distance = get_normalized_distance(
+            self.distances[slot], self.graph.min_distance,
+            self.graph.max_distance)
+
+        q = self.q[slot]
+        delta_q = get_delta_q_sarsa(q, next_vertex.r, next_q,
+                                    normalized_distance)
+        self.delta_q_total += delta_q
+        self.q[slot] = q + delta_q
+        self.monitor.record(delta_q)
+
+        self.count_step()
+
+    def move(self) -> None:
+        index = self.current.index
+        lo, hi = self.offsets[index], self.offsets[index + 1]
+        slot = lo + self.greedy_action(lo, hi)
+        next_vertex = self.graph.vertices[self.neighbors[slot]]
 
-    def update_q_value(self, next_vertex) -> None:
-        has_change = False
+        self.update_q_value(slot, next_vertex)
 
-        for edge in self.current.edges:
-            if edge.end == next_vertex:
+        self.current = next_vertex
+        self.path.append(self.current)
 
-                old_current = self.current
-                self.current = next_vertex
-                next_action = self.greedy_policy()
-                self.current = old_current
 
-                next_edge = next_vertex.edges[next_action]
+# q-learning with many walkers advancing in lockstep over the compact
+# arrays, applies the same update as QLearningAgent (get_delta_q with the
+# same distance normalization) to every walker at once
+class VectorizedQLearningAgent(Agent):
+
+    table_name = "qlearning"
+
+    def __init__(self,
+                 graph: Graph,
+                 walkers: int = 256,
+                 seed: int = None,
+                 tolerance: float = 1e-6,
+                 check_every: int = 100,
+                 max_epochs: int = 20000000,
+                 monitor: ConvergenceMonitor = None) -> None:
+        self.walkers = walkers
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.max_epochs = max_epochs
+        # vertex of every walker, kept at the end of each sweep
+        self.positions = None
+        super().__init__(graph, monitor, seed)
+
+    def state(self) -> dict:
+        state = super().state()
+        if self.positions is not None:
+            state["positions"] = np.asarray(self.positions, dtype=np.int64)
+        return state
+
+    def restore(self, state: dict) -> None:
+        super().restore(state)
+        if "positions" in state:
+            self.positions = np.array(state["positions"], dtype=np.int64)
+
+    # a sweep is check_every lockstep steps of every walker
+    def default_monitor(self) -> ConvergenceMonitor:
+        return ConvergenceMonitor(sweep_steps=self.check_every * self.walkers,
+                                  tolerance=self.tolerance,
+                                  window=1,
+                                  max_epochs=self.max_epochs,
+                                  check_policy=False)
 
-                normalized_distance = get_normalized_distance(
-                    edge.distance, self.graph.min_distance,
-                    self.graph.max_distance)
+    def train(self) -> None:
+        csr = self.graph.compiled()
+        q = csr.q
+        slots = csr.padded_slots()
+        valid = slots >= 0
+        degrees = np.diff(csr.offsets)
+        rewards = np.array([vertex.r for vertex in self.graph.vertices])
+        goal = self.graph.goal.index
+        n_vertices = csr.vertex_count
+
+        normalized_distance = get_normalized_distance(csr.distances,
+                                                      self.graph.min_distance,
+                                                      self.graph.max_distance)
+        step_size = ALPHA + (1 - normalized_distance)
+
+        # walkers start on vertices with an edge, an isolated vertex has no
+        # slot to update (slot -1 would wrap to the last edge of the graph)
+        movable = np.flatnonzero((degrees > 0) &
+                                 (np.arange(n_vertices) != goal))
+        if len(movable) == 0:
+            self.current = self.graph.goal
+            return
+
+        def random_vertices(size: int) -> np.ndarray:
+            # uniform over every vertex except the goal, like reset_agent
+            return movable[self.rng.integers(0, len(movable), size)]
+
+        if self.positions is not None:
+            current = np.array(self.positions)
+        else:
+            current = random_vertices(self.walkers)
+            if degrees[self.current.index] > 0 and \
+                    self.current.index != goal:
+                current[0] = self.current.index
 
-                delta_q = get_delta_q_sarsa(edge.q, next_vertex.r, next_edge.q,
-                                            normalized_distance)
-                self.delta_q_total += delta_q
-                edge.q = edge.q + delta_q
-                if delta_q != 0:
-                    has_change = True
+        while not self.converged:
+            current_slots = slots[current]
+            current_q = np.where(valid[current], q[np.maximum(current_slots,
+                                                              0)], -np.inf)
+
+            # epsilon-greedy: exploit when the vertex already has a positive q
+            action = (self.rng.random(self.walkers) *
+                      degrees[current]).astype(np.int64)
+            exploit = (self.rng.random(self.walkers) > EPSILON) & (
+                current_q.max(axis=1) > DEFAULT_Q)
+            action = np.where(exploit, current_q.argmax(axis=1), action)
+
+            chosen = current_slots[np.arange(self.walkers), action]
+            next_vertex = csr.neighbors[chosen].astype(np.int64)
+
+            next_slots = slots[next_vertex]
+            next_q = np.where(valid[next_vertex],
+                              q[np.maximum(next_slots, 0)], DEFAULT_Q)
+            max_q = np.maximum(next_q.max(axis=1), DEFAULT_Q)
+
+            delta_q = step_size[chosen] * (rewards[next_vertex] +
+                                           GAMMA * max_q - q[chosen])
+            q[chosen] = q[chosen] + delta_q
+            self.delta_q_total += float(delta_q.sum())
+            self.monitor.record(float(np.abs(delta_q).max()))
+
+            # walkers that reached the goal (or a dead end) start again
+            finished = (next_vertex == goal) | (degrees[next_vertex] == 0)
+            self.episodes += int(finished.sum())
+            next_vertex[finished] = random_vertices(int(finished.sum()))
+            current = next_vertex
+
+            self.epoch += 1
+            if self.monitor.step(self.walkers):
+                self.monitor.end_sweep()
+                self.positions = current
+                self.sweep_ended()
+            self.verify_convergence()
+
+        self.current = self.graph.goal
+
+
+# model based q-learning: the graph is known and deterministic, so
+# instead of sampling walks every sweep applies the QLearningAgent update
+# (get_delta_q with the same distance normalization) to every edge at
+# once, until the biggest |delta q| of a sweep is below the tolerance.
+# with seed_q the sweeps start from the fixed point computed from the
+# fewest hops to the goal, reward * GAMMA ** hops, which is what the
+# update converges to since the reward is only given at the goal
+class ValueIterationAgent(Agent):
+
+    table_name = "qlearning"
+    seed_q = False
+
+    def __init__(self,
+                 graph: Graph,
+                 tolerance: float = 1e-9,
+                 max_sweeps: int = 100000,
+                 seed_q: bool = None,
+                 monitor: ConvergenceMonitor = None,
+                 seed: int = None) -> None:
+        self.tolerance = tolerance
+        self.max_sweeps = max_sweeps
+        if seed_q is not None:
+            self.seed_q = seed_q
+        super().__init__(graph, monitor, seed)
+
+    # one monitor step per edge update, a sweep updates every edge
+    def default_monitor(self) -> ConvergenceMonitor:
+        edges = max(self.graph.compiled().edge_count, 1)
+        return ConvergenceMonitor(sweep_steps=edges,
+                                  tolerance=self.tolerance,
+                                  window=1,
+                                  max_epochs=self.max_sweeps * edges,
+                                  check_policy=False)
+
+    # fewest hops from every vertex to the goal, inf if it is unreachable
+    def goal_hops(self) -> np.ndarray:
+        csr = self.graph.compiled()
+        sources = csr.edge_sources()
+        hops = np.full(csr.vertex_count, np.inf)
+        hops[self.graph.goal.index] = 0
+        level = 0
+        while True:
+            reached = (hops[csr.neighbors] == level) & np.isinf(hops[sources])
+            if not reached.any():
+                return hops
+            level += 1
+            hops[sources[reached]] = level
+
+    def shortest_path_q(self) -> np.ndarray:
+        csr = self.graph.compiled()
+        hops = self.goal_hops()[csr.neighbors]
+        q = np.where(np.isinf(hops), DEFAULT_Q,
+                     self.graph.goal.r * GAMMA**np.minimum(hops, 1e6))
+        q[csr.edge_sources() == self.graph.goal.index] = DEFAULT_Q
+        return q
 
-        if has_change:
-            self.list_delta_q.append(self.delta_q_total)
+    def train(self) -> None:
+        csr = self.graph.compiled()
+        q = csr.q
+        goal = self.graph.goal.index
+        rewards = np.array([vertex.r for vertex in self.graph.vertices])
+        has_edges = np.diff(csr.offsets) > 0
+        starts = csr.offsets[:-1][has_edges]
+        # the episode ends at the goal, its edges are never updated
+        active = csr.edge_sources() != goal
+
+        normalized_distance = get_normalized_distance(csr.distances,
+                                                      self.graph.min_distance,
+                                                      self.graph.max_distance)
+        step_size = ALPHA + (1 - normalized_distance)
+
+        # a restored agent keeps the q values of its checkpoint
+        if self.seed_q and self.epoch == 0:
+            q[:] = self.shortest_path_q()
+
+        best = np.full(csr.vertex_count, DEFAULT_Q)
+        while not self.converged:
+            best[has_edges] = np.maximum(np.maximum.reduceat(q, starts),
+                                         DEFAULT_Q)
+            max_q = best[csr.neighbors]
+            delta_q = np.where(
+                active, step_size *
+                (rewards[csr.neighbors] + GAMMA * max_q - q), 0.0)
+            q += delta_q
+            self.delta_q_total += float(delta_q.sum())
+            self.monitor.record(float(np.abs(delta_q).max()))
 
-        self.epoch += 1
+            self.epoch += 1
+            if self.monitor.step(csr.edge_count):
+                self.monitor.end_sweep()
+                self.sweep_ended()
+            self.verify_convergence()
 
-        if self.epoch == 500000:
-            self.converged = True
-            # save_delta_q_list(self.list_delta_q)
-            # generate_plot(self.list_delta_q)
+        self.current = self.graph.goal
 
-    def move(self) -> None:
-        next_action = self.greedy_policy()
-        next_vertex = self.current.edges[next_action].end
 
-        self.update_q_value(next_vertex)
+# value iteration starting from the shortest path q values
+class SeededValueIterationAgent(ValueIterationAgent):
 
-        self.current = next_vertex
-        self.path.append(self.current)
+    seed_q = True
 
 
 def print_graph(g: Graph) -> None:
@@ -330,66 +795,475 @@ def print_graph(g: Graph) -> None:
 
 
 def save_table_q(g: Graph, file_name: str = "table_q.csv") -> None:
+    csr = g.compiled()
+    write_table_q(csr.ids, csr.ids[csr.greedy_next_hops()], file_name)
+
+
+# write the next hops of every goal (row = goal, dense indexes) as
+# table_q/<name>.bin with the distance of every vertex to every goal,
+# along with the graph they were trained on
+def save_route_matrix(csr: CompactGraph, next_hop: np.ndarray,
+                      name: str) -> None:
+    distance = np.array([
+        csr.cost_to_go(next_hop[goal], goal)
+        for goal in range(csr.vertex_count)
+    ]).reshape(next_hop.shape)
+    write_route_matrix(f"table_q/{name}.bin",
+                       csr.ids,
+                       next_hop,
+                       distance,
+                       checksum=csr.checksum())
+    save_table_graph(csr)
+
+
+# trained q values of every goal (row = goal, column = edge slot)
+def q_table_path(name: str, directory: str = "table_q") -> str:
+    return os.path.join(directory, f"{name}.q.npy")
+
+
+def save_q_table(q: np.ndarray, name: str, directory: str = "table_q") -> None:
+    path = q_table_path(name, directory)
+    os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "wb") as _file:
+        np.save(_file, np.asarray(q, dtype=np.float32))
+    os.replace(path + ".tmp", path)
+
+
+# memory mapped q values saved by full_run, None if there are none
+def load_q_table(name: str, directory: str = "table_q") -> np.ndarray:
+    path = q_table_path(name, directory)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+# q values saved by the last full_run of the table when it was trained on
+# this graph, None otherwise (IncrementalUpdate maps them to a new graph)
+def saved_q_table(name: str,
+                  csr: CompactGraph,
+                  directory: str = "table_q") -> np.ndarray:
+    q = load_q_table(name, directory)
+    path = os.path.join(directory, f"{name}.bin")
+    if q is None or not os.path.exists(path) or \
+            q.shape != (csr.vertex_count, csr.edge_count) or \
+            RouteMatrix(path).checksum != csr.checksum():
+        return None
+    return q
+
+
+# checkpoints of the runs of a table, table_q/checkpoints/<name>/
+def checkpoint_directory(name: str, directory: str = "table_q") -> str:
+    return os.path.join(directory, "checkpoints", name)
+
+
+# key of a run: the same graph, agent, seed and hyperparameters train the
+# same q values
+def training_key(csr: CompactGraph, algorithm, seed,
+                 **options) -> str:
+    return run_key(csr.checksum(),
+                   algorithm.__name__,
+                   seed,
+                   alpha=ALPHA,
+                   gamma=GAMMA,
+                   epsilon=EPSILON,
+                   **options)
+
+
+# write one "vertex,next vertex" line per vertex
+def write_table_q(ids, next_ids, file_name: str = "table_q.csv") -> None:
     if not os.path.exists("table_q"):
         os.mkdir("table_q")
 
-    if file_name in os.listdir("table_q"):
-        os.remove(f"table_q/{file_name}")
-        # print(f"File {file_name} already exists. It was removed.")
-    _file = open(f"table_q/{file_name}", "w", encoding="utf-8")
-
-    # filter just the biggest q for each edge
-    for vertex in g.get_all_vertices():
-        bigger_q = DEFAULT_Q
-        start = vertex
-        end = vertex
-        for edge in vertex.edges:
-            if edge.q > bigger_q:
-                bigger_q = edge.q
-                start = edge.start
-                end = edge.end
-
-        _file.write(f"{start.id},{end.id}\n")
-    _file.close()
-
-
-# create table q for every vertex
-def full_run(algorithm: Agent):
+    with open(f"table_q/{file_name}", "w", encoding="utf-8") as _file:
+        _file.writelines(f"{start},{end}\n"
+                         for start, end in zip(ids.tolist(), next_ids.tolist()))
+
+
+# goal-conditioned q-learning: one q row per goal over the same edges
+#
+# q-learning is off-policy, so a single stream of random transitions
+# (s, a, s') updates every goal at once; for goal g the reward is 10 when
+# s' == g and transitions leaving g are ignored, as the single goal agents
+# stop there. goals are trained in batches, so only a goals_per_batch x E
+# q tensor is in memory: train keeps the next hops of every goal and
+# writes the q rows of each finished batch to a memory mapped file
+class MultiGoalQLearning:
+
+    def __init__(self,
+                 graph: Graph,
+                 reward: float = 10.0,
+                 walkers: int = 256,
+                 goals_per_batch: int = 256,
+                 seed: int = None,
+                 tolerance: float = 1e-6,
+                 check_every: int = 100,
+                 max_epochs: int = 20000000) -> None:
+        self.graph = graph
+        self.csr = graph.compiled()
+        self.reward = reward
+        self.walkers = walkers
+        self.goals_per_batch = goals_per_batch
+        self.rng = np.random.default_rng(seed)
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.max_epochs = max_epochs
+        self.next_hop = np.full(
+            (self.csr.vertex_count, self.csr.vertex_count), -1,
+            dtype=np.int32)
+        self.epoch = 0
+        # why each batch of goals stopped (see Convergence)
+        self.stop_reasons = []
+
+    # train every goal, the q rows are written to q_path (as float32, like
+    # save_q_table) when it is given and dropped otherwise
+    def train(self, q_path: str = None) -> None:
+        n_vertices = self.csr.vertex_count
+        q_values = None
+        if q_path is not None:
+            os.makedirs(os.path.dirname(q_path) or ".", exist_ok=True)
+            q_values = np.lib.format.open_memmap(
+                q_path + ".tmp",
+                mode="w+",
+                dtype=np.float32,
+                shape=(n_vertices, self.csr.edge_count))
+
+        for first in range(0, n_vertices, self.goals_per_batch):
+            goals = np.arange(first,
+                              min(first + self.goals_per_batch, n_vertices))
+            q = self.train_goals(goals)
+            for goal, row in zip(goals.tolist(), q):
+                self.next_hop[goal] = self.csr.greedy_next_hops(row)
+            if q_values is not None:
+                q_values[goals] = q
+
+        if q_values is not None:
+            q_values.flush()
+            del q_values
+            os.replace(q_path + ".tmp", q_path)
+
+    # train a batch of goals together, returns their q rows
+    def train_goals(self, goals: np.ndarray) -> np.ndarray:
+        csr = self.csr
+        q = np.full((len(goals), csr.edge_count), DEFAULT_Q)
+        slots = csr.padded_slots()
+        valid = slots >= 0
+        degrees = np.diff(csr.offsets)
+        goal_rows = np.arange(len(goals))[:, None]
+
+        normalized_distance = get_normalized_distance(csr.distances,
+                                                      csr.min_distance,
+                                                      csr.max_distance)
+        step_size = ALPHA + (1 - normalized_distance)
+
+        movable = np.flatnonzero(degrees > 0)
+        current = movable[self.rng.integers(0, len(movable), self.walkers)]
+        monitor = ConvergenceMonitor(sweep_steps=self.check_every *
+                                     self.walkers,
+                                     tolerance=self.tolerance,
+                                     window=1,
+                                     max_epochs=self.max_epochs,
+                                     check_policy=False)
+
+        while not monitor.converged:
+            action = (self.rng.random(self.walkers) *
+                      degrees[current]).astype(np.int64)
+            chosen = slots[current, action]
+            next_vertex = csr.neighbors[chosen].astype(np.int64)
+
+            next_slots = slots[next_vertex]
+            next_q = np.where(valid[next_vertex][None],
+                              q[:, np.maximum(next_slots, 0)], DEFAULT_Q)
+            max_q = np.maximum(next_q.max(axis=2), DEFAULT_Q)
+            reward = np.where(next_vertex[None] == goals[:, None],
+                              self.reward, 0.0)
+            # once at the goal an episode ends, so the goal keeps max q 0
+            max_q[next_vertex[None] == goals[:, None]] = DEFAULT_Q
+
+            delta_q = step_size[chosen] * (reward + GAMMA * max_q -
+                                           q[:, chosen])
+            delta_q[current[None] == goals[:, None]] = 0.0
+            q[goal_rows, chosen[None]] = q[:, chosen] + delta_q
+            monitor.record(float(np.abs(delta_q).max()))
+
+            # dead ends restart anywhere, like reset_agent
+            stuck = degrees[next_vertex] == 0
+            next_vertex[stuck] = movable[self.rng.integers(
+                0, len(movable), int(stuck.sum()))]
+            current = next_vertex
+
+            self.epoch += 1
+            if monitor.step(self.walkers):
+                monitor.end_sweep()
+
+        self.stop_reasons.append(monitor.reason)
+        return q
+
+    def next_hops(self, goal: int) -> np.ndarray:
+        return self.next_hop[goal]
+
+    # write table_q/<name>.bin and optionally table_q_<goal id>.csv for
+    # every goal (the q rows are written by train)
+    def save_tables(self,
+                    name: str = "qlearning",
+                    csv_tables: bool = False) -> None:
+        save_route_matrix(self.csr, self.next_hop, name)
+        if not csv_tables:
+            return
+        for goal, goal_id in enumerate(self.csr.ids.tolist()):
+            write_table_q(self.csr.ids,
+                          self.csr.ids[self.next_hop[goal]],
+                          file_name=f"table_q_{goal_id}.csv")
+
+
+# reproducible seed of one goal, independent of which worker trains it
+def goal_seed(seed: int, goal_id: int) -> int:
+    return int(np.random.SeedSequence([seed, goal_id]).generate_state(1)[0])
+
+
+def print_progress(done: int, total: int, vertex: Vertex) -> None:
+    print(f"{int(done / total * 100)}% - Finished vertex {vertex.name} - "
+          f"{done} of {total}")
+
+
+# train the agent on its goal, continuing from the checkpoint of the goal
+# when there is one and saving new ones as it goes
+def train_agent(a: Agent,
+                goal_id: int,
+                checkpoints: TrainingCheckpoints = None) -> np.ndarray:
+    if checkpoints is not None:
+        state = checkpoints.load(goal_id)
+        if state is not None and not bool(state["finished"]):
+            a.restore(state)
+        a.on_sweep = checkpoints.saver(goal_id)
+    a.train()
+    next_hops = a.graph.compiled().greedy_next_hops()
+    if checkpoints is not None:
+        checkpoints.save_finished(goal_id, a.graph.compiled().q, next_hops)
+    return next_hops
+
+
+# train one goal on a reused graph and return the next vertex (dense
+# index) of every vertex, the agent generator is seeded from goal_seed.
+# initial_q warm starts the q values of the edges instead of DEFAULT_Q.
+# with metrics the steps, episodes, time and delta q of the goal are
+# recorded. with checkpoints a finished goal is not trained again and an
+# unfinished one continues where its checkpoint stopped
+def train_goal(g: Graph,
+               goal_id: int,
+               algorithm: Agent,
+               seed: int = 0,
+               metrics: TrainingMetrics = None,
+               initial_q: np.ndarray = None,
+               checkpoints: TrainingCheckpoints = None) -> np.ndarray:
+    g.reset_training()
+    if checkpoints is not None:
+        state = checkpoints.load(goal_id)
+        if state is not None and bool(state["finished"]):
+            g.compiled().q[:] = state["q"]
+            return np.array(state["next_hops"])
+    if initial_q is not None:
+        g.compiled().q[:] = initial_q
+    g.set_start(g.get_vertex_by_id(1))
+    g.set_goal(goal_vertex=g.get_vertex_by_id(goal_id))
+    g.define_reward(10, g.goal)
+
+    a = algorithm(g, seed=goal_seed(seed, goal_id))
+    started = time.perf_counter()
+    next_hops = train_agent(a, goal_id, checkpoints)
+    if metrics is not None:
+        metrics.record(goal_id, a.monitor.epochs, a.episodes,
+                       time.perf_counter() - started, a.delta_q_total,
+                       a.stop_reason)
+
+    return next_hops
+
+
+# graph loaded once per worker process
+_worker_graph = None
+
+
+def _init_worker() -> None:
+    global _worker_graph
+    _worker_graph = Graph()
+    _worker_graph.read_csv()
+
+
+def _train_goal_in_worker(goal_id: int,
+                          algorithm: Agent,
+                          seed: int,
+                          initial_q: np.ndarray = None,
+                          checkpoints: TrainingCheckpoints = None):
+    metrics = TrainingMetrics()
+    next_hops = train_goal(_worker_graph, goal_id, algorithm, seed, metrics,
+                           initial_q, checkpoints)
+    return goal_id, next_hops, _worker_graph.compiled().q.copy(
+    ), metrics.goals[0] if metrics.goals else None
+
+
+# train every goal of goal_ids, in worker processes when workers > 1, and
+# call finish(done, goal_id, next_vertices, q) as each one ends.
+# initial_q(goal_id) returns the q values the goal starts from, or None.
+# goals resumed from checkpoints that had already finished are not
+# recorded in metrics
+def run_goals(g: Graph,
+              goal_ids: list,
+              algorithm: Agent,
+              finish,
+              workers: int = 1,
+              seed: int = 0,
+              metrics: TrainingMetrics = None,
+              initial_q=None,
+              checkpoints: TrainingCheckpoints = None) -> None:
+    initial_q = initial_q if initial_q is not None else lambda goal_id: None
+    if workers <= 1:
+        for done, goal_id in enumerate(goal_ids, start=1):
+            next_vertices = train_goal(g, goal_id, algorithm, seed, metrics,
+                                       initial_q(goal_id), checkpoints)
+            finish(done, goal_id, next_vertices, g.compiled().q)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker) as executor:
+        futures = [
+            executor.submit(_train_goal_in_worker, goal_id, algorithm, seed,
+                            initial_q(goal_id), checkpoints)
+            for goal_id in goal_ids
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            goal_id, next_vertices, q, record = future.result()
+            if metrics is not None and record is not None:
+                metrics.add(record)
+            finish(done, goal_id, next_vertices, q)
+
+
+# create table q for every vertex, with workers > 1 the goals are shared
+# among processes and the tables are identical to a serial run. the tables
+# are saved as table_q/<algorithm.table_name>.bin, the trained q values as
+# table_q/<algorithm.table_name>.q.npy (for IncrementalUpdate) and, with
+# csv_tables, as the old table_q/table_q_<goal id>.csv files. metrics
+# collects the training statistics of every goal.
+# with checkpoints the goals are saved to table_q/checkpoints/<name>/ as
+# they train (see Checkpoint), so a run that stopped can be started again
+# with the same arguments: finished goals are skipped and the others
+# continue from their last checkpoint. the checkpoints are removed once
+# the tables are saved. warm_start starts every goal from the q values of
+# the last full_run of the table when it was trained on the same graph
+def full_run(algorithm: Agent,
+             workers: int = 1,
+             seed: int = 0,
+             progress=print_progress,
+             csv_tables: bool = False,
+             metrics: TrainingMetrics = None,
+             checkpoints: bool = False,
+             checkpoint_interval: float = CHECKPOINT_INTERVAL,
+             warm_start: bool = False):
     g = Graph()
     g.read_csv()
+    csr = g.compiled()
     all_vertex = g.get_all_vertices()
-    for vertex in all_vertex:
-        print(
-            f"{int(all_vertex.index(vertex) / len(all_vertex) * 100)}% - Running for vertex {vertex.name} - {vertex.id + 1} of {len(all_vertex)} "
-        )
-        g = Graph()
-        g.read_csv()
-        start_vertex = g.get_vertex_by_id(1)
-        g.set_start(start_vertex)
-        goal_vertex = g.get_vertex_by_id(vertex.id)
-        g.set_goal(goal_vertex=goal_vertex)
-        g.define_reward(10, g.goal)
-
-        a = algorithm(g)
-        a.train()
-
-        save_table_q(g, file_name=f"table_q_{vertex.id}.csv")
-
-
-
-# create table_q.csv for only one vertex
-def single_run(start_id, goal_id, algorithm: Agent):
+    goal_ids = [vertex.id for vertex in all_vertex]
+
+    warm_q = saved_q_table(algorithm.table_name, csr) if warm_start \
+        else None
+    if warm_q is not None:
+        warm_q = np.array(warm_q, dtype=np.float64)
+
+    def initial_q(goal_id: int) -> np.ndarray:
+        if warm_q is None:
+            return None
+        return warm_q[g.get_vertex_by_id(goal_id).index]
+
+    checkpoint = None
+    if checkpoints:
+        checkpoint = TrainingCheckpoints(
+            checkpoint_directory(algorithm.table_name),
+            training_key(csr, algorithm, seed,
+                         warm_start=warm_q is not None),
+            checkpoint_interval)
+    next_hop = np.full((len(goal_ids), len(goal_ids)), -1, dtype=np.int32)
+    q_path = q_table_path(algorithm.table_name)
+    os.makedirs(os.path.dirname(q_path), exist_ok=True)
+    q_values = np.lib.format.open_memmap(q_path + ".tmp",
+                                         mode="w+",
+                                         dtype=np.float32,
+                                         shape=(len(goal_ids),
+                                                csr.edge_count))
+
+    def finish(done: int, goal_id: int, next_vertices: np.ndarray,
+               q: np.ndarray) -> None:
+        goal_vertex = g.get_vertex_by_id(goal_id)
+        next_hop[goal_vertex.index] = next_vertices
+        q_values[goal_vertex.index] = q
+        if csv_tables:
+            write_table_q(csr.ids,
+                          csr.ids[next_vertices],
+                          file_name=f"table_q_{goal_id}.csv")
+        if progress is not None:
+            progress(done, len(goal_ids), goal_vertex)
+
+    run_goals(g, goal_ids, algorithm, finish, workers, seed, metrics,
+              initial_q, checkpoint)
+
+    q_values.flush()
+    del q_values
+    os.replace(q_path + ".tmp", q_path)
+    save_route_matrix(csr, next_hop, algorithm.table_name)
+    if checkpoint is not None:
+        checkpoint.clear()
+
+
+# create table q for every vertex training all goals together
+def full_run_multi_goal(csv_tables: bool = False,
+                        **options) -> MultiGoalQLearning:
     g = Graph()
     g.read_csv()
+    engine = MultiGoalQLearning(g, **options)
+    engine.train(q_table_path("qlearning"))
+    engine.save_tables(csv_tables=csv_tables)
+    return engine
+
+
+# create table_q.csv for only one vertex, the same seed gives the same
+# table. checkpoints and warm_start work like in full_run, the checkpoint
+# is kept in table_q/checkpoints/<name>/single/
+def single_run(start_id,
+               goal_id,
+               algorithm: Agent,
+               seed: int = None,
+               checkpoints: bool = False,
+               checkpoint_interval: float = CHECKPOINT_INTERVAL,
+               warm_start: bool = False):
+    g = Graph()
+    g.read_csv()
+    csr = g.compiled()
     start_vertex = g.get_vertex_by_id(start_id)
     g.set_start(start_vertex)
     goal_vertex = g.get_vertex_by_id(goal_id)
     g.set_goal(goal_vertex)
     g.define_reward(10.0, g.goal)
 
-    a = algorithm(g)
-
-    a.train()
+    warm_q = saved_q_table(algorithm.table_name, csr) if warm_start \
+        else None
+    if warm_q is not None:
+        csr.q[:] = warm_q[goal_vertex.index]
+
+    checkpoint = None
+    if checkpoints:
+        checkpoint = TrainingCheckpoints(
+            os.path.join(checkpoint_directory(algorithm.table_name),
+                         "single"),
+            training_key(csr,
+                         algorithm,
+                         seed,
+                         start=start_vertex.id,
+                         warm_start=warm_q is not None),
+            checkpoint_interval)
+
+    a = algorithm(g, seed=seed)
+
+    train_agent(a, goal_vertex.id, checkpoint)
+    if checkpoint is not None:
+        checkpoint.clear()
 
     save_table_q(g, file_name=f"table_q_{goal_id}.csv")
 
@@ -0,0 +1,508 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+RL_ALGORITHMS = ("qlearning", "sarsa")
+SEARCH_ALGORITHMS = ("astar", "largura", "profundidade", "dijkstra")
+
+# binary route matrix: header, vertex ids, V x V next hop matrix (row =
+# goal, column = vertex, values are dense indexes or -1) and the optional
+# distance matrix and stored paths sections, each aligned to 8 bytes
+MATRIX_MAGIC = b"RTAB"
+MATRIX_VERSION = 1
+MATRIX_HEADER = struct.Struct("<4sIIIQQ")
+HAS_DISTANCE = 1
+HAS_PATHS = 2
+
+
+# the next hops of a route table never reach its goal from the start
+class NoRouteError(KeyError):
+    pass
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+
+# offsets of every section of a route matrix file and the file size
+def _matrix_layout(node_count: int, flags: int,
+                   path_node_count: int) -> tuple:
+    layout = {}
+    offset = MATRIX_HEADER.size
+    sections = [("ids", np.int64, (node_count, )),
+                ("next_hop", np.int32, (node_count, node_count))]
+    if flags & HAS_DISTANCE:
+        sections.append(("distance", np.float64, (node_count, node_count)))
+    if flags & HAS_PATHS:
+        sections.append(
+            ("path_offsets", np.int64, (node_count, node_count + 1)))
+        sections.append(("path_nodes", np.int32, (path_node_count, )))
+    for name, dtype, shape in sections:
+        offset = _aligned(offset)
+        layout[name] = (offset, dtype, shape)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, offset
+
+
+# write the route tables of every goal of one algorithm in a single file,
+# path_offsets (V x V + 1) index into path_nodes like in RouteTable
+def write_route_matrix(path: str,
+                       ids: np.ndarray,
+                       next_hop: np.ndarray,
+                       distance: np.ndarray = None,
+                       path_offsets: np.ndarray = None,
+                       path_nodes: np.ndarray = None,
+                       checksum: int = 0) -> None:
+    node_count = len(ids)
+    flags = 0
+    if distance is not None:
+        flags |= HAS_DISTANCE
+    if path_offsets is not None:
+        flags |= HAS_PATHS
+    path_node_count = len(path_nodes) if path_nodes is not None else 0
+    layout, size = _matrix_layout(node_count, flags, path_node_count)
+
+    arrays = {
+        "ids": ids,
+        "next_hop": next_hop,
+        "distance": distance,
+        "path_offsets": path_offsets,
+        "path_nodes": path_nodes
+    }
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # write to a temporary file first so readers never map a partial file
+    with open(path + ".tmp", "wb") as _file:
+        _file.write(
+            MATRIX_HEADER.pack(MATRIX_MAGIC, MATRIX_VERSION, node_count,
+                               flags, checksum, path_node_count))
+        for name, (offset, dtype, shape) in layout.items():
+            _file.seek(offset)
+            _file.write(
+                np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+        _file.truncate(size)
+    os.replace(path + ".tmp", path)
+
+
+# the graph a route matrix was built from, kept as
+# <directory>/graph_<checksum>.npz so an update can diff it with the csv
+# files (see IncrementalUpdate)
+def table_graph_path(directory: str, checksum: int) -> str:
+    return os.path.join(directory, f"graph_{checksum:016x}.npz")
+
+
+def save_table_graph(graph, directory: str = "table_q") -> None:
+    path = table_graph_path(directory, graph.checksum())
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        graph.save(path)
+
+
+# read-only memory map of a route matrix file, pages are shared by every
+# process that maps the same file
+class RouteMatrix:
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as _file:
+            header = _file.read(MATRIX_HEADER.size)
+        magic, version, node_count, flags, checksum, path_node_count = \
+            MATRIX_HEADER.unpack(header)
+        if magic != MATRIX_MAGIC or version != MATRIX_VERSION:
+            raise ValueError(f"{path} is not a route matrix file")
+
+        self.node_count = node_count
+        self.checksum = checksum
+        self.distance = None
+        self.path_offsets = None
+        self.path_nodes = None
+
+        layout, _ = _matrix_layout(node_count, flags, path_node_count)
+        for name, (offset, dtype, shape) in layout.items():
+            if int(np.prod(shape)) == 0:
+                setattr(self, name, np.zeros(shape, dtype=dtype))
+                continue
+            setattr(
+                self, name,
+                np.memmap(path, dtype=dtype, mode="r", offset=offset,
+                          shape=shape))
+        self.index_of = {int(v): i for i, v in enumerate(self.ids)}
+
+    def table(self, goal_id: int) -> "RouteTable":
+        goal = self.index_of[int(goal_id)]
+        return RouteTable(
+            int(goal_id), self.index_of, self.ids, self.next_hop[goal],
+            self.distance[goal] if self.distance is not None else None,
+            self.path_offsets[goal] if self.path_offsets is not None else
+            None, self.path_nodes)
+
+
+# route table of one goal held in arrays indexed by dense vertex index
+#
+# rl tables only know the next vertex of every vertex (next_hop, -1 when
+# the vertex has no row). search tables store a whole path per start
+# vertex, kept as a flat array of indexes sliced by path_offsets.
+# compile() checks that the next hops reach the goal and keeps the hops
+# (depth) and distance of every vertex, so following them is bounded
+class RouteTable:
+
+    def __init__(self,
+                 goal_id: int,
+                 index_of: dict,
+                 ids: np.ndarray,
+                 next_hop: np.ndarray,
+                 distance: np.ndarray = None,
+                 path_offsets: np.ndarray = None,
+                 path_nodes: np.ndarray = None) -> None:
+        self.goal_id = goal_id
+        self.index_of = index_of
+        self.ids = ids
+        self.next_hop = next_hop
+        self.distance = distance
+        self.path_offsets = path_offsets
+        self.path_nodes = path_nodes
+        self.depth = None
+
+    # depth and distance to the goal of every vertex (-1 and inf when the
+    # next hops never reach it). a distance row of a route matrix is kept,
+    # it was computed the same way when the matrix was written
+    def compile(self, graph) -> "RouteTable":
+        depth, cost = graph.path_tree(self.next_hop,
+                                      self.index_of[self.goal_id])
+        self.depth = depth
+        if self.distance is None:
+            self.distance = cost
+        return self
+
+    # vertices whose next hops never reach the goal
+    def unreachable(self) -> int:
+        return int((self.depth < 0).sum())
+
+    def get_next(self, vertex_id: int) -> int:
+        next_index = int(self.next_hop[self.index_of[int(vertex_id)]])
+        if next_index < 0:
+            raise KeyError(str(vertex_id))
+        return int(self.ids[next_index])
+
+    # stored path of a search table, tables without stored paths follow
+    # the next hops instead. KeyError for an unknown start, NoRouteError
+    # when the search never reached the goal from it
+    def stored_path(self, start_id: int) -> list:
+        index = self.index_of[int(start_id)]
+        if int(start_id) == self.goal_id:
+            return [self.goal_id]
+        if self.path_offsets is None:
+            path = self.follow(index)
+        else:
+            lo, hi = self.path_offsets[index], self.path_offsets[index + 1]
+            path = self.ids[self.path_nodes[lo:hi]].tolist()
+        if not path:
+            raise NoRouteError(f"no route from {start_id} to {self.goal_id}")
+        return path
+
+    # ids from the start to the goal and its distance, NoRouteError when
+    # the next hops never reach the goal
+    def route(self, start_id: int) -> tuple:
+        index = self.index_of[int(start_id)]
+        path = self.follow(index)
+        if not path:
+            raise NoRouteError(f"no route from {start_id} to {self.goal_id}")
+        return path, float(self.distance[index])
+
+    # ids from the vertex index to the goal, empty if it is unreachable
+    def follow(self, index: int) -> list:
+        if self.depth is not None:
+            hops = int(self.depth[index])
+            if hops < 0:
+                return []
+            path = [index]
+            for _ in range(hops):
+                path.append(int(self.next_hop[path[-1]]))
+            return self.ids[path].tolist()
+        goal = self.index_of[self.goal_id]
+        path = [index]
+        while path[-1] != goal:
+            next_index = int(self.next_hop[path[-1]])
+            if next_index < 0 or len(path) > len(self.next_hop):
+                return []
+            path.append(next_index)
+        return self.ids[path].tolist()
+
+    @property
+    def nbytes(self) -> int:
+        total = self.next_hop.nbytes
+        if self.depth is not None:
+            total += self.depth.nbytes
+        if self.path_nodes is not None:
+            total += self.path_nodes.nbytes + self.path_offsets.nbytes
+        return total
+
+    @classmethod
+    def read_csv(cls,
+                 path: str,
+                 goal_id: int,
+                 index_of: dict,
+                 ids: np.ndarray,
+                 full_paths: bool = False) -> "RouteTable":
+        n = len(index_of)
+        next_hop = np.full(n, -1, dtype=np.int32)
+        rows = [None] * n
+        with open(path, "r", encoding="utf-8-sig") as _file:
+            for line in _file:
+                line = line.strip()
+                if not line:
+                    continue
+                row = [index_of[int(i)] for i in line.split(",")]
+                rows[row[0]] = row
+                next_hop[row[0]] = row[1] if len(row) > 1 else row[0]
+
+        if not full_paths:
+            return cls(goal_id, index_of, ids, next_hop)
+
+        lengths = np.array([len(row) if row is not None else 0
+                            for row in rows])
+        path_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=path_offsets[1:])
+        path_nodes = np.array([i for row in rows if row is not None
+                               for i in row],
+                              dtype=np.int32)
+        return cls(goal_id,
+                   index_of,
+                   ids,
+                   next_hop,
+                   path_offsets=path_offsets,
+                   path_nodes=path_nodes)
+
+
+# convert a table_q/<algorithm>/table_q_<goal>.csv tree into a single
+# route matrix file, stored paths are kept for the search algorithms
+def convert_csv_tables(graph, directory: str, path: str) -> None:
+    ids = graph.ids
+    full_paths = os.path.basename(os.path.normpath(directory)) \
+        in SEARCH_ALGORITHMS
+    n = graph.vertex_count
+    next_hop = np.full((n, n), -1, dtype=np.int32)
+    distance = np.full((n, n), np.inf)
+    path_offsets = np.zeros((n, n + 1), dtype=np.int64) if full_paths \
+        else None
+    path_nodes = []
+    total = 0
+
+    for goal, goal_id in enumerate(ids.tolist()):
+        table = RouteTable.read_csv(
+            os.path.join(directory, f"table_q_{goal_id}.csv"), goal_id,
+            graph.index_of, ids, full_paths)
+        next_hop[goal] = table.next_hop
+        if not full_paths:
+            distance[goal] = graph.cost_to_go(table.next_hop, goal)
+            continue
+
+        path_offsets[goal] = table.path_offsets + total
+        path_nodes.append(table.path_nodes)
+        total += len(table.path_nodes)
+        # distance of every stored path, summed from its start
+        for start in range(n):
+            nodes = table.path_nodes[table.path_offsets[start]:table.
+                                     path_offsets[start + 1]]
+            if start == goal:
+                distance[goal, start] = 0.0
+            elif len(nodes) > 0:
+                hops = 0.0
+                for a, b in zip(nodes[:-1], nodes[1:]):
+                    hops += graph.distances[graph.find_edge(int(a), int(b))]
+                distance[goal, start] = hops
+
+    write_route_matrix(path,
+                       ids,
+                       next_hop,
+                       distance,
+                       path_offsets,
+                       np.concatenate(path_nodes) if full_paths else None,
+                       checksum=graph.checksum())
+
+
+# bounded lru of route tables keyed by (algorithm, goal id), tables come
+# from <directory>/<algorithm>.bin when it exists (memory mapped) and
+# otherwise from <directory>/<algorithm>/table_q_<goal>.csv on first use.
+# with the graph, tables that follow next hops are compiled when they are
+# loaded. it is thread safe and threads missing the same table wait for a
+# single load instead of reading the file again
+class RouteTableCache:
+
+    def __init__(self,
+                 vertex_ids: list,
+                 directory: str = "table_q",
+                 max_tables: int = 4096,
+                 checksum: int = None,
+                 graph=None) -> None:
+        self.graph = graph
+        self.ids = np.array([int(v) for v in vertex_ids], dtype=np.int64)
+        self.index_of = {int(v): i for i, v in enumerate(self.ids)}
+        self.directory = directory
+        self.max_tables = max_tables
+        self.checksum = checksum
+        self.tables = OrderedDict()
+        self.matrices = {}
+        self.loading = {}
+        # bumped by reload, a load started before it is not cached
+        self.generation = 0
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # bytes of the cached tables, and a callback run (without the lock)
+        # every time a loaded table is added
+        self.table_bytes = 0
+        self.on_grow = None
+
+    def table_path(self, algorithm: str, goal_id: int) -> str:
+        return os.path.join(self.directory, algorithm,
+                            f"table_q_{goal_id}.csv")
+
+    def matrix_path(self, algorithm: str) -> str:
+        return os.path.join(self.directory, f"{algorithm}.bin")
+
+    # memory mapped matrix of the algorithm, None if it has no file
+    def matrix(self, algorithm: str) -> RouteMatrix:
+        matrix = self.matrices.get(algorithm)
+        if matrix is not None:
+            return matrix
+        with self.lock:
+            return self.open_matrix(algorithm)
+
+    def open_matrix(self, algorithm: str) -> RouteMatrix:
+        if algorithm not in self.matrices:
+            matrix = None
+            if os.path.exists(self.matrix_path(algorithm)):
+                matrix = RouteMatrix(self.matrix_path(algorithm))
+                if self.checksum is not None and \
+                        matrix.checksum != self.checksum:
+                    raise ValueError(
+                        f"{matrix.path} was built for another graph")
+            self.matrices[algorithm] = matrix
+        return self.matrices[algorithm]
+
+    def load(self, algorithm: str, goal_id: int) -> RouteTable:
+        matrix = self.matrix(algorithm)
+        if matrix is not None:
+            table = matrix.table(goal_id)
+        else:
+            table = RouteTable.read_csv(
+                self.table_path(algorithm, goal_id),
+                int(goal_id),
+                self.index_of,
+                self.ids,
+                full_paths=algorithm in SEARCH_ALGORITHMS)
+        if self.graph is not None and table.path_offsets is None:
+            table.compile(self.graph)
+        return table
+
+    # distance from every start to every goal (len(starts) x len(goals)),
+    # None when the algorithm has no distance matrix
+    def distances(self, algorithm: str, start_ids: list,
+                  goal_ids: list) -> np.ndarray:
+        matrix = self.matrix(algorithm)
+        if matrix is None or matrix.distance is None:
+            return None
+        starts = np.array([self.index_of[int(i)] for i in start_ids],
+                          dtype=np.int64)
+        goals = np.array([self.index_of[int(i)] for i in goal_ids],
+                         dtype=np.int64)
+        return np.asarray(matrix.distance[np.ix_(goals, starts)]).T
+
+    @property
+    def nbytes(self) -> int:
+        return self.table_bytes
+
+    # True when the table can be served without reading any file
+    def contains(self, algorithm: str, goal_id: int) -> bool:
+        return (algorithm, int(goal_id)) in self.tables
+
+    def get(self, algorithm: str, goal_id: int) -> RouteTable:
+        key = (algorithm, int(goal_id))
+        with self.lock:
+            table = self.tables.get(key)
+            if table is not None:
+                self.hits += 1
+                self.tables.move_to_end(key)
+                return table
+
+            future = self.loading.get(key)
+            generation = self.generation
+            if future is None:
+                future = self.loading[key] = Future()
+                self.misses += 1
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if not owner:
+            return future.result()
+
+        try:
+            table = self.load(algorithm, goal_id)
+        except BaseException as error:
+            with self.lock:
+                if self.loading.get(key) is future:
+                    del self.loading[key]
+            future.set_exception(error)
+            raise
+
+        with self.lock:
+            if self.generation == generation:
+                self.put(key, table)
+            if self.loading.get(key) is future:
+                del self.loading[key]
+        future.set_result(table)
+        if self.on_grow is not None:
+            self.on_grow()
+        return table
+
+    def put(self, key: tuple, table: RouteTable) -> None:
+        previous = self.tables.pop(key, None)
+        if previous is not None:
+            self.table_bytes -= previous.nbytes
+        self.tables[key] = table
+        self.table_bytes += table.nbytes
+        while len(self.tables) > self.max_tables:
+            _, evicted = self.tables.popitem(last=False)
+            self.table_bytes -= evicted.nbytes
+
+    # drop the cached tables, keeping the mapped matrices
+    def clear_tables(self) -> None:
+        with self.lock:
+            self.tables.clear()
+            self.table_bytes = 0
+
+    # load every table of the algorithms up to the cache size
+    def preload(self, algorithms=RL_ALGORITHMS + SEARCH_ALGORITHMS) -> None:
+        for algorithm in algorithms:
+            for goal_id in self.index_of:
+                if len(self.tables) >= self.max_tables:
+                    return
+                if self.matrix(algorithm) is not None or os.path.exists(
+                        self.table_path(algorithm, goal_id)):
+                    self.get(algorithm, goal_id)
+
+    # drop every cached table and mapping so the next lookups read the
+    # files again. loads in flight still answer the requests waiting for
+    # them, but later requests load the table again
+    def reload(self, preload: bool = False) -> None:
+        with self.lock:
+            self.generation += 1
+            self.loading = {}
+            self.tables.clear()
+            self.table_bytes = 0
+            self.matrices.clear()
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+        if preload:
+            self.preload()
@@ -0,0 +1,530 @@
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from Closures import ClosedVertexError, ClosureRegistry, Closures
+from CompactGraph import CompactGraph
+from InterestIndex import InterestIndex
+from InterestRouting import CANDIDATE_LIMIT, plan_tour
+from Landmarks import INDEX_ALGORITHMS, LandmarkIndex
+from Metrics import RoutingMetrics
+from ResultCache import LRUCache
+from RouteTables import (RL_ALGORITHMS, SEARCH_ALGORITHMS, NoRouteError,
+                         RouteTableCache)
+
+# times an interest tour is planned again over the landmark bounds
+TOUR_ROUNDS = 32
+
+# python objects kept per vertex besides the numpy arrays (index dicts,
+# names, categories, interest index), measured on a 100000 vertex venue
+VERTEX_BYTES = 640
+
+
+# everything the api needs to answer routes for one map: the compact graph,
+# the interest index, the route tables and the landmark index
+class Router:
+
+    def __init__(self,
+                 graph: CompactGraph,
+                 table_directory: str = "table_q",
+                 max_tables: int = 4096,
+                 max_legs: int = 100000,
+                 max_responses: int = 10000,
+                 max_reroute_vertices: int = 100000,
+                 interests_available: list = (),
+                 metrics: RoutingMetrics = None) -> None:
+        self.graph = graph
+        self.interest_index = InterestIndex(graph.ids, graph.categories,
+                                            graph.pos_x, graph.pos_y)
+        self.route_tables = RouteTableCache(graph.ids,
+                                            directory=table_directory,
+                                            max_tables=max_tables,
+                                            checksum=graph.checksum(),
+                                            graph=graph)
+        # disabled metrics unless the api asks for them
+        self.metrics = metrics if metrics is not None else RoutingMetrics(
+            enabled=False)
+        # (algorithm, start, goal) -> (path, distance) of the legs of the
+        # interest routes and normalized query -> response, both dropped
+        # when the tables are reloaded
+        self.legs = LRUCache(max_legs)
+        self.responses = LRUCache(max_responses)
+        self.landmarks = None
+        self.landmarks_lock = threading.Lock()
+        # closed vertices and edges, routes through them are searched again
+        # around the closures, settling at most max_reroute_vertices
+        self.closures = ClosureRegistry()
+        self.max_reroute_vertices = max_reroute_vertices
+        self.metrics.watch_cache(self.route_tables)
+        self.metrics.watch_results("leg", self.legs)
+        self.metrics.watch_results("response", self.responses)
+
+        unknown = self.interest_index.validate(list(interests_available))
+        if unknown:
+            warnings.warn("No vertex has the interests " + ", ".join(unknown))
+
+    # load the graph from the snapshot when it was built from the current
+    # csv files, otherwise parse the csv files and refresh the snapshot;
+    # report holds the time of every step
+    @classmethod
+    def from_files(cls,
+                   vertices_path: str = "vertices.csv",
+                   edges_path: str = "arestas.csv",
+                   snapshot_path: str = "graph.npz",
+                   table_directory: str = "table_q",
+                   **options) -> "Router":
+        report = {}
+        started = time.perf_counter()
+        source = CompactGraph.source_digest(vertices_path, edges_path)
+        graph = CompactGraph.load(snapshot_path, source)
+        if graph is not None:
+            report["graph_source"] = snapshot_path
+        else:
+            graph = CompactGraph.read_csv(vertices_path, edges_path)
+            report["graph_source"] = f"{vertices_path}, {edges_path}"
+            try:
+                graph.save(snapshot_path, source)
+            except OSError as error:
+                warnings.warn(f"Could not write {snapshot_path}: {error}")
+        report["graph_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        router = cls(graph, table_directory, **options)
+        # map the route matrices now, their pages are only read on use
+        algorithms = [
+            algorithm for algorithm in RL_ALGORITHMS + SEARCH_ALGORITHMS
+            if router.route_tables.matrix(algorithm) is not None
+        ]
+        report["index_ms"] = (time.perf_counter() - started) * 1000
+        report["vertices"] = graph.vertex_count
+        report["edges"] = graph.edge_count
+        report["route_matrices"] = algorithms
+        router.report = report
+        return router
+
+    # drop the cached route tables and every result built from them
+    def reload_tables(self, preload: bool = False) -> None:
+        self.route_tables.reload(preload)
+        self.legs.clear()
+        self.responses.clear()
+
+    # alt index of the graph, read from <table directory>/alt.npz (built
+    # and saved there when it is missing or outdated) on first use
+    def landmark_index(self) -> LandmarkIndex:
+        if self.landmarks is None:
+            with self.landmarks_lock:
+                if self.landmarks is None:
+                    self.landmarks = LandmarkIndex.open(
+                        self.graph, self.route_tables.directory)
+        return self.landmarks
+
+    # estimated memory of the graph, the landmark index and the cached
+    # route tables, with VERTEX_BYTES for the python objects of a vertex
+    @property
+    def nbytes(self) -> int:
+        total = self.graph.nbytes + self.route_tables.nbytes
+        total += VERTEX_BYTES * self.graph.vertex_count
+        if self.landmarks is not None:
+            total += self.landmarks.nbytes
+        return total
+
+    def index(self, vertex_id: int) -> int:
+        return self.graph.index_of[int(vertex_id)]
+
+    # close vertices and edges (pairs of vertex ids) for every request,
+    # KeyError if a vertex or edge does not exist
+    def close(self, vertices=(), edges=()) -> Closures:
+        for vertex_id in vertices:
+            self.index(vertex_id)
+        for start_id, end_id in edges:
+            self.edge_distance(start_id, end_id)
+        return self.closures.close(vertices, edges)
+
+    def reopen(self, vertices=(), edges=()) -> Closures:
+        return self.closures.reopen(vertices, edges)
+
+    # distance of the edge between two vertex ids, KeyError if there is none
+    def edge_distance(self, start_id: int, end_id: int) -> float:
+        slot = self.graph.find_edge(self.index(start_id), self.index(end_id))
+        if slot == -1:
+            raise KeyError(f"{start_id}-{end_id}")
+        return float(self.graph.distances[slot])
+
+    # route table of the goal, counting cache hits and timing the loads
+    def table(self, algorithm: str, goal_id: int):
+        metrics = self.metrics
+        if not metrics.enabled:
+            return self.route_tables.get(algorithm, goal_id)
+        if self.route_tables.contains(algorithm, goal_id):
+            metrics.table_lookups.inc(algorithm, "hit")
+            return self.route_tables.get(algorithm, goal_id)
+        metrics.table_lookups.inc(algorithm, "miss")
+        with metrics.table_load_seconds.time(algorithm):
+            return self.route_tables.get(algorithm, goal_id)
+
+    # get the path from search algorithms (BFS, DFS, A*) without interests
+    def get_path_search(self, start_id: int, goal_id: int, algorithm: str):
+        table = self.table(algorithm, goal_id)
+
+        with self.metrics.path_seconds.time(algorithm):
+            # get path from start to goal
+            path = table.stored_path(start_id)
+
+            # calculate the total distance
+            total_distance = 0
+            for i in range(len(path) - 1):
+                total_distance += self.edge_distance(path[i], path[i + 1])
+
+        return path, total_distance
+
+    # get the path from reinforcement learning algorithms (Q-Learning, SARSA) without interests
+    def get_path_rl(self, start_id: int, goal_id: int, algorithm: str):
+        # get table from start to goal
+        table = self.table(algorithm, goal_id)
+
+        with self.metrics.path_seconds.time(algorithm):
+            # the compiled table bounds the hops and knows the distance
+            path, total_distance = table.route(start_id)
+
+        return path, total_distance
+
+    # get the path from the landmark index (ALT), no route table is needed
+    def get_path_index(self, start_id: int, goal_id: int, algorithm: str):
+        landmarks = self.landmark_index()
+        with self.metrics.path_seconds.time(algorithm):
+            path, total_distance = landmarks.route(self.index(start_id),
+                                                   self.index(goal_id))
+            path = self.graph.ids[path].tolist()
+        return path, total_distance
+
+    # function answering the plain routes of the algorithm
+    def path_function(self, algorithm: str):
+        if algorithm in RL_ALGORITHMS:
+            return self.get_path_rl
+        if algorithm in INDEX_ALGORITHMS:
+            return self.get_path_index
+        return self.get_path_search
+
+    # closed vertices and edges (both directions) as dense indexes
+    def blocked_indexes(self, closures: Closures = None) -> tuple:
+        if not closures:
+            return frozenset(), frozenset()
+        index_of = self.graph.index_of
+        blocked_vertices = {
+            index_of[v]
+            for v in closures.vertices if v in index_of
+        }
+        blocked_edges = set()
+        for a, b in closures.edges:
+            if a in index_of and b in index_of:
+                blocked_edges.add((index_of[a], index_of[b]))
+                blocked_edges.add((index_of[b], index_of[a]))
+        return blocked_vertices, blocked_edges
+
+    # shortest path avoiding the closures, a* over the landmark index
+    def get_path_around(self, start_id: int, goal_id: int,
+                        closures: Closures):
+        for vertex_id in (start_id, goal_id):
+            if int(vertex_id) in closures.vertices:
+                raise ClosedVertexError(f"vertex {vertex_id} is closed")
+        blocked_vertices, blocked_edges = self.blocked_indexes(closures)
+        landmarks = self.landmark_index()
+        with self.metrics.path_seconds.time("reroute"):
+            path, total_distance = landmarks.route(self.index(start_id),
+                                                   self.index(goal_id),
+                                                   blocked_vertices,
+                                                   blocked_edges,
+                                                   self.max_reroute_vertices)
+            path = self.graph.ids[path].tolist()
+        return path, total_distance
+
+    # route of the algorithm, searched again around the closures only when
+    # it goes through one of them
+    def get_open_path(self,
+                      start_id: int,
+                      goal_id: int,
+                      algorithm: str,
+                      closures: Closures = None):
+        if closures and algorithm in INDEX_ALGORITHMS:
+            return self.get_path_around(start_id, goal_id, closures)
+        path, total_distance = self.path_function(algorithm)(start_id,
+                                                             goal_id,
+                                                             algorithm)
+        if not closures or not closures.blocks(path):
+            return path, total_distance
+        self.metrics.reroutes.inc(algorithm)
+        return self.get_path_around(start_id, goal_id, closures)
+
+    # path and distance of a leg between two vertexes, memoized by
+    # (algorithm, start, goal, closures). the path is a tuple shared by
+    # every caller
+    def get_leg(self,
+                start_id: int,
+                goal_id: int,
+                algorithm: str,
+                closures: Closures = None) -> tuple:
+        key = (algorithm, int(start_id), int(goal_id))
+        if closures:
+            key += (closures.vertices, closures.edges)
+        leg = self.legs.get(key)
+        if leg is not None:
+            return leg
+        path, distance = self.get_open_path(start_id, goal_id, algorithm,
+                                            closures)
+        leg = (tuple(path), distance)
+        self.legs.put(key, leg)
+        return leg
+
+    # choose and order the interest stops between start and goal with the
+    # smallest total route distance of the algorithm. closed vertices are
+    # never chosen, the distances of the tables ignore the other closures.
+    # NoRouteError when no choice of stops can be routed to the goal
+    def get_interest_stops(self,
+                           start_id: int,
+                           goal_id: int,
+                           max_interests: int,
+                           interests: list,
+                           algorithm: str,
+                           closures: Closures = None) -> list:
+        excluded = (start_id, goal_id)
+        if closures:
+            excluded += tuple(closures.vertices)
+        candidates = self.interest_index.vertices(interests, exclude=excluded)
+
+        # on large maps keep only the candidates closest to the start or goal
+        if len(candidates) > CANDIDATE_LIMIT:
+            nearby = set()
+            for vertex_id in (start_id, goal_id):
+                index = self.index(vertex_id)
+                nearby.update(
+                    self.interest_index.nearest(self.graph.pos_x[index],
+                                                self.graph.pos_y[index],
+                                                interests,
+                                                CANDIDATE_LIMIT // 2,
+                                                exclude=excluded))
+            candidates = [i for i in candidates if i in nearby]
+
+        points = [start_id] + candidates + [goal_id]
+        distance = None
+        if algorithm not in INDEX_ALGORITHMS:
+            distance = self.route_tables.distances(algorithm, points, points)
+        try:
+            if distance is None:
+                tour = self.plan_tour_on_bounds(points, max_interests,
+                                                algorithm, closures)
+            else:
+                tour = plan_tour(distance, max_interests)
+        except NoRouteError:
+            raise NoRouteError(
+                f"no route from {start_id} to {goal_id} through "
+                f"{min(max_interests, len(candidates))} interest stops"
+            ) from None
+        return [points[i] for i in tour]
+
+    # tour for tables without a distance matrix, planned over the landmark
+    # bounds of the distances: the bounds of the legs of the planned tour
+    # are replaced by their route distance and the tour planned again, until
+    # it only uses legs already routed (at most TOUR_ROUNDS times). the tour
+    # is then as short as the one over every distance, routing a few legs
+    # instead of every pair of points
+    def plan_tour_on_bounds(self,
+                            points: list,
+                            max_interests: int,
+                            algorithm: str,
+                            closures: Closures = None) -> list:
+        landmarks = self.landmark_index()
+        distance = landmarks.pair_bounds([self.index(p) for p in points])
+        routed = np.eye(len(points), dtype=bool)
+        for _ in range(TOUR_ROUNDS):
+            tour = plan_tour(distance, max_interests)
+            route = [0] + tour + [len(points) - 1]
+            legs = [(a, b) for a, b in zip(route, route[1:])
+                    if not routed[a, b]]
+            if not legs:
+                break
+            for a, b in legs:
+                try:
+                    distance[a, b] = self.get_leg(points[a], points[b],
+                                                  algorithm, closures)[1]
+                except KeyError:
+                    distance[a, b] = np.inf
+                routed[a, b] = True
+        return tour
+
+    # go through the interest stops and then to the goal, joining the legs
+    def get_path_interest(self,
+                          start_id: int,
+                          goal_id: int,
+                          max_interests: int,
+                          interests: list,
+                          algorithm: str,
+                          closures: Closures = None):
+        with self.metrics.interest_seconds.time(algorithm):
+            stops = self.get_interest_stops(start_id, goal_id, max_interests,
+                                            interests, algorithm, closures)
+
+        # go through the interest vertexes
+        total_distance = 0
+        total_path = []
+        current = start_id
+        for stop in stops:
+            path, distance = self.get_leg(current, stop, algorithm, closures)
+
+            # save the path and the total distance
+            total_path += path
+            total_distance += distance
+            total_path.pop(
+            )  # remove the last vertex of the path because it is the same as the first vertex of the next path
+
+            current = stop
+
+        # get the path from the last interest vertex to the goal
+        path, distance = self.get_leg(current, goal_id, algorithm, closures)
+
+        # save the path and the total distance
+        total_path += path
+        total_distance += distance
+
+        return total_path, total_distance
+
+    def get_path_search_interest(self,
+                                 start_id: int,
+                                 goal_id: int,
+                                 max_interests: int,
+                                 interests: list,
+                                 algorithm: str,
+                                 closures: Closures = None):
+        return self.get_path_interest(start_id, goal_id, max_interests,
+                                      interests, algorithm, closures)
+
+    def get_path_rl_interest(self,
+                             start_id: int,
+                             goal_id: int,
+                             max_interests: int,
+                             interests: list,
+                             algorithm: str,
+                             closures: Closures = None):
+        return self.get_path_interest(start_id, goal_id, max_interests,
+                                      interests, algorithm, closures)
+
+    # path between two vertexes, with interests if they are given, counted
+    # and timed by algorithm when the metrics are enabled. closed adds
+    # closures of this request to the live ones
+    def get_path(self,
+                 id_origin: int,
+                 id_target: int,
+                 algorithm: str,
+                 max_interests: int = 0,
+                 interests: str | None = None,
+                 closed: Closures = None) -> dict:
+        metrics = self.metrics
+        if not metrics.enabled:
+            return self.find_path(id_origin, id_target, algorithm,
+                                  max_interests, interests, closed)
+
+        labels = (algorithm.lower(),
+                  "plain" if interests is None else "interest")
+        try:
+            with metrics.request_seconds.time(*labels):
+                result = self.find_path(id_origin, id_target, algorithm,
+                                        max_interests, interests, closed)
+        except Exception as error:
+            metrics.requests.inc(*labels, type(error).__name__)
+            raise
+        metrics.requests.inc(*labels, "ok")
+        return result
+
+    def find_path(self,
+                 id_origin: int,
+                 id_target: int,
+                 algorithm: str,
+                 max_interests: int = 0,
+                 interests: str | None = None,
+                 closed: Closures = None) -> dict:
+        path = []
+        algorithm = algorithm.lower()
+        closures = self.closures.snapshot()
+        if closed:
+            closures = closures.merge(closed)
+
+        # sanitize the inputs of interests
+        if interests is not None:
+            interests = interests.split(",")
+            interests = [i.lower().strip() for i in interests]
+
+        # the order of the interests does not change the route and
+        # max_interests only matters when there are interests
+        key = (int(id_origin), int(id_target), algorithm,
+               tuple(sorted(set(interests))) if interests is not None else
+               None, int(max_interests) if interests is not None else 0,
+               closures.vertices, closures.edges)
+        result = self.responses.get(key)
+        if result is not None:
+            return dict(result)
+
+        # check if the algorithm is a search algorithm
+        if algorithm in SEARCH_ALGORITHMS:
+            # verify if the user wants to get the path without interests
+            if interests is None:
+                path, total_distance = self.get_open_path(
+                    start_id=id_origin,
+                    goal_id=id_target,
+                    algorithm=algorithm,
+                    closures=closures)
+            # otherwise, get the path with interests
+            else:
+                path, total_distance = self.get_path_search_interest(
+                    start_id=id_origin,
+                    goal_id=id_target,
+                    max_interests=max_interests,
+                    interests=interests,
+                    algorithm=algorithm,
+                    closures=closures)
+
+        # check if the algorithm is a reinforcement learning algorithm
+        if algorithm in RL_ALGORITHMS:
+            # verify if the user wants to get the path without interests
+            if interests is None:
+                path, total_distance = self.get_open_path(
+                    start_id=id_origin,
+                    goal_id=id_target,
+                    algorithm=algorithm,
+                    closures=closures)
+            # otherwise, get the path with interests
+            else:
+                path, total_distance = self.get_path_rl_interest(
+                    start_id=id_origin,
+                    goal_id=id_target,
+                    max_interests=max_interests,
+                    interests=interests,
+                    algorithm=algorithm,
+                    closures=closures)
+
+        # check if the algorithm is answered by the landmark index
+        if algorithm in INDEX_ALGORITHMS:
+            if interests is None:
+                path, total_distance = self.get_open_path(
+                    start_id=id_origin,
+                    goal_id=id_target,
+                    algorithm=algorithm,
+                    closures=closures)
+            else:
+                path, total_distance = self.get_path_interest(
+                    start_id=id_origin,
+                    goal_id=id_target,
+                    max_interests=max_interests,
+                    interests=interests,
+                    algorithm=algorithm,
+                    closures=closures)
+
+        # return a json with the path and the total distance
+        result = {
+            "path": path,
+            "total_distance": total_distance,
+            "steps": len(path) - 1
+        }
+        self.responses.put(key, result)
+        return dict(result)
+
@@ -0,0 +1,198 @@
+import heapq
+import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from CompactGraph import CompactGraph
+from RouteTables import save_table_graph, write_route_matrix
+
+# the search tables are trees rooted at the goal: next_hop[v] is the
+# vertex after v on the way to the goal, -1 when the goal is unreachable.
+# arestas.csv is undirected, so a single search starting at the goal gives
+# the route of every vertex
+
+
+# breadth first search, fewest hops
+def bfs_next_hops(graph: CompactGraph, goal: int) -> np.ndarray:
+    next_hop = np.full(graph.vertex_count, -1, dtype=np.int32)
+    next_hop[goal] = goal
+    queue = deque([goal])
+    offsets, neighbors = graph.offsets, graph.neighbors
+    while queue:
+        current = queue.popleft()
+        for slot in range(offsets[current], offsets[current + 1]):
+            vertex = neighbors[slot]
+            if next_hop[vertex] == -1:
+                next_hop[vertex] = current
+                queue.append(vertex)
+    return next_hop
+
+
+# depth first search, the route of a vertex is its branch of the dfs tree
+def dfs_next_hops(graph: CompactGraph, goal: int) -> np.ndarray:
+    next_hop = np.full(graph.vertex_count, -1, dtype=np.int32)
+    next_hop[goal] = goal
+    offsets, neighbors = graph.offsets, graph.neighbors
+    # (vertex, next edge slot to visit)
+    stack = [(goal, offsets[goal])]
+    while stack:
+        current, slot = stack[-1]
+        if slot == offsets[current + 1]:
+            stack.pop()
+            continue
+        stack[-1] = (current, slot + 1)
+        vertex = neighbors[slot]
+        if next_hop[vertex] == -1:
+            next_hop[vertex] = current
+            stack.append((vertex, offsets[vertex]))
+    return next_hop
+
+
+# dijkstra with a binary heap, shortest distance to the goal
+def dijkstra_next_hops(graph: CompactGraph, goal: int) -> np.ndarray:
+    next_hop = np.full(graph.vertex_count, -1, dtype=np.int32)
+    distance = np.full(graph.vertex_count, np.inf)
+    offsets, neighbors = graph.offsets, graph.neighbors
+    distances = graph.distances
+    next_hop[goal] = goal
+    distance[goal] = 0.0
+    heap = [(0.0, goal)]
+    done = np.zeros(graph.vertex_count, dtype=bool)
+    while heap:
+        current_distance, current = heapq.heappop(heap)
+        if done[current]:
+            continue
+        done[current] = True
+        for slot in range(offsets[current], offsets[current + 1]):
+            vertex = neighbors[slot]
+            new_distance = current_distance + distances[slot]
+            if new_distance < distance[vertex]:
+                distance[vertex] = new_distance
+                next_hop[vertex] = current
+                heapq.heappush(heap, (new_distance, vertex))
+    return next_hop
+
+
+def heuristic(graph: CompactGraph, a: int, b: int) -> float:
+    return math.sqrt((graph.pos_x[b] - graph.pos_x[a])**2 +
+                     (graph.pos_y[b] - graph.pos_y[a])**2)
+
+
+# a* from start to goal with the straight line distance as heuristic,
+# returns the path as dense indexes (empty if there is none)
+def astar_path(graph: CompactGraph, start: int, goal: int) -> list:
+    offsets, neighbors = graph.offsets, graph.neighbors
+    distances = graph.distances
+    cost = {start: 0.0}
+    parent = {start: start}
+    heap = [(heuristic(graph, start, goal), start)]
+    closed = set()
+    while heap:
+        _, current = heapq.heappop(heap)
+        if current == goal:
+            path = [goal]
+            while path[-1] != start:
+                path.append(parent[path[-1]])
+            return path[::-1]
+        if current in closed:
+            continue
+        closed.add(current)
+        for slot in range(offsets[current], offsets[current + 1]):
+            vertex = int(neighbors[slot])
+            new_cost = cost[current] + distances[slot]
+            if new_cost < cost.get(vertex, math.inf):
+                cost[vertex] = new_cost
+                parent[vertex] = current
+                heapq.heappush(
+                    heap, (new_cost + heuristic(graph, vertex, goal), vertex))
+    return []
+
+
+# a* from every vertex to the goal; the vertices of each path found take
+# it as their route, later searches stop copying at the first vertex that
+# already has a route since the rest of an optimal path is optimal too
+def astar_next_hops(graph: CompactGraph, goal: int) -> np.ndarray:
+    next_hop = np.full(graph.vertex_count, -1, dtype=np.int32)
+    next_hop[goal] = goal
+    for start in range(graph.vertex_count):
+        if next_hop[start] != -1:
+            continue
+        path = astar_path(graph, start, goal)
+        for a, b in zip(path[:-1], path[1:]):
+            if next_hop[a] != -1:
+                break
+            next_hop[a] = b
+    return next_hop
+
+
+SEARCHES = {
+    "largura": bfs_next_hops,
+    "profundidade": dfs_next_hops,
+    "astar": astar_next_hops,
+    "dijkstra": dijkstra_next_hops
+}
+
+# graph of the worker processes
+_worker_graph = None
+
+
+def _init_worker(graph: CompactGraph) -> None:
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _search_in_worker(algorithm: str, goal: int) -> np.ndarray:
+    return SEARCHES[algorithm](_worker_graph, goal)
+
+
+# next hops of the given goals (one row per goal) of one algorithm
+def search_rows(graph: CompactGraph,
+                algorithm: str,
+                goals,
+                workers: int = 1) -> np.ndarray:
+    goals = [int(goal) for goal in goals]
+    if workers <= 1:
+        rows = [SEARCHES[algorithm](graph, goal) for goal in goals]
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(graph, )) as executor:
+            rows = list(
+                executor.map(_search_in_worker, [algorithm] * len(goals),
+                             goals,
+                             chunksize=max(len(goals) // (workers * 4), 1)))
+    return np.array(rows, dtype=np.int32).reshape(len(goals),
+                                                  graph.vertex_count)
+
+
+# next hop matrix (row = goal) of one algorithm
+def build_next_hops(graph: CompactGraph,
+                    algorithm: str,
+                    workers: int = 1) -> np.ndarray:
+    return search_rows(graph, algorithm, range(graph.vertex_count), workers)
+
+
+# write table_q/<algorithm>.bin for every search algorithm from
+# vertices.csv / arestas.csv
+def build_search_tables(algorithms=tuple(SEARCHES),
+                        workers: int = 1,
+                        directory: str = "table_q") -> None:
+    graph = CompactGraph.read_csv()
+    for algorithm in algorithms:
+        next_hop = build_next_hops(graph, algorithm, workers)
+        distance = np.array([
+            graph.cost_to_go(next_hop[goal], goal)
+            for goal in range(graph.vertex_count)
+        ]).reshape(next_hop.shape)
+        write_route_matrix(f"{directory}/{algorithm}.bin",
+                           graph.ids,
+                           next_hop,
+                           distance,
+                           checksum=graph.checksum())
+    save_table_graph(graph, directory)
+
+
+if __name__ == "__main__":
+    build_search_tables()
@@ -0,0 +1,190 @@
+import math
+import os
+
+import numpy as np
+
+from CompactGraph import CompactGraph
+
+# synthetic maps for the benchmarks, every generator returns a connected
+# undirected CompactGraph with ids 0..n-1, categories and positions like
+# vertices.csv, and write_csv saves it as vertices.csv / arestas.csv
+
+# categories of the shops, "#" is a corridor like in vertices.csv
+CATEGORIES = [
+    "Tech", "Food", "Entertainment", "Fashion", "Market", "Automotive",
+    "Drink", "Fit", "Games"
+]
+# distance between neighbouring positions, close to the one of the map
+SPACING = 10.0
+
+
+# euclidean length of every edge, rounded like arestas.csv
+def edge_lengths(pos_x: np.ndarray, pos_y: np.ndarray, start: np.ndarray,
+                 end: np.ndarray) -> np.ndarray:
+    length = np.hypot(pos_x[start] - pos_x[end], pos_y[start] - pos_y[end])
+    return np.maximum(np.round(length, 1), 0.1)
+
+
+# build the graph from undirected pairs, storing both directions
+def undirected_graph(start, end, pos_x, pos_y, categories) -> CompactGraph:
+    start = np.asarray(start, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64)
+    distance = edge_lengths(pos_x, pos_y, start, end)
+    n = len(pos_x)
+    return CompactGraph.from_edges(
+        np.arange(n),
+        np.concatenate([start, end]),
+        np.concatenate([end, start]),
+        np.concatenate([distance, distance]),
+        names=["#" if c == "#" else f"{c} {i}" for i, c in enumerate(categories)],
+        categories=list(categories),
+        pos_x=pos_x,
+        pos_y=pos_y)
+
+
+# a category for every vertex, shops with probability shop_ratio
+def random_categories(n: int, rng: np.random.Generator,
+                      shop_ratio: float = 0.6) -> list:
+    shop = rng.random(n) < shop_ratio
+    chosen = rng.integers(0, len(CATEGORIES), n)
+    return [CATEGORIES[c] if s else "#" for s, c in zip(shop, chosen)]
+
+
+# square grid of about n vertices with jittered positions, 4 neighbours
+def grid_graph(n: int, seed: int = 0) -> CompactGraph:
+    rng = np.random.default_rng(seed)
+    side = math.ceil(math.sqrt(n))
+    index = np.arange(n)
+    row, column = index // side, index % side
+    pos_x = column * SPACING + rng.uniform(-2, 2, n)
+    pos_y = row * SPACING + rng.uniform(-2, 2, n)
+
+    right = index[(column + 1 < side) & (index + 1 < n)]
+    down = index[index + side < n]
+    start = np.concatenate([right, down])
+    end = np.concatenate([right + 1, down + side])
+    return undirected_graph(start, end, pos_x, pos_y,
+                            random_categories(n, rng))
+
+
+# n random points joined when closer than the radius giving about `degree`
+# neighbours per vertex, components are chained to make it connected
+def random_geometric_graph(n: int, seed: int = 0,
+                           degree: float = 6.0) -> CompactGraph:
+    rng = np.random.default_rng(seed)
+    size = math.sqrt(n) * SPACING
+    pos_x = rng.uniform(0, size, n)
+    pos_y = rng.uniform(0, size, n)
+    radius = SPACING * math.sqrt(degree / math.pi)
+
+    # bucket the points in cells of the radius, pairs can only be in the
+    # same or in neighbouring cells
+    cells = max(int(size // radius), 1)
+    cell_x = np.minimum((pos_x // radius).astype(np.int64), cells - 1)
+    cell_y = np.minimum((pos_y // radius).astype(np.int64), cells - 1)
+    cell = cell_y * cells + cell_x
+    order = np.argsort(cell, kind="stable")
+    counts = np.bincount(cell, minlength=cells * cells)
+    first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    width = int(counts.max())
+    rank = np.arange(n) - first[cell[order]]
+    members = np.full((cells * cells, width), -1, dtype=np.int64)
+    members[cell[order], rank] = order
+
+    start, end = [], []
+    all_x, all_y = np.meshgrid(np.arange(cells), np.arange(cells))
+    all_x, all_y = all_x.ravel(), all_y.ravel()
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        other_x, other_y = all_x + dx, all_y + dy
+        inside = (other_x < cells) & (other_y >= 0) & (other_y < cells)
+        a = members[(all_y * cells + all_x)[inside]]
+        b = members[(other_y * cells + other_x)[inside]]
+        a = np.repeat(a[:, :, None], width, axis=2)
+        b = np.repeat(b[:, None, :], width, axis=1)
+        pair = (a >= 0) & (b >= 0)
+        if (dx, dy) == (0, 0):
+            pair &= a < b
+        a, b = a[pair], b[pair]
+        close = np.hypot(pos_x[a] - pos_x[b], pos_y[a] - pos_y[b]) < radius
+        start.append(a[close])
+        end.append(b[close])
+    start, end = np.concatenate(start), np.concatenate(end)
+
+    categories = random_categories(n, rng)
+    graph = undirected_graph(start, end, pos_x, pos_y, categories)
+    label = graph.components()
+    while len(np.unique(label)) > 1:
+        # join the root of every component to the closest vertex outside it
+        roots = np.unique(label)
+        closest = []
+        for root in roots.tolist():
+            distance = np.hypot(pos_x - pos_x[root], pos_y - pos_y[root])
+            distance[label == root] = np.inf
+            closest.append(int(distance.argmin()))
+        start = np.concatenate([start, roots])
+        end = np.concatenate([end, closest])
+        graph = undirected_graph(start, end, pos_x, pos_y, categories)
+        label = graph.components()
+    return graph
+
+
+# shopping mall: a grid of corridors ("#") with shops hanging off the
+# corridor vertices, the first vertex is the entrance like in the map
+def venue_graph(n: int, seed: int = 0, shops_per_corridor: int = 2) -> CompactGraph:
+    rng = np.random.default_rng(seed)
+    corridors = max(n // (shops_per_corridor + 1), 1)
+    side = math.ceil(math.sqrt(corridors))
+    index = np.arange(corridors)
+    row, column = index // side, index % side
+    corridor_x = column * SPACING * 2.5
+    corridor_y = row * SPACING * 2.5
+
+    right = index[(column + 1 < side) & (index + 1 < corridors)]
+    down = index[index + side < corridors]
+    start = [right, down]
+    end = [right + 1, down + side]
+
+    # every shop has its door on a random corridor vertex
+    shops = n - corridors
+    door = rng.integers(0, corridors, shops)
+    angle = rng.uniform(0, 2 * math.pi, shops)
+    shop_x = corridor_x[door] + np.cos(angle) * SPACING * 0.8
+    shop_y = corridor_y[door] + np.sin(angle) * SPACING * 0.8
+    start.append(door)
+    end.append(np.arange(corridors, n))
+
+    categories = ["#"] * corridors + [
+        CATEGORIES[c] for c in rng.integers(0, len(CATEGORIES), shops)
+    ]
+    return undirected_graph(np.concatenate(start), np.concatenate(end),
+                            np.concatenate([corridor_x, shop_x]),
+                            np.concatenate([corridor_y, shop_y]), categories)
+
+
+GENERATORS = {
+    "grid": grid_graph,
+    "geometric": random_geometric_graph,
+    "venue": venue_graph
+}
+
+
+# save the graph as <directory>/vertices.csv and <directory>/arestas.csv,
+# every undirected edge once
+def write_csv(graph: CompactGraph, directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "vertices.csv"), "w",
+              encoding="utf-8") as _file:
+        for i in range(graph.vertex_count):
+            _file.write(f"{graph.ids[i]},{graph.names[i]},"
+                        f"{graph.categories[i]},{graph.pos_x[i]:.1f},"
+                        f"{graph.pos_y[i]:.1f}\n")
+
+    sources = graph.edge_sources()
+    once = sources < graph.neighbors
+    with open(os.path.join(directory, "arestas.csv"), "w",
+              encoding="utf-8") as _file:
+        _file.writelines(
+            f"{graph.ids[a]},{graph.ids[b]},{d}\n"
+            for a, b, d in zip(sources[once].tolist(),
+                               graph.neighbors[once].tolist(),
+                               graph.distances[once].tolist()))
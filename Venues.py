@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from Metrics import RoutingMetrics
+from Routing import Router
+
+# routers of many venues in one process
+#
+# <directory>/<venue>/ holds the vertices.csv, arestas.csv, graph.npz and
+# table_q/ of a venue. a venue is loaded on its first request (threads
+# asking for the same venue wait for a single load) and, after every load,
+# the least recently used venues are dropped while the estimated memory of
+# the loaded ones (Router.nbytes) is over memory_budget bytes. the budget
+# is checked again every time a venue caches a route table. resident
+# venues and the venue just loaded are never dropped; when they alone are
+# over the budget their cached route tables are dropped instead, least
+# recently used venue first (they are read again from the mapped files)
+VENUE_NAME = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+
+class VenueRegistry:
+
+    def __init__(self,
+                 directory: str = "venues",
+                 memory_budget: int = 1 << 30,
+                 resident=(),
+                 metrics: bool = True,
+                 **options) -> None:
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.resident = frozenset(resident)
+        self.metrics = metrics
+        # Router options of every venue (max_tables, max_legs, ...)
+        self.options = options
+        self.routers = OrderedDict()
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+        self.table_evictions = 0
+
+    # directory of the venue, KeyError for names that are not a venue
+    def path(self, venue: str) -> str:
+        path = os.path.join(self.directory, venue)
+        if not VENUE_NAME.fullmatch(venue) or not os.path.isdir(path):
+            raise KeyError(venue)
+        return path
+
+    def names(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if VENUE_NAME.fullmatch(name)
+            and os.path.isdir(os.path.join(self.directory, name)))
+
+    def load(self, venue: str) -> Router:
+        path = self.path(venue)
+        router = Router.from_files(
+            os.path.join(path, "vertices.csv"),
+            os.path.join(path, "arestas.csv"),
+            os.path.join(path, "graph.npz"),
+            os.path.join(path, "table_q"),
+            metrics=RoutingMetrics(enabled=self.metrics),
+            **self.options)
+        router.route_tables.on_grow = self.check_budget
+        return router
+
+    # True when the venue can be served without loading it
+    def contains(self, venue: str) -> bool:
+        return venue in self.routers
+
+    def get(self, venue: str) -> Router:
+        with self.lock:
+            router = self.routers.get(venue)
+            if router is not None:
+                self.routers.move_to_end(venue)
+                return router
+
+            future = self.loading.get(venue)
+            if future is None:
+                future = self.loading[venue] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return future.result()
+
+        try:
+            router = self.load(venue)
+        except BaseException as error:
+            with self.lock:
+                self.loading.pop(venue, None)
+            future.set_exception(error)
+            raise
+
+        with self.lock:
+            self.routers[venue] = router
+            self.loading.pop(venue, None)
+            self.loads += 1
+            self.trim(keep=venue)
+        future.set_result(router)
+        return router
+
+    def check_budget(self) -> None:
+        with self.lock:
+            self.trim()
+
+    # drop the least recently used venues, then the cached route tables of
+    # the kept ones, while the loaded ones are over the budget. called with
+    # the lock held
+    def trim(self, keep: str = None) -> None:
+        sizes = {
+            venue: router.nbytes
+            for venue, router in self.routers.items()
+        }
+        total = sum(sizes.values())
+        for venue in list(self.routers):
+            if total <= self.memory_budget:
+                return
+            if venue == keep or venue in self.resident:
+                continue
+            del self.routers[venue]
+            total -= sizes[venue]
+            self.evictions += 1
+        for router in self.routers.values():
+            if total <= self.memory_budget:
+                return
+            total -= router.route_tables.nbytes
+            router.route_tables.clear_tables()
+            self.table_evictions += 1
+
+    # load the resident venues now instead of on their first request
+    def preload(self) -> None:
+        for venue in sorted(self.resident):
+            self.get(venue)
+
+    # every venue with its estimated memory when it is loaded
+    def status(self) -> dict:
+        with self.lock:
+            loaded = {
+                venue: router.nbytes
+                for venue, router in self.routers.items()
+            }
+            loads, evictions = self.loads, self.evictions
+            table_evictions = self.table_evictions
+        return {
+            "venues": [{
+                "name": name,
+                "loaded": name in loaded,
+                "resident": name in self.resident,
+                "nbytes": loaded.get(name, 0)
+            } for name in self.names()],
+            "nbytes": sum(loaded.values()),
+            "memory_budget": self.memory_budget,
+            "loads": loads,
+            "evictions": evictions,
+            "table_evictions": table_evictions
+        }
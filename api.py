@@ -1,310 +1,412 @@
+import json
 import math
+import resource
 import time
-from fastapi import FastAPI, Query
-from fastapi.responses import RedirectResponse
+from contextlib import asynccontextmanager, contextmanager
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import (JSONResponse, PlainTextResponse,
+                               RedirectResponse, StreamingResponse)
 from fastapi.openapi.utils import get_openapi
+from starlette.concurrency import run_in_threadpool
 from typing import Literal
-from ReinforcmentLearning import *
+from pydantic import BaseModel
+from Closures import ClosedVertexError, Closures
+from Metrics import RoutingMetrics
+from RouteTables import NoRouteError
+from Routing import Router
+from Venues import VenueRegistry
 
 list_of_interests_available = [
     "Tech", "Food", "Entertainment", "Fashion", "Market", "Automotive",
     "Drink", "Fit", "Games"
 ]
 
-edges_dict = {}
-# save all edges in a dict
-_file = open("arestas.csv", "r", encoding="utf-8-sig")
-for line in _file.readlines():
-    line_split = line.split(",")
-    edges_dict[line_split[0] + "-" + line_split[1]] = float(line_split[2])
-    edges_dict[line_split[1] + "-" + line_split[0]] = float(line_split[2])
-
-vertices_dict = {}
-# save all vertexes in a dict
-_file = open("vertices.csv", "r", encoding="utf-8-sig")
-for line in _file.readlines():
-    line_split = line.split(",")
-    vertices_dict[line_split[0]] = {
-        "name": line_split[1],
-        "category": line_split[2],
-        "pos_x": float(line_split[3]),
-        "pos_y": float(line_split[4])
-    }
 
+Algorithm = Literal["QLearning", "Sarsa", "Astar", "Largura", "Profundidade",
+                    "Dijkstra", "ALT"]
 
-def get_distance(x1, y1, x2, y2):
-    return math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-
-
-# get the path from search algorithms (BFS, DFS, A*) without interests
-def get_path_search(start_id: int, goal_id: int, algorithm: str):
-    # get path from start to goal
-    directory = f"table_q/{algorithm}/table_q_{goal_id}.csv"
-    _file = open(directory, "r", encoding="utf-8-sig")
-    path = []
-    for line in _file.readlines():
-        line_split = line.split(",")
-        if line_split[0] == str(start_id):
-            path = [int(i) for i in line_split]
-            break
-
-    # calculate the total distance
-    total_distance = 0
-    for i in range(len(path) - 1):
-        total_distance += float(edges_dict[str(path[i]) + "-" +
-                                           str(path[i + 1])])
-
-    return path, total_distance
-
-
-# get the path from reinforcement learning algorithms (Q-Learning, SARSA) without interests
-def get_path_rl(start_id: int, goal_id: int, algorithm: str):
-    # get table from start to goal
-    directory = f"table_q/{algorithm}/table_q_{goal_id}.csv"
-    _file = open(directory, "r", encoding="utf-8-sig")
-    table = {}
-    for line in _file.readlines():
-        line_split = line.split(",")
-        table[line_split[0]] = {
-            "next_vertex": int(line_split[1]),
-        }
 
-    # save the path and calculate the total distance
-    current = start_id
-    path = []
-    path.append(current)
-    total_distance = 0
-    while current != goal_id:
-        distance = edges_dict[str(current) + "-" +
-                              str(table[str(current)]["next_vertex"])]
-        current = int(table[str(current)]["next_vertex"])
-        path.append(current)
-        total_distance += distance
-
-    return path, total_distance
-
-
-def get_path_search_interest(start_id: int, goal_id: int, max_interests: int,
-                             interests: list, algorithm: str):
-    # save a dict of vertexes with the same category
-    interest_vertexes_dict = {}
-    for vertex_id in vertices_dict:
-        if int(vertex_id) == start_id or int(vertex_id) == goal_id:
-            continue
-        if vertices_dict[vertex_id]["category"].lower() in [
-                i.lower() for i in interests
-        ]:
-            interest_vertexes_dict[vertex_id] = vertices_dict[vertex_id]
-
-    # set the number of stabilishments of interest to visit
-    n_iterations = max_interests if max_interests < len(
-        interest_vertexes_dict) else len(interest_vertexes_dict)
-
-    # go through the interest vertexes
-    total_distance = 0
-    total_path = []
-    current = start_id
-    while n_iterations > 0 and len(interest_vertexes_dict) > 0:
-        smaller_distance = 99999999
-        shortest_vertex = None
-
-        # find the next shortest interest vertex
-        for vertex_id in interest_vertexes_dict:
-            distance = get_distance(vertices_dict[str(current)]["pos_x"],
-                                    vertices_dict[str(current)]["pos_y"],
-                                    vertices_dict[vertex_id]["pos_x"],
-                                    vertices_dict[vertex_id]["pos_y"])
-            if distance < smaller_distance:
-                smaller_distance = distance
-                shortest_vertex = vertex_id
-
-        # go through the next shortest interest vertex
-        path = []
-        directory = f"table_q/{algorithm}/table_q_{shortest_vertex}.csv"
-        _file = open(directory, "r", encoding="utf-8-sig")
-        for line in _file.readlines():
-            line_split = line.strip().split(",")
-            if line_split[0] == str(current):
-                path = [int(i) for i in line_split]
-                break
-
-        # calculate the total distance
-        for i in range(len(path) - 1):
-            total_distance += float(edges_dict[str(path[i]) + "-" +
-                                               str(path[i + 1])])
-
-        # save path
-        total_path += path
-        total_path.pop(
-        )  # remove the last vertex of the path because it is the same as the first vertex of the next path
-
-        # update the current vertex and the number of iterations
-        current = shortest_vertex
-        n_iterations -= 1
-
-        # remove the vertex from the interest vertexes dict
-        interest_vertexes_dict.pop(shortest_vertex)
-
-    # get the path from the last interest vertex to the goal
-    path, distance = get_path_search(current, goal_id, algorithm)
-
-    # save the path and the total distance
-    total_path += path
-    total_distance += distance
-
-    return total_path, total_distance
-
-
-def get_path_rl_interest(start_id: int, goal_id: int, max_interests: int,
-                         interests: list, algorithm: str):
-    # save a dict of vertexes with the same category
-    interest_vertexes_dict = {}
-    for vertex_id in vertices_dict:
-        if int(vertex_id) == start_id or int(vertex_id) == goal_id:
-            continue
-        if vertices_dict[vertex_id]["category"].lower() in [
-                i.lower() for i in interests
-        ]:
-            interest_vertexes_dict[vertex_id] = vertices_dict[vertex_id]
-
-    # set the number of stabilishments of interest to visit
-    n_iterations = max_interests if max_interests < len(
-        interest_vertexes_dict) else len(interest_vertexes_dict)
-
-    # go through the interest vertexes
-    total_distance = 0
-    total_path = []
-    current = start_id
-    while n_iterations > 0 and len(interest_vertexes_dict) > 0:
-        # get the path from the current vertex to the next shortest interest vertex
-        smaller_distance = 99999999
-        shortest_vertex = None
-
-        # find the next shortest interest vertex
-        for vertex_id in interest_vertexes_dict:
-            distance = get_distance(vertices_dict[str(current)]["pos_x"],
-                                    vertices_dict[str(current)]["pos_y"],
-                                    vertices_dict[vertex_id]["pos_x"],
-                                    vertices_dict[vertex_id]["pos_y"])
-            if distance < smaller_distance:
-                smaller_distance = distance
-                shortest_vertex = vertex_id
-        # get the path from the current vertex to the next shortest interest vertex
-        path, distance = get_path_rl(current, int(shortest_vertex), algorithm)
-
-        # save the path and the total distance
-        total_path += path
-        total_distance += distance
-        total_path.pop(
-        )  # remove the last vertex of the path because it is the same as the first vertex of the next path
-
-        # update the current vertex and the number of iterations
-        current = path[-1]
-        n_iterations -= 1
-
-        # remove the vertex from the interest vertexes dict
-        interest_vertexes_dict.pop(str(current))
-
-    # get the path from the last interest vertex to the goal
-    path, distance = get_path_rl(current, goal_id, algorithm)
-
-    # save the path and the total distance
-    total_path += path
-    total_distance += distance
-
-    return total_path, total_distance
-
-
-# full_run(algorithm=QLearningAgent)
-# full_run(algorithm=SarsaAgent)
-
-app = FastAPI(swagger_ui_parameters={"defaultModelsExpandDepth": -1},
-              debug=True)
-
-
-@app.get("/path/{id_origin}/{id_target}/{algorithm}", tags=["Path"])
-async def get_path_request(
-    id_origin: int,
-    id_target: int,
-    algorithm: Literal["QLearning", "Sarsa", "Astar", "Largura",
-                       "Profundidade"] = "QLearning",
-    max_interests: int = 0,
-    interests: str | None = Query(
-        None,
-        description=
-        "Uma lista de palavras separadas por vírgula. Interesses disponíveis: "
-        + ", ".join(list_of_interests_available))):
-
-    path = []
-    algorithm = algorithm.lower()
-
-    # sanitize the inputs of interests
-    if interests is not None:
-        interests = interests.split(",")
-        interests = [i.lower().strip() for i in interests]
-
-    # check if the algorithm is a search algorithm
-    if algorithm in ["largura", "profundidade", "astar"]:
-        # verify if the user wants to get the path without interests
-        if interests is None:
-            path, total_distance = get_path_search(start_id=id_origin,
-                                                   goal_id=id_target,
-                                                   algorithm=algorithm)
-        # otherwise, get the path with interests
-        else:
-            path, total_distance = get_path_search_interest(
-                start_id=id_origin,
-                goal_id=id_target,
-                max_interests=max_interests,
-                interests=interests,
-                algorithm=algorithm)
-
-    # check if the algorithm is a reinforcement learning algorithm
-    if algorithm in ["qlearning", "sarsa"]:
-        # verify if the user wants to get the path without interests
-        if interests is None:
-            path, total_distance = get_path_rl(start_id=id_origin,
-                                               goal_id=id_target,
-                                               algorithm=algorithm)
-        # otherwise, get the path with interests
-        else:
-            path, total_distance = get_path_rl_interest(
-                start_id=id_origin,
-                goal_id=id_target,
-                max_interests=max_interests,
-                interests=interests,
-                algorithm=algorithm)
-
-    # return a json with the path and the total distance
+# router of the app that is answering the request, set by the lifespan
+def get_router(request: Request) -> Router:
+    return request.app.state.router
+
+
+def get_venues(request: Request) -> VenueRegistry:
+    return request.app.state.venues
+
+
+# router of the venue, loaded in the thread pool when it is not in memory,
+# 404 for unknown venues
+async def get_venue_router(venue: str,
+                           venues: VenueRegistry = Depends(get_venues)):
+    if venues.contains(venue):
+        return venues.get(venue)
+    try:
+        venues.path(venue)
+    except KeyError as error:
+        raise HTTPException(404, f"unknown venue {venue}") from error
+    return await run_in_threadpool(venues.get, venue)
+
+
+class PathQuery(BaseModel):
+    id_origin: int
+    id_target: int
+    algorithm: Algorithm = "QLearning"
+    max_interests: int = 0
+    interests: str | None = None
+    blocked_vertices: str | None = None
+    blocked_edges: str | None = None
+
+
+# either a list of queries or every origin to every target
+class BatchPathRequest(BaseModel):
+    queries: list[PathQuery] = []
+    origins: list[int] = []
+    targets: list[int] = []
+    algorithm: Algorithm = "QLearning"
+    distances_only: bool = False
+
+
+# vertices and edges to close or reopen, edges as [start id, end id]
+class ClosureRequest(BaseModel):
+    vertices: list[int] = []
+    edges: list[tuple[int, int]] = []
+
+
+# live closures of the router and how many updates they had
+def closures_response(router: Router) -> dict:
     return {
-        "path": path,
-        "total_distance": total_distance,
-        "steps": len(path) - 1
+        "version": router.closures.version,
+        **router.closures.snapshot().to_dict()
     }
 
 
-@app.get("/", include_in_schema=False)
-async def root():
-    return RedirectResponse(url="/docs")
-
+# error of a route as written in its batch line
+def describe_error(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"
+
+
+# one json line per route of the batch
+def get_batch_lines(router: Router, request: BatchPathRequest):
+    # the distance matrices do not know about the closures
+    if request.distances_only and request.origins and request.targets and \
+            not router.closures:
+        # unknown vertices are left out of the matrix and, like pairs
+        # without a route, get the error line of the routed queries
+        known = router.route_tables.index_of
+        rows = {i: n for n, i in enumerate(dict.fromkeys(
+            i for i in request.origins if i in known))}
+        columns = {i: n for n, i in enumerate(dict.fromkeys(
+            i for i in request.targets if i in known))}
+        distance = router.route_tables.distances(
+            request.algorithm.lower(), list(rows), list(columns))
+        if distance is not None:
+            for id_origin in request.origins:
+                for id_target in request.targets:
+                    line = {
+                        "id_origin": id_origin,
+                        "id_target": id_target,
+                        "algorithm": request.algorithm
+                    }
+                    if id_origin not in rows:
+                        error = KeyError(id_origin)
+                    elif id_target not in columns:
+                        error = KeyError(id_target)
+                    else:
+                        total = float(distance[rows[id_origin],
+                                               columns[id_target]])
+                        error = None if math.isfinite(total) else \
+                            NoRouteError(
+                                f"no route from {id_origin} to {id_target}")
+                    if error is None:
+                        line["total_distance"] = total
+                    else:
+                        line["error"] = describe_error(error)
+                    yield json.dumps(line) + "\n"
+            return
+
+    queries = list(request.queries)
+    for id_origin in request.origins:
+        for id_target in request.targets:
+            queries.append(
+                PathQuery(id_origin=id_origin,
+                          id_target=id_target,
+                          algorithm=request.algorithm))
+
+    for query in queries:
+        line = {
+            "id_origin": query.id_origin,
+            "id_target": query.id_target,
+            "algorithm": query.algorithm
+        }
+        try:
+            closed = Closures.parse(query.blocked_vertices,
+                                    query.blocked_edges)
+            result = router.get_path(query.id_origin, query.id_target,
+                                     query.algorithm, query.max_interests,
+                                     query.interests, closed)
+            if request.distances_only:
+                result = {"total_distance": result["total_distance"]}
+            line.update(result)
+        except (KeyError, ValueError, FileNotFoundError) as error:
+            line["error"] = describe_error(error)
+        with router.metrics.serialization_seconds.time("paths"):
+            encoded = json.dumps(line) + "\n"
+        yield encoded
+
+
+# encode the response of a route, timed when the metrics are enabled
+def encode_path(router: Router, result: dict):
+    if not router.metrics.enabled:
+        return result
+    with router.metrics.serialization_seconds.time("path"):
+        return JSONResponse(result)
+
+
+# closures of the query string, 422 when they can not be parsed
+def parse_closures(blocked_vertices: str | None,
+                   blocked_edges: str | None) -> Closures:
+    try:
+        return Closures.parse(blocked_vertices, blocked_edges)
+    except ValueError as error:
+        raise HTTPException(422, f"invalid closures: {error}") from error
+
+
+# errors of a route as http errors: 409 when its origin or target is
+# closed, 404 for unknown vertices or edges and when the route table has
+# no route between them
+@contextmanager
+def route_errors():
+    try:
+        yield
+    except ClosedVertexError as error:
+        raise HTTPException(409, str(error.args[0])) from error
+    except NoRouteError as error:
+        raise HTTPException(404, str(error.args[0])) from error
+    except KeyError as error:
+        raise HTTPException(404,
+                            f"not found: {error.args[0]}") from error
+
+
+# plain routes whose table is already in memory are answered on the event
+# loop, anything that may read files, plan a tour or search around closures
+# runs in the thread pool so it never blocks the other requests
+async def answer_path(router: Router, id_origin: int, id_target: int,
+                      algorithm: str, max_interests: int,
+                      interests: str | None, closed: Closures):
+    with route_errors():
+        if interests is None and not closed and not router.closures and \
+                router.route_tables.contains(algorithm.lower(), id_target):
+            result = router.get_path(id_origin, id_target, algorithm)
+        else:
+            result = await run_in_threadpool(router.get_path, id_origin,
+                                             id_target, algorithm,
+                                             max_interests, interests, closed)
+    return encode_path(router, result)
+
+
+interests_query = Query(
+    None,
+    description=
+    "Uma lista de palavras separadas por vírgula. Interesses disponíveis: " +
+    ", ".join(list_of_interests_available))
+blocked_vertices_query = Query(
+    None,
+    description=
+    "Ids de vértices fechados só para esta rota, separados por vírgula")
+blocked_edges_query = Query(
+    None, description="Arestas fechadas só para esta rota, como 1-2,3-4")
+
+
+# print how long every startup step took and what was loaded
+def print_startup_report(report: dict) -> None:
+    print(f"Graph loaded from {report['graph_source']} in "
+          f"{report['graph_ms']:.1f} ms: {report['vertices']} vertices, "
+          f"{report['edges']} edges")
+    print(f"Interest index and route tables ready in "
+          f"{report['index_ms']:.1f} ms, route matrices: " +
+          (", ".join(report["route_matrices"]) or "none"))
+    print(f"Startup took {report['startup_ms']:.1f} ms, "
+          f"max RSS {report['max_rss_mb']:.1f} MB")
+
+
+# build the api, the graph and route tables are only loaded when the app
+# starts (not on import), from graph.npz when it matches the csv files.
+# with metrics the hot paths are timed and exposed on /metrics. the venues
+# of venues_directory are served under /venues/{venue}/, loaded on their
+# first request and dropped when they go over venue_memory_mb, except for
+# resident_venues which are loaded at startup and kept
+def create_app(vertices_path: str = "vertices.csv",
+               edges_path: str = "arestas.csv",
+               snapshot_path: str = "graph.npz",
+               table_directory: str = "table_q",
+               max_tables: int = 4096,
+               max_legs: int = 100000,
+               max_responses: int = 10000,
+               metrics: bool = True,
+               venues_directory: str = "venues",
+               venue_memory_mb: int = 1024,
+               resident_venues: tuple = ()) -> FastAPI:
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        started = time.perf_counter()
+        router = await run_in_threadpool(
+            Router.from_files,
+            vertices_path,
+            edges_path,
+            snapshot_path,
+            table_directory,
+            max_tables=max_tables,
+            max_legs=max_legs,
+            max_responses=max_responses,
+            interests_available=list_of_interests_available,
+            metrics=RoutingMetrics(enabled=metrics))
+        report = router.report
+        report["startup_ms"] = (time.perf_counter() - started) * 1000
+        # ru_maxrss is in kilobytes on linux
+        report["max_rss_mb"] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024
+        print_startup_report(report)
+
+        venues = VenueRegistry(venues_directory,
+                               venue_memory_mb * 1024 * 1024,
+                               resident_venues,
+                               metrics,
+                               max_tables=max_tables,
+                               max_legs=max_legs,
+                               max_responses=max_responses,
+                               interests_available=list_of_interests_available)
+        await run_in_threadpool(venues.preload)
+
+        app.state.router = router
+        app.state.venues = venues
+        app.state.startup_report = report
+        yield
+        app.state.router = None
+        app.state.venues = None
+
+    app = FastAPI(swagger_ui_parameters={"defaultModelsExpandDepth": -1},
+                  debug=True,
+                  lifespan=lifespan)
+
+    @app.get("/path/{id_origin}/{id_target}/{algorithm}", tags=["Path"])
+    async def get_path_request(
+        id_origin: int,
+        id_target: int,
+        algorithm: Algorithm = "QLearning",
+        max_interests: int = 0,
+        interests: str | None = interests_query,
+        blocked_vertices: str | None = blocked_vertices_query,
+        blocked_edges: str | None = blocked_edges_query,
+        router: Router = Depends(get_router)):
+        return await answer_path(
+            router, id_origin, id_target, algorithm, max_interests, interests,
+            parse_closures(blocked_vertices, blocked_edges))
+
+    # many routes in one request, answered as newline delimited json
+    @app.post("/paths", tags=["Path"])
+    async def get_paths_request(request: BatchPathRequest,
+                                router: Router = Depends(get_router)):
+        return StreamingResponse(get_batch_lines(router, request),
+                                 media_type="application/x-ndjson")
+
+    # venues served by this process and the memory of the loaded ones
+    @app.get("/venues", tags=["Venues"])
+    async def get_venues_request(venues: VenueRegistry = Depends(get_venues)):
+        return await run_in_threadpool(venues.status)
+
+    @app.get("/venues/{venue}/path/{id_origin}/{id_target}/{algorithm}",
+             tags=["Venues"])
+    async def get_venue_path_request(
+        id_origin: int,
+        id_target: int,
+        algorithm: Algorithm = "QLearning",
+        max_interests: int = 0,
+        interests: str | None = interests_query,
+        blocked_vertices: str | None = blocked_vertices_query,
+        blocked_edges: str | None = blocked_edges_query,
+        router: Router = Depends(get_venue_router)):
+        return await answer_path(
+            router, id_origin, id_target, algorithm, max_interests, interests,
+            parse_closures(blocked_vertices, blocked_edges))
+
+    @app.post("/venues/{venue}/paths", tags=["Venues"])
+    async def get_venue_paths_request(
+        request: BatchPathRequest, router: Router = Depends(get_venue_router)):
+        return StreamingResponse(get_batch_lines(router, request),
+                                 media_type="application/x-ndjson")
+
+    @app.get("/venues/{venue}/metrics",
+             tags=["Venues"],
+             response_class=PlainTextResponse)
+    async def get_venue_metrics(router: Router = Depends(get_venue_router)):
+        return PlainTextResponse(router.metrics.render(),
+                                 media_type="text/plain; version=0.0.4")
+
+    # drop the cached route tables and routes after the files in table_q/
+    # changed
+    @app.post("/tables/reload", tags=["Tables"])
+    async def reload_tables(preload: bool = False,
+                            router: Router = Depends(get_router)):
+        await run_in_threadpool(router.reload_tables, preload)
+        return {"tables": len(router.route_tables.tables)}
+
+    # closures of every route, a route through them is searched again
+    # around them
+    @app.get("/closures", tags=["Closures"])
+    async def get_closures(router: Router = Depends(get_router)):
+        return closures_response(router)
+
+    @app.post("/closures", tags=["Closures"])
+    async def close(request: ClosureRequest,
+                    router: Router = Depends(get_router)):
+        with route_errors():
+            router.close(request.vertices, request.edges)
+        return closures_response(router)
+
+    @app.post("/closures/reopen", tags=["Closures"])
+    async def reopen(request: ClosureRequest,
+                     router: Router = Depends(get_router)):
+        router.reopen(request.vertices, request.edges)
+        return closures_response(router)
+
+    @app.delete("/closures", tags=["Closures"])
+    async def clear_closures(router: Router = Depends(get_router)):
+        router.closures.clear()
+        return closures_response(router)
+
+    # counters and latency histograms in the prometheus text format
+    @app.get("/metrics", tags=["Metrics"], response_class=PlainTextResponse)
+    async def get_metrics(router: Router = Depends(get_router)):
+        return PlainTextResponse(router.metrics.render(),
+                                 media_type="text/plain; version=0.0.4")
+
+    @app.get("/", include_in_schema=False)
+    async def root():
+        return RedirectResponse(url="/docs")
+
+    def config_openapi():
+        if app.openapi_schema:
+            return app.openapi_schema
+        openapi_schema = get_openapi(
+            title="Api for Bias Pathfinding",
+            version="1.0.0",
+            description=
+            "Essa é uma api para encontrar caminhos com viés em ambientes indoor.",
+            routes=app.routes,
+        )
+
+        app.openapi_schema = openapi_schema
 
-def config_openapi():
-    if app.openapi_schema:
         return app.openapi_schema
-    openapi_schema = get_openapi(
-        title="Api for Bias Pathfinding",
-        version="1.0.0",
-        description=
-        "Essa é uma api para encontrar caminhos com viés em ambientes indoor.",
-        routes=app.routes,
-    )
 
-    app.openapi_schema = openapi_schema
+    app.openapi = config_openapi
 
-    return app.openapi_schema
+    return app
 
 
-app.openapi = config_openapi
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
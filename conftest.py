@@ -0,0 +1 @@
+# makes the modules of the repository importable from tests/
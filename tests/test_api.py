@@ -0,0 +1,91 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from api import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# the api over the map and tables of the repository
+@pytest.fixture(scope="module")
+def client():
+    app = create_app(os.path.join(ROOT, "vertices.csv"),
+                     os.path.join(ROOT, "arestas.csv"),
+                     os.path.join(ROOT, "graph.npz"),
+                     os.path.join(ROOT, "table_q"),
+                     venues_directory=os.path.join(ROOT, "venues"))
+    with TestClient(app) as client:
+        yield client
+
+
+def test_invalid_closures_are_rejected(client):
+    response = client.get("/path/0/51/QLearning?blocked_vertices=abc")
+    assert response.status_code == 422
+
+
+def test_closed_origin_is_a_conflict(client):
+    response = client.get("/path/0/51/QLearning?blocked_vertices=0")
+    assert response.status_code == 409
+
+
+def test_closing_an_unknown_vertex_is_not_found(client):
+    response = client.post("/closures", json={"vertices": [999]})
+    assert response.status_code == 404
+    assert client.get("/closures").json()["vertices"] == []
+
+
+# the shipped sarsa table loops between 5 and 6 on the way to 51
+def test_cyclic_route_table_is_not_found(client):
+    response = client.get("/path/5/51/Sarsa")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "no route from 5 to 51"
+
+
+# the distance matrix answers like the routed queries: one error line for
+# unknown vertices and pairs without a route
+@pytest.mark.parametrize("distances_only", [False, True])
+def test_batch_errors_are_lines(client, distances_only):
+    response = client.post("/paths", json={
+        "origins": [5, 999],
+        "targets": [51, 0],
+        "algorithm": "Sarsa",
+        "distances_only": distances_only
+    })
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line.get("error") for line in lines] == [
+        "NoRouteError: 'no route from 5 to 51'", None, "KeyError: 999",
+        "KeyError: 999"
+    ]
+    assert lines[1]["total_distance"] == 98.0
+
+
+# every algorithm answers the same for unknown vertices and for routes to
+# the start itself
+@pytest.mark.parametrize("algorithm",
+                         ["QLearning", "Largura", "Dijkstra", "ALT"])
+def test_algorithms_answer_alike(client, algorithm):
+    assert client.get(f"/path/999/5/{algorithm}").status_code == 404
+    assert client.get(f"/path/5/5/{algorithm}").json()["path"] == [5]
+
+
+# interest stops that can not reach the goal are not silently dropped
+def test_unreachable_interest_stops_are_not_found(client, monkeypatch):
+    router = client.app.state.router
+    distances = router.route_tables.distances
+
+    def unreachable_goal(algorithm, start_ids, goal_ids):
+        distance = distances(algorithm, start_ids, goal_ids).copy()
+        distance[:-1, -1] = np.inf
+        return distance
+
+    monkeypatch.setattr(router.route_tables, "distances", unreachable_goal)
+    response = client.get("/path/0/51/Dijkstra?max_interests=2"
+                          "&interests=Fashion")
+    assert response.status_code == 404
+    assert response.json()["detail"] == \
+        "no route from 0 to 51 through 2 interest stops"
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+from Checkpoint import TrainingCheckpoints, run_key
+from ReinforcmentLearning import Graph, QLearningAgent, SarsaAgent, train_goal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shipped_graph() -> Graph:
+    g = Graph()
+    g.read_csv(os.path.join(ROOT, "vertices.csv"),
+               os.path.join(ROOT, "arestas.csv"))
+    return g
+
+
+class Interrupted(Exception):
+    pass
+
+
+# checkpoints that stop the training after a few saves, like a run that
+# was killed
+class InterruptedCheckpoints(TrainingCheckpoints):
+
+    def __init__(self, directory: str, key: str, saves: int) -> None:
+        super().__init__(directory, key, interval=0.0)
+        self.saves = saves
+
+    def save(self, goal_id: int, state: dict) -> None:
+        super().save(goal_id, state)
+        self.saves -= 1
+        if self.saves == 0:
+            raise Interrupted
+
+
+# a goal resumed from its checkpoint ends exactly like an uninterrupted run
+@pytest.mark.parametrize("agent", [QLearningAgent, SarsaAgent])
+def test_resumed_goal_equals_an_uninterrupted_run(tmp_path, agent):
+    g = shipped_graph()
+    next_hops = train_goal(g, 30, agent, seed=3)
+    q = g.compiled().q.copy()
+
+    directory = str(tmp_path / "checkpoints")
+    key = run_key(g.compiled().checksum(), agent.__name__, 3)
+    with pytest.raises(Interrupted):
+        train_goal(shipped_graph(), 30, agent, seed=3,
+                   checkpoints=InterruptedCheckpoints(directory, key, 3))
+    checkpoints = TrainingCheckpoints(directory, key, interval=0.0)
+    assert not bool(checkpoints.load(30)["finished"])
+
+    g = shipped_graph()
+    resumed = train_goal(g, 30, agent, seed=3, checkpoints=checkpoints)
+    np.testing.assert_array_equal(resumed, next_hops)
+    np.testing.assert_array_equal(g.compiled().q, q)
+    assert bool(checkpoints.load(30)["finished"])
+
+    # a finished goal is read back instead of trained again
+    g = shipped_graph()
+    np.testing.assert_array_equal(
+        train_goal(g, 30, agent, seed=3, checkpoints=checkpoints), next_hops)
+    np.testing.assert_array_equal(g.compiled().q, q.astype(np.float32))
+
+
+# checkpoints of another run, or files that can not be read, are ignored
+def test_checkpoints_of_other_runs_are_ignored(tmp_path):
+    directory = str(tmp_path)
+    TrainingCheckpoints(directory, "a").save_finished(30, np.zeros(4),
+                                                      np.zeros(4))
+    assert TrainingCheckpoints(directory, "b").load(30) is None
+    assert TrainingCheckpoints(directory, "a").load(30) is not None
+    with open(os.path.join(directory, "goal_31.npz"), "wb") as _file:
+        _file.write(b"not a checkpoint")
+    assert TrainingCheckpoints(directory, "a").load(31) is None
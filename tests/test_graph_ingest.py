@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from GraphIngest import read_graph
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_files(directory, vertices: str, edges: str) -> tuple:
+    vertices_path = directory / "vertices.csv"
+    edges_path = directory / "arestas.csv"
+    vertices_path.write_text(vertices, encoding="utf-8")
+    edges_path.write_text(edges, encoding="utf-8")
+    return str(vertices_path), str(edges_path)
+
+
+def neighbors(graph, vertex_id: int) -> list:
+    lo, hi = graph.edge_range(graph.index_of[vertex_id])
+    return [(int(graph.ids[graph.neighbors[slot]]),
+             float(graph.distances[slot])) for slot in range(lo, hi)]
+
+
+def test_shipped_map():
+    graph = read_graph(os.path.join(ROOT, "vertices.csv"),
+                       os.path.join(ROOT, "arestas.csv"))
+    assert (graph.vertex_count, graph.edge_count) == (61, 152)
+    assert graph.names[0] == "Porta"
+
+
+# quoted names keep their commas, an edge repeated in either direction is
+# kept once with its first distance and a self loop is stored once, also
+# when the rows are split over several chunks
+@pytest.mark.parametrize("chunk_size", [1, 2, 65536])
+def test_edges_are_kept_once(tmp_path, chunk_size):
+    paths = write_files(tmp_path, '1,"Loja, A",Moda,1,2\n\n2,B,#\n3,C,#,0,0\n',
+                        "1,2,5.0\n2,1,7.0\n1,2,9\n2,3,1.5\n3,3,0\n")
+    graph = read_graph(*paths, chunk_size=chunk_size)
+    assert graph.ids.tolist() == [1, 2, 3]
+    assert graph.names == ["Loja, A", "B", "C"]
+    assert graph.pos_x.tolist() == [1.0, 0.0, 0.0]
+    assert neighbors(graph, 1) == [(2, 5.0)]
+    assert neighbors(graph, 2) == [(1, 5.0), (3, 1.5)]
+    assert neighbors(graph, 3) == [(2, 1.5), (3, 0.0)]
+
+
+@pytest.mark.parametrize("vertices, edges, message", [
+    ("1,A,#\n1,B,#\n", "", "vertices.csv: vertex id 1 is repeated"),
+    ("1,A,#\nx,B,#\n", "", "vertices.csv:2: invalid value 'x' in column 1"),
+    ("1,A,#\n2,B,#\n", "1,2,1\n2,4,1\n", "arestas.csv:2: unknown vertex id 4"),
+    ("1,A,#\n2,B,#\n", "1,2,1\n\n1,2,-1\n",
+     "arestas.csv:3: invalid distance -1.0"),
+    ("1,A,#\n2,B,#\n", "1,2,inf\n", "arestas.csv:1: invalid distance inf"),
+    ("1,A,#\n2,B,#\n", "1,2\n", "arestas.csv:1: missing value in column 3"),
+])
+@pytest.mark.parametrize("chunk_size", [1, 65536])
+def test_invalid_files_name_the_line(tmp_path, vertices, edges, message,
+                                     chunk_size):
+    with pytest.raises(ValueError, match=message):
+        read_graph(*write_files(tmp_path, vertices, edges),
+                   chunk_size=chunk_size)
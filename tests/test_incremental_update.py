@@ -0,0 +1,105 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from CompactGraph import CompactGraph
+from IncrementalUpdate import GraphDiff, slot_map, update_tables
+from RouteTables import RouteMatrix
+from SearchTables import SEARCHES, build_next_hops, build_search_tables
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# a copy of the map with the search tables built for it, as the working
+# directory
+@pytest.fixture
+def tables(tmp_path, monkeypatch):
+    for file_name in ("vertices.csv", "arestas.csv"):
+        shutil.copy(os.path.join(ROOT, file_name), tmp_path / file_name)
+    monkeypatch.chdir(tmp_path)
+    build_search_tables()
+    return tmp_path
+
+
+def edit_edges(edit) -> None:
+    with open("arestas.csv", encoding="utf-8-sig") as _file:
+        lines = _file.read().splitlines()
+    edit(lines)
+    with open("arestas.csv", "w", encoding="utf-8") as _file:
+        _file.write("\n".join(lines) + "\n")
+
+
+def scale_edge(lines: list, start: str, end: str, factor: float) -> None:
+    for i, line in enumerate(lines):
+        a, b, distance = line.split(",")
+        if (a, b) == (start, end):
+            lines[i] = f"{a},{b},{float(distance) * factor}"
+
+
+# every table read back equals a table built from scratch
+def assert_rebuilt(names) -> None:
+    graph = CompactGraph.read_csv()
+    for name in names:
+        matrix = RouteMatrix(os.path.join("table_q", f"{name}.bin"))
+        next_hop = build_next_hops(graph, name)
+        distance = np.array([
+            graph.cost_to_go(next_hop[goal], goal)
+            for goal in range(graph.vertex_count)
+        ])
+        assert matrix.checksum == graph.checksum()
+        np.testing.assert_array_equal(matrix.next_hop, next_hop)
+        np.testing.assert_array_equal(matrix.distance, distance)
+
+
+def test_unchanged_files_recompute_nothing(tables):
+    report = update_tables(agents=())
+    assert all(done["goals"] == 0 for done in report.values())
+
+
+# a longer corridor only changes the few goals whose tree uses it
+def test_longer_edge_recomputes_the_affected_goals(tables):
+    edit_edges(lambda lines: scale_edge(lines, "6", "7", 1.1))
+    report = update_tables(agents=(), searches=("dijkstra", "largura"))
+    assert 0 < report["dijkstra"]["goals"] < 61
+    assert report["largura"]["goals"] == 0
+    assert not report["dijkstra"]["full"]
+    assert_rebuilt(["dijkstra", "largura"])
+
+
+# removed, added and longer edges at once, for every search
+def test_updated_tables_equal_a_rebuild(tables):
+
+    def edit(lines):
+        lines.remove("6,44,10.0")
+        scale_edge(lines, "12", "13", 3.0)
+        lines.append("0,60,5.0")
+
+    edit_edges(edit)
+    report = update_tables(agents=())
+    assert not any(done["full"] for done in report.values())
+    assert_rebuilt(SEARCHES)
+
+
+def test_graph_diff_and_slot_map():
+    old = CompactGraph.from_edges([1, 2, 3], [0, 1, 1, 2], [1, 0, 2, 1],
+                                  [1.0, 1.0, 2.0, 2.0])
+    new = CompactGraph.from_edges([1, 2, 3], [0, 1, 0, 2], [1, 0, 2, 0],
+                                  [1.5, 1.5, 4.0, 4.0])
+    diff = GraphDiff(old, new)
+    assert sorted(zip(diff.added_start, diff.added_end)) == [(0, 2), (2, 0)]
+    assert sorted(zip(diff.removed_start,
+                      diff.removed_end)) == [(1, 2), (2, 1)]
+    assert sorted(zip(diff.changed_start, diff.changed_end,
+                      diff.changed_distance)) == [(0, 1, 1.5), (1, 0, 1.5)]
+    assert not diff.empty and GraphDiff(old, old).empty
+
+    slots = slot_map(old, new)
+    sources = new.edge_sources()
+    for slot, old_slot in enumerate(slots.tolist()):
+        if old_slot < 0:
+            assert {int(sources[slot]), int(new.neighbors[slot])} == {0, 2}
+        else:
+            assert old.edge_sources()[old_slot] == sources[slot]
+            assert old.neighbors[old_slot] == new.neighbors[slot]
@@ -0,0 +1,86 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from InterestRouting import (EXACT_LIMIT, cheapest_insertion, exact_tour,
+                             plan_tour, tour_length)
+from RouteTables import NoRouteError
+
+
+# distances between random points, made asymmetric for odd seeds
+def random_distance(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    points = rng.random((int(rng.integers(3, 9)), 2)) * 100
+    distance = np.hypot(*(points[:, None] - points[None]).transpose(2, 0, 1))
+    if seed % 2:
+        distance *= rng.uniform(1.0, 1.5, distance.shape)
+    return distance
+
+
+def brute_force(distance: np.ndarray, count: int) -> float:
+    return min(
+        tour_length(distance, list(tour)) for tour in itertools.permutations(
+            range(1, len(distance) - 1), count))
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_exact_tour_is_the_shortest(seed):
+    distance = random_distance(seed)
+    for count in range(1, len(distance) - 1):
+        tour = plan_tour(distance, count)
+        assert len(tour) == count
+        assert tour_length(distance, tour) == pytest.approx(
+            brute_force(distance, count))
+
+
+# the heuristic keeps count distinct stops and only improves on cheapest
+# insertion
+@pytest.mark.parametrize("seed", range(40))
+def test_heuristic_tour_is_valid(seed):
+    distance = random_distance(seed)
+    count = (len(distance) - 2) // 2 + 1
+    tour = plan_tour(distance, count, exact_limit=0, time_budget=1.0)
+    assert len(set(tour)) == count
+    assert all(0 < stop < len(distance) - 1 for stop in tour)
+    assert tour_length(distance, tour) <= tour_length(
+        distance, cheapest_insertion(distance, count)) + 1e-9
+    assert tour_length(distance, tour) >= brute_force(distance, count) - 1e-9
+
+
+# only the candidates with the smallest detour are kept, and the stops are
+# numbered like the points of the full matrix
+def test_candidates_are_limited_by_detour():
+    distance = np.full((12, 12), 100.0)
+    np.fill_diagonal(distance, 0.0)
+    distance[0, [3, 7]] = distance[[3, 7], 11] = 1.0
+    distance[3, 7] = distance[7, 3] = 1.0
+    tour = plan_tour(distance, 2, candidate_limit=2)
+    assert sorted(tour) == [3, 7]
+
+
+def test_more_stops_than_candidates():
+    distance = random_distance(1)
+    assert len(plan_tour(distance, 99)) == len(distance) - 2
+    assert plan_tour(distance, 0) == []
+    assert exact_tour(distance, len(distance) - 2) != []
+
+
+# a tour whose stops can not reach the goal is never returned
+@pytest.mark.parametrize("exact_limit", [EXACT_LIMIT, 0])
+def test_unreachable_tours_raise(exact_limit):
+    # the goal can only be reached from stops 1 and 2
+    distance = random_distance(2)
+    distance[0, -1] = np.inf
+    distance[3:-1, -1] = np.inf
+    tour = plan_tour(distance, 2, exact_limit=exact_limit)
+    assert tour[-1] in (1, 2)
+    assert np.isfinite(tour_length(distance, tour))
+    assert np.isfinite(
+        tour_length(distance, cheapest_insertion(distance, 2)))
+
+    distance[1:3, -1] = np.inf
+    with pytest.raises(NoRouteError):
+        plan_tour(distance, 2, exact_limit=exact_limit)
+    with pytest.raises(NoRouteError):
+        plan_tour(distance, 1, exact_limit=exact_limit)
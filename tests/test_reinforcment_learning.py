@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+
+from ReinforcmentLearning import (Graph, MultiGoalQLearning, QLearningAgent,
+                                  SarsaAgent, SeededValueIterationAgent,
+                                  ValueIterationAgent,
+                                  VectorizedQLearningAgent, Vertex)
+from SearchTables import bfs_next_hops
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# 0 - 1 - 2 with the goal at 2 and, unless connected, vertex 3 isolated
+def path_graph(isolated: bool = True) -> Graph:
+    g = Graph()
+    for i in range(4 if isolated else 3):
+        g.add_vertex(Vertex(i, str(i), ""))
+    g.add_edge(0, 1, 1.0)
+    g.add_edge(1, 2, 2.0)
+    g.set_start(g.get_vertex_by_id(0))
+    g.set_goal(g.get_vertex_by_id(2))
+    g.define_reward(10, g.goal)
+    return g
+
+
+# walkers never start on the isolated vertex, whose slot -1 would update
+# the last edge of the graph
+def test_vectorized_agent_ignores_isolated_vertices():
+    g = path_graph()
+    VectorizedQLearningAgent(g, walkers=8, seed=0).train()
+    np.testing.assert_allclose(g.compiled().q, [7.0, 4.9, 10.0, 0.0])
+
+
+# the agents step on a list of the q values and write it back to the
+# compact graph when training stops
+def test_agents_leave_their_q_values_in_the_graph():
+    g = path_graph(isolated=False)
+    agent = QLearningAgent(g, seed=0)
+    agent.train()
+    assert agent.q is None
+    np.testing.assert_allclose(g.compiled().q, [7.0, 4.9, 10.0, 0.0])
+
+    g = path_graph(isolated=False)
+    SarsaAgent(g, seed=0).train()
+    q = g.compiled().q
+    assert q[0] > 0 and q[1] > 0
+    assert q[2] == pytest.approx(10.0)
+
+
+# the q rows of every batch go to the file, the next hops of every goal
+# reach it from every vertex
+def test_multi_goal_reaches_every_goal(tmp_path):
+    g = path_graph(isolated=False)
+    engine = MultiGoalQLearning(g, walkers=8, goals_per_batch=2, seed=0)
+    q_path = str(tmp_path / "qlearning.q.npy")
+    engine.train(q_path)
+    csr = g.compiled()
+    assert np.load(q_path).shape == (3, csr.edge_count)
+    for goal in range(3):
+        depth, _ = csr.path_tree(engine.next_hops(goal), goal)
+        assert (depth >= 0).all()
+
+
+# on the shipped map the greedy policy of value iteration reaches every
+# goal from every vertex in the fewest hops, seeded or not
+@pytest.mark.parametrize("agent",
+                         [ValueIterationAgent, SeededValueIterationAgent])
+def test_value_iteration_reaches_every_goal(agent):
+    g = Graph()
+    g.read_csv(os.path.join(ROOT, "vertices.csv"),
+               os.path.join(ROOT, "arestas.csv"))
+    csr = g.compiled()
+    for goal in range(csr.vertex_count):
+        g.reset_training()
+        g.set_goal(g.vertices[goal])
+        g.define_reward(10, g.goal)
+        agent(g).train()
+        depth, _ = csr.path_tree(csr.greedy_next_hops(), goal)
+        fewest, _ = csr.path_tree(bfs_next_hops(csr, goal), goal)
+        np.testing.assert_array_equal(depth, fewest)
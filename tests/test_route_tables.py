@@ -0,0 +1,156 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from CompactGraph import CompactGraph
+from RouteTables import (NoRouteError, RouteMatrix, RouteTable,
+                         RouteTableCache, write_route_matrix)
+
+
+# path 0 - 1 - 2 - 3, distances 1, 2 and 3
+def path_graph() -> CompactGraph:
+    return CompactGraph.from_edges([10, 11, 12, 13], [0, 1, 1, 2, 2, 3],
+                                   [1, 0, 2, 1, 3, 2],
+                                   [1.0, 1.0, 2.0, 2.0, 3.0, 3.0])
+
+
+def test_compiled_table_follows_the_tree():
+    graph = path_graph()
+    table = RouteTable(13, graph.index_of, graph.ids,
+                       np.array([1, 2, 3, -1], dtype=np.int32)).compile(graph)
+    assert table.depth.tolist() == [3, 2, 1, 0]
+    assert table.route(10) == ([10, 11, 12, 13], 6.0)
+    assert table.route(13) == ([13], 0.0)
+
+
+# a 2-cycle, a self loop and a missing row never reach the goal
+def test_compiled_table_rejects_cycles():
+    graph = path_graph()
+    next_hop = np.array([1, 0, 2, -1], dtype=np.int32)
+    table = RouteTable(13, graph.index_of, graph.ids, next_hop).compile(graph)
+    assert table.unreachable() == 3
+    for start_id in (10, 11, 12):
+        with pytest.raises(NoRouteError):
+            table.route(start_id)
+
+
+# a load that started before reload is neither shared with later requests
+# nor cached
+def test_reload_drops_loads_in_flight(monkeypatch):
+    graph = path_graph()
+    cache = RouteTableCache(graph.ids, directory="missing", graph=graph)
+    started, release = threading.Event(), threading.Event()
+    versions = iter(["old", "new"])
+
+    def load(algorithm, goal_id):
+        version = next(versions)
+        if version == "old":
+            started.set()
+            release.wait()
+        table = RouteTable(goal_id, graph.index_of, graph.ids,
+                           np.array([1, 2, 3, -1], dtype=np.int32))
+        table.version = version
+        return table
+
+    monkeypatch.setattr(cache, "load", load)
+    with ThreadPoolExecutor(2) as pool:
+        old = pool.submit(cache.get, "qlearning", 13)
+        started.wait()
+        cache.reload()
+        try:
+            new = pool.submit(cache.get, "qlearning", 13).result(timeout=5)
+        finally:
+            release.set()
+        assert new.version == "new"
+        assert old.result().version == "old"
+    assert cache.get("qlearning", 13).version == "new"
+
+
+# stored paths of a search table, an empty slice when it has no route
+def test_stored_path_errors_like_the_routes():
+    graph = path_graph()
+    path_offsets = np.array([0, 0, 3, 5, 5], dtype=np.int64)
+    path_nodes = np.array([1, 2, 3, 2, 3], dtype=np.int32)
+    table = RouteTable(13, graph.index_of, graph.ids,
+                       np.array([-1, 2, 3, -1], dtype=np.int32),
+                       path_offsets=path_offsets, path_nodes=path_nodes)
+    assert table.stored_path(11) == [11, 12, 13]
+    assert table.stored_path(13) == [13]
+    with pytest.raises(NoRouteError):
+        table.stored_path(10)
+    with pytest.raises(KeyError):
+        table.stored_path(99)
+
+
+# every section of a route matrix file reads back as it was written
+def test_route_matrix_round_trip(tmp_path):
+    graph = path_graph()
+    path = str(tmp_path / "tables" / "astar.bin")
+    next_hop = np.array([[-1, 0, 1, 2], [1, -1, 1, 2], [1, 2, -1, 2],
+                         [1, 2, 3, -1]],
+                        dtype=np.int32)
+    distance = np.arange(16, dtype=np.float64).reshape(4, 4)
+    distance[0, 3] = np.inf
+    path_offsets = np.zeros((4, 5), dtype=np.int64)
+    path_offsets[3] = [0, 4, 7, 9, 9]
+    path_nodes = np.array([0, 1, 2, 3, 1, 2, 3, 2, 3], dtype=np.int32)
+    write_route_matrix(path, graph.ids, next_hop, distance, path_offsets,
+                       path_nodes, checksum=2**63 + 5)
+
+    matrix = RouteMatrix(path)
+    assert matrix.node_count == 4 and matrix.checksum == 2**63 + 5
+    np.testing.assert_array_equal(matrix.ids, graph.ids)
+    np.testing.assert_array_equal(matrix.next_hop, next_hop)
+    np.testing.assert_array_equal(matrix.distance, distance)
+    np.testing.assert_array_equal(matrix.path_offsets, path_offsets)
+    np.testing.assert_array_equal(matrix.path_nodes, path_nodes)
+    for name in ("ids", "next_hop", "distance", "path_offsets",
+                 "path_nodes"):
+        assert getattr(matrix, name).offset % 8 == 0
+    assert not os.path.exists(path + ".tmp")
+
+    table = matrix.table(13)
+    assert table.stored_path(11) == [11, 12, 13]
+    assert table.distance.tolist() == [12.0, 13.0, 14.0, 15.0]
+    assert matrix.table(10).distance[3] == np.inf
+    with pytest.raises(KeyError):
+        matrix.table(99)
+
+
+# only the next hops, and stored paths without any node
+def test_route_matrix_optional_sections(tmp_path):
+    graph = path_graph()
+    next_hop = np.array([[-1, 0, 1, 2]] * 4, dtype=np.int32)
+    path = str(tmp_path / "qlearning.bin")
+    write_route_matrix(path, graph.ids, next_hop)
+    matrix = RouteMatrix(path)
+    assert matrix.distance is None and matrix.path_offsets is None
+    assert matrix.table(10).get_next(13) == 12
+
+    path = str(tmp_path / "largura.bin")
+    write_route_matrix(path, graph.ids, next_hop,
+                       path_offsets=np.zeros((4, 5), dtype=np.int64),
+                       path_nodes=np.zeros(0, dtype=np.int32))
+    matrix = RouteMatrix(path)
+    assert matrix.path_nodes.shape == (0, )
+    with pytest.raises(NoRouteError):
+        matrix.table(10).stored_path(13)
+
+
+def test_route_matrix_rejects_other_files(tmp_path):
+    graph = path_graph()
+    path = str(tmp_path / "qlearning.bin")
+    write_route_matrix(path, graph.ids, np.full((4, 4), -1, dtype=np.int32))
+    with open(path, "r+b") as _file:
+        _file.write(b"XTAB")
+    with pytest.raises(ValueError):
+        RouteMatrix(path)
+
+    write_route_matrix(path, graph.ids, np.full((4, 4), -1, dtype=np.int32))
+    with open(path, "r+b") as _file:
+        _file.truncate(40)
+    with pytest.raises(ValueError):
+        RouteMatrix(path)
@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import create_app
+from Venues import VenueRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# venues/<name>/ with a copy of the map and tables of the repository
+def make_venues(directory, *names) -> str:
+    for name in names:
+        venue = directory / name
+        venue.mkdir()
+        for file_name in ("vertices.csv", "arestas.csv"):
+            shutil.copy(os.path.join(ROOT, file_name), venue / file_name)
+        shutil.copytree(os.path.join(ROOT, "table_q"), venue / "table_q")
+    return str(directory)
+
+
+def test_unknown_venue_is_not_found(tmp_path):
+    app = create_app(os.path.join(ROOT, "vertices.csv"),
+                     os.path.join(ROOT, "arestas.csv"),
+                     os.path.join(ROOT, "graph.npz"),
+                     os.path.join(ROOT, "table_q"),
+                     venues_directory=make_venues(tmp_path, "mall"))
+    with TestClient(app) as client:
+        assert client.get("/venues/mall/path/1/50/QLearning").json()[
+            "path"] == [1, 49, 50]
+        response = client.get("/venues/foo/path/0/51/QLearning")
+        assert response.status_code == 404
+
+
+# cached route tables count towards the budget, not only venue loads
+def test_table_cache_growth_is_trimmed(tmp_path):
+    venues = VenueRegistry(make_venues(tmp_path, "mall"),
+                           resident=("mall", ))
+    router = venues.get("mall")
+    venues.memory_budget = router.nbytes + 2000
+    for goal_id in router.graph.ids.tolist():
+        router.get_path(1, goal_id, "qlearning")
+        assert router.nbytes <= venues.memory_budget
+    assert venues.status()["table_evictions"] > 0
+    assert venues.contains("mall")
+
+
+def test_venue_names_can_not_leave_the_directory(tmp_path):
+    venues = VenueRegistry(make_venues(tmp_path, "mall"))
+    with pytest.raises(KeyError):
+        venues.path("..")
+
+
+# loading a venue does not build its landmark index, the first ALT route
+# builds it and writes table_q/alt.npz
+def test_landmarks_are_built_on_first_use(tmp_path):
+    venues = VenueRegistry(make_venues(tmp_path, "mall"))
+    alt_path = tmp_path / "mall" / "table_q" / "alt.npz"
+    alt_path.unlink()
+    router = venues.get("mall")
+    assert router.landmarks is None and not alt_path.exists()
+    assert router.get_path(1, 50, "alt")["path"] == [1, 49, 50]
+    assert router.landmarks is not None and alt_path.exists()